@@ -1,19 +1,31 @@
-from flask import Flask, request, send_file, jsonify
-from lezgian_tts import LezgianTTS, AudioManager, TaskManager, DatabaseManager
+from flask import Flask, Response, request, send_file, jsonify, stream_with_context
+from lezgian_tts import LezgianTTS, AudioManager, TaskManager, DatabaseManager, SynthesisCache, InferenceBatcher, TaskResultStore
+from lezgian_tts.admission import AdmissionController, AdmissionError
+from lezgian_tts.audio_access import AccessCache, AudioURLSigner
+from lezgian_tts.audio_gc import AudioGarbageCollector
+from lezgian_tts.autotune import apply_config, tuned_config
+from lezgian_tts.batch_jobs import BatchJobManager
+from lezgian_tts.sentence_cache import SentenceAudioCache
+from lezgian_tts.scheduler import INTERACTIVE
+from lezgian_tts.status_journal import StatusJournal
+from lezgian_tts.history import build_history_query, format_history, page_params
+from lezgian_tts.inference_server import InferenceClient
+from lezgian_tts.metrics import MetricsRegistry
+from lezgian_tts.profiler import RequestProfiler
+from lezgian_tts.streaming import iter_pcm_stream, iter_wav_stream
+from lezgian_tts.transcode_cache import MIMETYPES, TranscodeCache
 import os
-import tempfile
 import logging
 from flask_cors import CORS
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
-import threading
+import json
+import time
 import uuid
+from functools import wraps
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import psycopg2
 from werkzeug.security import generate_password_hash, check_password_hash
 from pathlib import Path
-from pydub import AudioSegment
-import io
+from threading import BoundedSemaphore
 
 def setup_logger():
     logger = logging.getLogger('LezgianTTSApp')
@@ -34,7 +46,8 @@ logger = setup_logger()
 
 app = Flask(__name__, static_folder='ui', static_url_path='')
 CORS(app)
-app.secret_key = os.urandom(24)
+# Общий ключ нужен, чтобы сессию понимали все воркеры и ASGI-режим (asgi.py)
+app.secret_key = os.getenv("SECRET_KEY") or os.urandom(24)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -50,39 +63,310 @@ db_config = {
 AUDIO_HISTORY_DIR = Path(__file__).parent / 'audio_history'
 AUDIO_HISTORY_DIR.mkdir(exist_ok=True)
 
-tts = LezgianTTS(logger=logger)
-audio_manager = AudioManager(AUDIO_HISTORY_DIR)
-db_manager = DatabaseManager(db_config)
-task_manager = TaskManager(tts, audio_manager, db_manager)
-
-executor = ThreadPoolExecutor(max_workers=4)
-
-task_results = {}
-task_lock = threading.Lock()
+SYNTHESIS_CACHE_ITEMS = int(os.getenv("SYNTHESIS_CACHE_ITEMS", "256"))
+SYNTHESIS_CACHE_MB = int(os.getenv("SYNTHESIS_CACHE_MB", "64"))
+# Объём записей дискового кэша, не связанных с файлами истории (0 - только общий AUDIO_STORAGE_MAX_GB)
+SYNTHESIS_CACHE_DISK_MB = int(os.getenv("SYNTHESIS_CACHE_DISK_MB", "1024"))
+# Кэш аудио отдельных предложений (опционально, например 128); 0 - синтезировать текст целиком
+SENTENCE_CACHE_MB = int(os.getenv("SENTENCE_CACHE_MB", "0"))
+SENTENCE_CROSSFADE_MS = float(os.getenv("SENTENCE_CROSSFADE_MS", "10"))
+SENTENCE_SILENCE_MS = float(os.getenv("SENTENCE_SILENCE_MS", "120"))
+# Профилирование задач: доля случайно профилируемых задач; по запросу - заголовок X-Profile: 1 от администратора.
+# Пока профилируется задача, tracemalloc замедляет аллокации во всём процессе (см. RequestProfiler),
+# поэтому в продакшене доля - не больше 0.01
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TORCH = os.getenv("PROFILE_TORCH", "0") == "1"
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "4"))
+TASK_INTERACTIVE_MAX_CHARS = int(os.getenv("TASK_INTERACTIVE_MAX_CHARS", "300"))
+TASK_STARVATION_SECONDS = float(os.getenv("TASK_STARVATION_SECONDS", "30"))
+TTS_BATCH_SIZE = int(os.getenv("TTS_BATCH_SIZE", "1"))
+TTS_BATCH_WAIT_MS = float(os.getenv("TTS_BATCH_WAIT_MS", "20"))
+TRANSCODE_CACHE_MB = int(os.getenv("TRANSCODE_CACHE_MB", "512"))
+# Форматы, которые готовятся сразу после синтеза, например "mp3,ogg"; по умолчанию - по запросу
+TRANSCODE_EAGER_FORMATS = [f for f in os.getenv("TRANSCODE_EAGER_FORMATS", "").split(",") if f]
+AUDIO_CACHE_MAX_AGE = int(os.getenv("AUDIO_CACHE_MAX_AGE", "86400"))
+AUDIO_SHARD_DEPTH = int(os.getenv("AUDIO_SHARD_DEPTH", "2"))
+AUDIO_RETENTION_DAYS = float(os.getenv("AUDIO_RETENTION_DAYS", "0"))
+AUDIO_STORAGE_MAX_GB = float(os.getenv("AUDIO_STORAGE_MAX_GB", "0"))
+AUDIO_COMPRESS_AFTER_HOURS = float(os.getenv("AUDIO_COMPRESS_AFTER_HOURS", "0"))
+AUDIO_GC_INTERVAL_SECONDS = float(os.getenv("AUDIO_GC_INTERVAL_SECONDS", "3600"))
+AUDIO_URL_TTL_SECONDS = int(os.getenv("AUDIO_URL_TTL_SECONDS", "3600"))
+AUDIO_ACL_CACHE_SECONDS = float(os.getenv("AUDIO_ACL_CACHE_SECONDS", "60"))
+# production - без SECRET_KEY/AUDIO_URL_SECRET приложение не запускается
+APP_ENV = os.getenv("APP_ENV", "development")
+# Без AUDIO_URL_SECRET ссылки подписываются ключом сессий SECRET_KEY. Случайный ключ процесса
+# годится только для разработки: ссылки, выданные одним воркером, не открывались бы в другом
+# и после перезапуска
+AUDIO_URL_SECRET = os.getenv("AUDIO_URL_SECRET") or os.getenv("SECRET_KEY")
+if not AUDIO_URL_SECRET:
+    if APP_ENV == "production":
+        raise RuntimeError("AUDIO_URL_SECRET or SECRET_KEY must be set to sign audio URLs")
+    logger.warning("SECRET_KEY is not set: sessions and audio links use a random per-process key "
+                   "and break across workers and restarts. Set SECRET_KEY (see .env.example)")
+    AUDIO_URL_SECRET = app.secret_key
+AUDIO_BASE_URL = os.getenv("AUDIO_BASE_URL", "http://127.0.0.1:1010/api/audio")
+# Интервал сброса журнала статусов задач; 0 - писать каждый переход в БД сразу
+STATUS_FLUSH_INTERVAL_MS = float(os.getenv("STATUS_FLUSH_INTERVAL_MS", "200"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_UNIT_CHARS = int(os.getenv("BATCH_UNIT_CHARS", "300"))
+BATCH_JOB_TTL_SECONDS = float(os.getenv("BATCH_JOB_TTL_SECONDS", "3600"))
+RESULT_STORE_MB = int(os.getenv("RESULT_STORE_MB", "256"))
+RESULT_TTL_SECONDS = float(os.getenv("RESULT_TTL_SECONDS", "600"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "60"))
+ADMISSION_MAX_USER_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_USER_IN_FLIGHT", "3"))
+ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "1"))
+ADMISSION_USER_BURST = int(os.getenv("ADMISSION_USER_BURST", "5"))
+# Квота полосы bulk (длинные тексты и фрагменты пакетных заданий) и число активных заданий пользователя
+ADMISSION_MAX_BULK_QUEUE = int(os.getenv("ADMISSION_MAX_BULK_QUEUE", "2000"))
+ADMISSION_MAX_USER_JOBS = int(os.getenv("ADMISSION_MAX_USER_JOBS", "2"))
+MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "5000"))
+TASK_WAIT_MAX_SECONDS = float(os.getenv("TASK_WAIT_MAX_SECONDS", "60"))
+TASK_EVENTS_MAX_SECONDS = float(os.getenv("TASK_EVENTS_MAX_SECONDS", "300"))
+# Сколько потоков gunicorn (--threads 16) могут одновременно ждать в /wait и /events; остальные
+# получают 503 и опрашивают /api/task/<id>. В ASGI-режиме (asgi.py) ожидание не занимает потоков
+TASK_MAX_WAITERS = int(os.getenv("TASK_MAX_WAITERS", "8"))
+TASK_EVENTS_HEARTBEAT_SECONDS = 15
+TTS_BACKEND = os.getenv("TTS_BACKEND", "eager")
+TTS_INFERENCE_SOCKET = os.getenv("TTS_INFERENCE_SOCKET")
+TTS_INFERENCE_AUTHKEY = os.getenv("TTS_INFERENCE_AUTHKEY")
+# Подбор воркеров и потоков torch: off, load - взять сохранённую калибровку, startup - откалибровать, если её нет.
+# Калибровка замеряет по одному вызову synthesize на воркер и не применяется с InferenceBatcher или кэшем
+# предложений: там модель вызывается пакетами, а число воркеров определяет размер пакета
+TTS_AUTOTUNE = os.getenv("TTS_AUTOTUNE", "off")
+
+if TTS_INFERENCE_SOCKET:
+    # Модель живёт в отдельном сервере инференса (python -m lezgian_tts.inference_server)
+    tts = InferenceClient(
+        TTS_INFERENCE_SOCKET,
+        authkey=TTS_INFERENCE_AUTHKEY.encode() if TTS_INFERENCE_AUTHKEY else None,
+        logger=logger
+    )
+else:
+    if TTS_AUTOTUNE != "off" and (TTS_BATCH_SIZE > 1 or SENTENCE_CACHE_MB > 0):
+        logger.warning("TTS_AUTOTUNE ignored: calibration does not model batched inference "
+                       "(TTS_BATCH_SIZE > 1 or SENTENCE_CACHE_MB > 0)")
+    elif TTS_AUTOTUNE != "off":
+        tuned = tuned_config("model", TTS_BACKEND, run_if_missing=TTS_AUTOTUNE == "startup", logger=logger)
+        if tuned is not None:
+            # Потоки torch задаются до загрузки модели; число воркеров заменяет TASK_WORKERS
+            apply_config(tuned, logger)
+            TASK_WORKERS = tuned["workers"]
+        else:
+            logger.warning("No thread calibration for this machine, run python -m lezgian_tts.autotune")
+    tts = LezgianTTS(logger=logger, backend=TTS_BACKEND)
+audio_manager = AudioManager(AUDIO_HISTORY_DIR, shard_depth=AUDIO_SHARD_DEPTH)
+db_manager = DatabaseManager(
+    db_config,
+    min_size=DB_POOL_MIN,
+    max_size=DB_POOL_MAX,
+    timeout=DB_POOL_TIMEOUT
+)
+synthesis_cache = SynthesisCache(
+    AUDIO_HISTORY_DIR / 'cache',
+    max_memory_items=SYNTHESIS_CACHE_ITEMS,
+    max_memory_bytes=SYNTHESIS_CACHE_MB * 1024 * 1024,
+    logger=logger
+)
+profiler = RequestProfiler(
+    AUDIO_HISTORY_DIR / 'profiles',
+    sample_rate=PROFILE_SAMPLE_RATE,
+    use_torch=PROFILE_TORCH,
+    max_profiles=PROFILE_MAX_FILES,
+    logger=logger
+)
+tts.stage_observers.append(profiler.record_stage)
+sentence_cache = None
+if SENTENCE_CACHE_MB > 0:
+    sentence_cache = SentenceAudioCache(
+        max_items=65536,
+        max_bytes=SENTENCE_CACHE_MB * 1024 * 1024,
+        crossfade_ms=SENTENCE_CROSSFADE_MS,
+        silence_ms=SENTENCE_SILENCE_MS,
+        logger=logger
+    )
+transcode_cache = TranscodeCache(
+    AUDIO_HISTORY_DIR / 'transcoded',
+    max_bytes=TRANSCODE_CACHE_MB * 1024 * 1024,
+    logger=logger
+)
+# Сирот чистит всегда; срок хранения, бюджет объёма и сжатие включаются переменными окружения
+audio_gc = AudioGarbageCollector(
+    audio_manager, db_manager,
+    retention_days=AUDIO_RETENTION_DAYS or None,
+    max_bytes=int(AUDIO_STORAGE_MAX_GB * 1024 ** 3) or None,
+    compress_after_hours=AUDIO_COMPRESS_AFTER_HOURS or None,
+    interval=AUDIO_GC_INTERVAL_SECONDS,
+    transcode_cache=transcode_cache,
+    cache_dir=synthesis_cache.cache_dir,
+    cache_max_bytes=SYNTHESIS_CACHE_DISK_MB * 1024 * 1024 or None,
+    logger=logger
+)
+audio_gc.start()
+audio_url_signer = AudioURLSigner(
+    AUDIO_URL_SECRET.encode() if isinstance(AUDIO_URL_SECRET, str) else AUDIO_URL_SECRET,
+    ttl=AUDIO_URL_TTL_SECONDS
+)
+audio_access_cache = AccessCache(ttl=AUDIO_ACL_CACHE_SECONDS)
+batcher = None
+if TTS_BATCH_SIZE > 1:
+    batcher = InferenceBatcher(tts, max_batch_size=TTS_BATCH_SIZE, max_wait_ms=TTS_BATCH_WAIT_MS, logger=logger)
+admission = AdmissionController(
+    max_queue_depth=ADMISSION_MAX_QUEUE,
+    max_estimated_wait=ADMISSION_MAX_WAIT_SECONDS,
+    max_user_in_flight=ADMISSION_MAX_USER_IN_FLIGHT,
+    user_rate=ADMISSION_USER_RATE,
+    user_burst=ADMISSION_USER_BURST,
+    max_text_length=MAX_TEXT_LENGTH,
+    max_bulk_queue=ADMISSION_MAX_BULK_QUEUE,
+    max_user_jobs=ADMISSION_MAX_USER_JOBS
+)
+status_journal = None
+if STATUS_FLUSH_INTERVAL_MS > 0:
+    status_journal = StatusJournal(db_manager, flush_interval=STATUS_FLUSH_INTERVAL_MS / 1000.0, logger=logger)
+task_manager = TaskManager(
+    tts, audio_manager, db_manager,
+    admission=admission,
+    journal=status_journal,
+    cache=synthesis_cache,
+    batcher=batcher,
+    sentence_cache=sentence_cache,
+    profiler=profiler,
+    max_workers=TASK_WORKERS,
+    interactive_max_chars=TASK_INTERACTIVE_MAX_CHARS,
+    starvation_seconds=TASK_STARVATION_SECONDS,
+    result_store=TaskResultStore(max_bytes=RESULT_STORE_MB * 1024 * 1024, ttl=RESULT_TTL_SECONDS),
+    logger=logger
+)
+batch_jobs = BatchJobManager(
+    task_manager, tts, audio_manager,
+    max_items=BATCH_MAX_ITEMS,
+    unit_chars=BATCH_UNIT_CHARS,
+    ttl=BATCH_JOB_TTL_SECONDS,
+    logger=logger
+)
+task_waiters = BoundedSemaphore(TASK_MAX_WAITERS)
+
+if TRANSCODE_EAGER_FORMATS:
+    def _warm_transcodes(task_id, result):
+        if result['status'] == 'success':
+            transcode_cache.warm(audio_manager.get_audio_path(result['audio_path']), TRANSCODE_EAGER_FORMATS)
+    task_manager.completion_observers.append(_warm_transcodes)
+
+metrics = MetricsRegistry(prefix='tts_')
+stage_seconds = metrics.histogram('stage_seconds', 'Duration of synthesis pipeline stages', ['stage'])
+http_requests = metrics.counter('http_requests_total', 'HTTP responses by endpoint and status', ['endpoint', 'status'])
+tts.stage_observers.append(lambda stage, seconds: stage_seconds.observe(seconds, [stage]))
+task_manager.stage_observers.append(lambda stage, seconds: stage_seconds.observe(seconds, [stage]))
+task_manager.stage_observers.append(profiler.record_stage)
+metrics.callback('task_queue_depth', 'Tasks waiting for a worker', lambda: task_manager.queue_depth)
+metrics.callback(
+    'scheduler_queue_depth', 'Tasks waiting in each scheduler lane',
+    lambda: {(name,): lane.size for name, lane in task_manager.scheduler.lanes.items()},
+    ['lane']
+)
+metrics.callback('scheduler_promoted_total', 'Tasks dispatched out of order after waiting too long',
+                 lambda: task_manager.scheduler.promoted, kind='counter')
+metrics.callback('task_in_flight', 'Tasks being synthesized', lambda: task_manager.in_flight)
+metrics.callback(
+    'tasks_total', 'Finished tasks by status',
+    lambda: {(status,): count for status, count in task_manager.tasks_total.items()},
+    ['status'], kind='counter'
+)
+metrics.callback('audio_seconds_total', 'Seconds of audio produced by the model',
+                 lambda: task_manager.audio_seconds_total, kind='counter')
+metrics.callback('cache_hits_total', 'Synthesis cache hits', lambda: synthesis_cache.hits, kind='counter')
+metrics.callback('cache_misses_total', 'Synthesis cache misses', lambda: synthesis_cache.misses, kind='counter')
+metrics.callback('cache_memory_bytes', 'Synthesis cache in-memory tier size', lambda: synthesis_cache.memory.size_bytes)
+metrics.callback('result_store_bytes', 'Task result store size', lambda: task_manager.task_results.size_bytes)
+metrics.callback('result_store_items', 'Task result store entries', lambda: len(task_manager.task_results))
+metrics.callback(
+    'db_pool_connections', 'Database pool connections by state',
+    lambda: {(state,): value for state, value in db_manager.stats().items() if state in ('in_use', 'idle')},
+    ['state']
+)
+metrics.callback('db_pool_waiting', 'Threads waiting for a database connection', lambda: db_manager.stats()['waiting'])
+metrics.callback('db_pool_max', 'Database pool size limit', lambda: db_manager.max_size)
+metrics.callback(
+    'admission_rejections_total', 'Tasks rejected by admission control',
+    lambda: {(reason,): count for reason, count in admission.rejections.items()},
+    ['reason'], kind='counter'
+)
+metrics.callback('admission_estimated_wait_seconds', 'Estimated queue wait for a new task',
+                 lambda: admission.estimated_wait(task_manager.queue_depth))
+metrics.callback(
+    'transcode_cache_requests_total', 'Transcode cache lookups',
+    lambda: {('hit',): transcode_cache.hits, ('miss',): transcode_cache.misses},
+    ['result'], kind='counter'
+)
+metrics.callback('transcode_cache_bytes', 'Transcode cache size on disk', lambda: transcode_cache.size_bytes)
+metrics.callback('audio_storage_bytes', 'Audio history size after the last GC pass',
+                 lambda: audio_gc.last_run.get('bytes', 0))
+metrics.callback(
+    'audio_gc_last_run_files', 'Files handled by the last audio GC pass',
+    lambda: {(action,): count for action, count in audio_gc.last_run.items() if action != 'bytes'},
+    ['action']
+)
+if status_journal is not None:
+    metrics.callback('status_journal_pending', 'Task status transitions waiting to be flushed', status_journal.pending)
+    metrics.callback('status_journal_flushes_total', 'Status journal flush transactions',
+                     lambda: status_journal.flushes, kind='counter')
+    metrics.callback('status_journal_flush_errors_total', 'Failed status journal flushes',
+                     lambda: status_journal.flush_errors, kind='counter')
+    metrics.callback('status_journal_dropped_rows_total', 'Task transitions rejected by the database and dropped',
+                     lambda: status_journal.dropped_rows, kind='counter')
+metrics.callback('profiles_total', 'Synthesis tasks profiled', lambda: profiler.profiles_total, kind='counter')
+metrics.callback('batch_jobs_active', 'Batch jobs with unfinished items', batch_jobs.active_jobs)
+if sentence_cache is not None:
+    metrics.callback('sentence_cache_hits_total', 'Sentences reused from the sentence cache',
+                     lambda: sentence_cache.hits, kind='counter')
+    metrics.callback('sentence_cache_misses_total', 'Sentences synthesized by the model',
+                     lambda: sentence_cache.misses, kind='counter')
+    metrics.callback('sentence_cache_bytes', 'Sentence cache size', lambda: sentence_cache.size_bytes)
+if batcher is not None:
+    metrics.callback('batcher_queue_depth', 'Texts waiting for a batch', batcher.qsize)
 
 class User(UserMixin):
-    def __init__(self, id, username):
+    def __init__(self, id, username, is_superuser=False):
         self.id = id
         self.username = username
+        self.is_superuser = is_superuser
 
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        conn = psycopg2.connect(**db_config)
-        cur = conn.cursor()
-        cur.execute("SELECT id, username FROM \"User\" WHERE id = %s", (user_id,))
-        user_data = cur.fetchone()
-        if user_data:
-            return User(user_data[0], user_data[1])
+        result = db_manager.execute_query(
+            "SELECT id, username, is_superuser FROM \"User\" WHERE id = %s", (user_id,)
+        )
+        if result:
+            return User(result[0][0], result[0][1], bool(result[0][2]))
     except Exception as e:
         logger.error(f"Error loading user: {str(e)}")
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
     return None
 
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not current_user.is_superuser:
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def profile_requested():
+    """Профилирование по запросу доступно только администраторам"""
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    return flag == '1' and current_user.is_authenticated and current_user.is_superuser
+
+def sync_status_journal():
+    """Сбрасывает журнал статусов перед чтением задач из БД, чтобы видеть свежие записи"""
+    if status_journal is not None and status_journal.pending():
+        status_journal.flush()
+
 @app.route('/api/register', methods=['POST'])
 def register():
     try:
@@ -99,31 +383,24 @@ def register():
         if not any(char.isdigit() for char in password):
              return jsonify({'error': 'Пароль должен содержать хотя бы одну цифру'}), 400
 
-        conn = psycopg2.connect(**db_config)
-        cur = conn.cursor()
-        
-        cur.execute("SELECT id FROM \"User\" WHERE username = %s", (username,))
-        if cur.fetchone():
-            return jsonify({'error': 'Пользователь с таким именем уже существует'}), 400
-        
-        hashed_password = generate_password_hash(password)
-        cur.execute(
-            "INSERT INTO \"User\" (username, password, date_joined, is_active) VALUES (%s, %s, %s, %s) RETURNING id",
-            (username, hashed_password, datetime.now(), 1)
-        )
-        user_id = cur.fetchone()[0]
-        conn.commit()
+        with db_manager.connection() as conn:
+            existing = db_manager.execute_query("SELECT id FROM \"User\" WHERE username = %s", (username,), conn=conn)
+            if existing:
+                return jsonify({'error': 'Пользователь с таким именем уже существует'}), 400
+            
+            hashed_password = generate_password_hash(password)
+            result = db_manager.execute_query(
+                "INSERT INTO \"User\" (username, password, date_joined, is_active) VALUES (%s, %s, %s, %s) RETURNING id",
+                (username, hashed_password, datetime.now(), 1),
+                conn=conn
+            )
+            user_id = result[0][0]
         
         return jsonify({'status': 'success', 'user_id': user_id})
         
     except Exception as e:
         logger.error(f"Registration error: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -135,10 +412,10 @@ def login():
         if not username or not password:
             return jsonify({'error': 'Необходимо указать имя пользователя и пароль'}), 400
         
-        conn = psycopg2.connect(**db_config)
-        cur = conn.cursor()
-        cur.execute("SELECT id, username, password FROM \"User\" WHERE username = %s", (username,))
-        user_data = cur.fetchone()
+        result = db_manager.execute_query(
+            "SELECT id, username, password FROM \"User\" WHERE username = %s", (username,)
+        )
+        user_data = result[0] if result else None
         
         if user_data and check_password_hash(user_data[2], password):
             user = User(user_data[0], user_data[1])
@@ -150,11 +427,6 @@ def login():
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.route('/api/logout')
 @login_required
@@ -166,49 +438,21 @@ def logout():
 @login_required
 def get_history():
     try:
-        conn = psycopg2.connect(**db_config)
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT 
-                s.create_dttm,
-                s.input_text,
-                s.language_code,
-                s.status,
-                r.audio_file_path,
-                r.duration_seconds
-            FROM SpeechSynthesisRequest s
-            LEFT JOIN SpeechSynthesisResult r ON s.id = r.request_id
-            WHERE s.user_id = %s
-            ORDER BY s.create_dttm DESC
-            LIMIT 50
-        """, (current_user.id,))
-        
-        history = []
-        for row in cur.fetchall():
-            audio_url = None
-            if row[4]:
-                audio_filename = Path(row[4]).name
-                audio_url = f'http://127.0.0.1:1010/api/audio/{audio_filename}'
-
-            history.append({
-                'date': row[0].strftime('%d.%m.%Y %H:%M'),
-                'text': row[1],
-                'language': row[2],
-                'status': row[3],
-                'audio_path': audio_url,
-                'duration': row[5]
-            })
-            
-        return jsonify({'history': history})
+        before, limit, preview = page_params(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+    try:
+        sync_status_journal()
+        query, params = build_history_query(current_user.id, before, limit, preview)
+        rows = db_manager.execute_query(query, tuple(params))
+        history, next_cursor = format_history(
+            rows or [], limit, lambda name: audio_url_signer.signed_url(AUDIO_BASE_URL, name, current_user.id)
+        )
+        return jsonify({'history': history, 'next_cursor': next_cursor})
         
     except Exception as e:
         logger.error(f"Error getting history: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.before_request
 def log_request():
@@ -217,6 +461,8 @@ def log_request():
 @app.after_request
 def log_response(response):
     logger.info(f"Response: {response.status_code}")
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_requests.inc(labels=[endpoint, str(response.status_code)])
     return response
 
 @app.route('/')
@@ -224,6 +470,14 @@ def home():
     logger.info("Serving index page")
     return app.send_static_file('index.html')
 
+def _admission_error_response(error):
+    logger.warning(f"Synthesis rejected ({error.reason}): {str(error)}")
+    response = jsonify({'error': str(error), 'reason': error.reason})
+    response.status_code = error.status_code
+    if error.retry_after_header is not None:
+        response.headers['Retry-After'] = error.retry_after_header
+    return response
+
 @app.route('/api/synthesize', methods=['POST'])
 @login_required
 def synthesize():
@@ -238,57 +492,274 @@ def synthesize():
         text = data['text']
         language = data.get('language', 'lez')
         user_id = current_user.id
+        lane = task_manager.lane_for(text, data.get('priority'))
         
         task_id = str(uuid.uuid4())
-        logger.info(f"Queueing synthesis task {task_id} for text: '{text[:50]}...' (language: {language})")
-        task_manager.submit_task(task_id, text, language, user_id)
+        logger.info(f"Queueing synthesis task {task_id} for text: '{text[:50]}...' (language: {language}, lane: {lane})")
+        task_manager.submit_task(task_id, text, language, user_id, priority=lane, profile=profile_requested())
         
         return jsonify({
             'task_id': task_id,
-            'status': 'queued'
+            'status': 'queued',
+            'lane': lane
         })
     
+    except AdmissionError as e:
+        return _admission_error_response(e)
     except Exception as e:
         logger.error(f"Error in synthesize: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/synthesize/stream', methods=['POST'])
+@login_required
+def synthesize_stream():
+    data = request.get_json(silent=True)
+    if not data or not data.get('text', '').strip():
+        logger.warning("No text in stream request")
+        return jsonify({'error': 'Не указан текст в запросе'}), 400
+
+    text = data['text']
+    stream_format = data.get('format', 'wav').lower()
+    if stream_format not in ('wav', 'pcm'):
+        return jsonify({'error': f'Unsupported stream format: {stream_format}'}), 400
+    # Поток синтезируется в потоке запроса, но занимает слот пользователя и
+    # проходит те же проверки очереди, что и задача из /api/synthesize
+    user_id = current_user.id
+    try:
+        admission.admit(user_id, text, task_manager.scheduler.qsize(INTERACTIVE))
+    except AdmissionError as e:
+        return _admission_error_response(e)
+
+    logger.info(f"Streaming synthesis for text: '{text[:50]}...' (format: {stream_format})")
+
+    def generate():
+        chunks = tts.synthesize_stream(text)
+        encoder = iter_wav_stream if stream_format == 'wav' else iter_pcm_stream
+        try:
+            for chunk in encoder(chunks):
+                yield chunk
+        except Exception as e:
+            # Статус уже отправлен клиенту, остаётся только оборвать поток
+            logger.error(f"Error in streaming synthesis: {str(e)}", exc_info=True)
+
+    try:
+        if stream_format == 'wav':
+            mimetype = 'audio/wav'
+        else:
+            sampling_rate = tts.get_model_info().get('sampling_rate')
+            mimetype = f'audio/L16; rate={sampling_rate}; channels=1'
+        response = Response(stream_with_context(generate()), mimetype=mimetype)
+    except Exception:
+        admission.release(user_id)
+        raise
+    # Слот освобождается, когда сервер закрывает ответ: поток дочитан или клиент отключился
+    response.call_on_close(lambda: admission.release(user_id))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _signed_audio_url(result):
+    """Подписанная ссылка на аудио задачи - только её владельцу (эндпоинты задач доступны по task_id)"""
+    if 'user_id' not in result or not current_user.is_authenticated or current_user.id != result['user_id']:
+        return None
+    return audio_url_signer.signed_url(AUDIO_BASE_URL, Path(result['audio_path']).name, result['user_id'])
+
+def _task_response(task_id, result):
+    if result is None or result['status'] == 'processing':
+        return jsonify({
+            'status': 'processing',
+            'task_id': task_id
+        })
+
+    if result['status'] in ('expired', 'unknown'):
+        return jsonify({'status': result['status'], 'task_id': task_id, 'error': 'Task not found'}), 404
+    
+    if result['status'] == 'error':
+        return jsonify({'status': 'error', 'error': result['error']}), 500
+    
+    audio_file_path = audio_manager.get_audio_path(result['audio_path'])
+    if not audio_file_path.exists():
+        task_manager.pop_task_result(task_id)
+        return jsonify({'status': 'error', 'error': 'Audio file not found'}), 404
+    
+    # Отдаём сохранённый файл напрямую (wsgi.file_wrapper / sendfile), без временных копий
+    response = send_file(
+        str(audio_file_path),
+        mimetype='audio/wav',
+        as_attachment=True,
+        download_name='speech.wav'
+    )
+    # Постоянная (до истечения подписи) ссылка для повторного воспроизведения
+    audio_url = _signed_audio_url(result)
+    if audio_url is not None:
+        response.headers['X-Audio-URL'] = audio_url
+    
+    task_manager.pop_task_result(task_id)
+    
+    return response
+
 @app.route('/api/task/<task_id>', methods=['GET'])
 def get_task_status(task_id):
     try:
-        with task_manager.task_lock:
-            result = task_manager.task_results.get(task_id)
-        
-        if result is None:
-            return jsonify({
-                'status': 'processing',
-                'task_id': task_id
-            })
-        
-        if result['status'] == 'error':
-            return jsonify({'status': 'error', 'error': result['error']}), 500
-        
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-            temp_file.write(result['audio_data'])
-            temp_path = temp_file.name
-        
-        response = send_file(
-            temp_path,
-            mimetype='audio/wav',
-            as_attachment=True,
-            download_name='speech.wav'
-        )
-        
-        os.unlink(temp_path)
-        
-        with task_manager.task_lock:
-            task_manager.task_results.pop(task_id, None)
-        
-        return response
-    
+        return _task_response(task_id, task_manager.get_task_status(task_id))
     except Exception as e:
         logger.error(f"Error checking task status: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def _waiters_full_response():
+    logger.warning("Too many task waiters, client should poll /api/task/<task_id>")
+    response = jsonify({'error': 'Too many waiting clients, poll /api/task/<task_id>', 'reason': 'waiters_full'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.route('/api/task/<task_id>/wait', methods=['GET'])
+def wait_task(task_id):
+    try:
+        if not task_manager.is_known_task(task_id):
+            return jsonify({'status': 'unknown', 'error': 'Task not found'}), 404
+        timeout = min(max(request.args.get('timeout', 25, type=float), 0), TASK_WAIT_MAX_SECONDS)
+        if not task_waiters.acquire(blocking=False):
+            return _waiters_full_response()
+        try:
+            result = task_manager.wait_for_task(task_id, timeout)
+        finally:
+            task_waiters.release()
+        return _task_response(task_id, result)
+    except Exception as e:
+        logger.error(f"Error waiting for task: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/task/<task_id>/events', methods=['GET'])
+def task_events(task_id):
+    if not task_manager.is_known_task(task_id):
+        return jsonify({'status': 'unknown', 'error': 'Task not found'}), 404
+    if not task_waiters.acquire(blocking=False):
+        return _waiters_full_response()
+
+    def generate():
+        deadline = time.monotonic() + TASK_EVENTS_MAX_SECONDS
+        while time.monotonic() < deadline:
+            result = task_manager.wait_for_task(task_id, TASK_EVENTS_HEARTBEAT_SECONDS)
+            if result is None:
+                yield ": keepalive\n\n"
+                continue
+            if result['status'] == 'error':
+                yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': result['error']})}\n\n"
+            else:
+                payload = {
+                    'status': 'success',
+                    'duration': result.get('duration'),
+                    'audio_url': f'/api/task/{task_id}'
+                }
+                download_url = _signed_audio_url(result)
+                if download_url is not None:
+                    payload['download_url'] = download_url
+                yield f"event: done\ndata: {json.dumps(payload)}\n\n"
+            return
+        yield "event: timeout\ndata: {}\n\n"
+
+    try:
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    except Exception:
+        task_waiters.release()
+        raise
+    # Поток ожидания освобождается, когда сервер закрывает ответ (в том числе при отключении клиента)
+    response.call_on_close(task_waiters.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/batch', methods=['POST'])
+@login_required
+def create_batch():
+    try:
+        data = request.get_json() or {}
+        texts = data.get('texts')
+        document = data.get('document')
+        if (texts is None) == (document is None):
+            return jsonify({'error': 'Укажите либо texts (список текстов), либо document'}), 400
+        if texts is not None and not isinstance(texts, list):
+            return jsonify({'error': 'texts должен быть списком строк'}), 400
+        if document is not None and not isinstance(document, str):
+            return jsonify({'error': 'document должен быть строкой'}), 400
+
+        job = batch_jobs.create_job(current_user.id, texts=texts, document=document,
+                                    language=data.get('language', 'lez'))
+        return jsonify(job.summary(with_items=False)), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except AdmissionError as e:
+        return _admission_error_response(e)
+    except Exception as e:
+        logger.error(f"Error creating batch job: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/batch/<job_id>', methods=['GET'])
+@login_required
+def get_batch(job_id):
+    job = batch_jobs.get_job(job_id, current_user.id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.summary())
+
+@app.route('/api/batch/<job_id>/download', methods=['GET'])
+@login_required
+def download_batch(job_id):
+    job = batch_jobs.get_job(job_id, current_user.id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not job.done:
+        return jsonify(job.summary(with_items=False)), 409
+    if not job.completed:
+        return jsonify({'error': 'No audio was synthesized for this job'}), 404
+
+    fmt = request.args.get('format', 'zip')
+    if fmt == 'zip':
+        body, mimetype = batch_jobs.iter_zip(job), 'application/zip'
+    elif fmt == 'wav':
+        gap_ms = min(max(request.args.get('gap_ms', 300, type=int), 0), 5000)
+        try:
+            body, mimetype = batch_jobs.iter_concatenated_wav(job, gap_ms=gap_ms), 'audio/wav'
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 422
+    else:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+
+    logger.info(f"Streaming batch job {job_id} as {fmt} ({job.completed} items)")
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="batch-{job_id}.{fmt}"'
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    return jsonify({'profiles': profiler.list_profiles(limit)})
+
+@app.route('/api/admin/profiles/<task_id>', methods=['GET'])
+@admin_required
+def get_profile(task_id):
+    kind = request.args.get('format', 'json')
+    try:
+        path = profiler.profile_path(task_id, kind)
+    except (ValueError, KeyError):
+        return jsonify({'error': 'Invalid task id or format'}), 400
+    if kind == 'json':
+        summary = profiler.get_profile(task_id)
+        if summary is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return jsonify(summary)
+    if not path.exists():
+        return jsonify({'error': 'Profile not found'}), 404
+    mimetype = 'application/json' if kind == 'torch' else 'application/octet-stream'
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=path.name)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=MetricsRegistry.CONTENT_TYPE)
+
 @app.route('/health')
 def health():
     logger.info("Health check")
@@ -313,22 +784,11 @@ def get_user():
         logger.error(f"Error getting user info: {str(e)}")
         return jsonify({'error': 'Ошибка получения данных пользователя'}), 500
 
-@app.route('/api/audio/<filename>', methods=['GET'])
-@login_required
-def serve_audio(filename):
-    if '..' in filename or filename.startswith('/'):
-        return jsonify({'error': 'Invalid filename'}), 400
-
-    audio_file_path = AUDIO_HISTORY_DIR / filename
-
-    conn = None
-    cur = None
-    is_authorized = False
-    try:
-        # Using db_manager to check access
-        # NOTE: This check still opens a new connection. For better performance
-        # especially if this endpoint is hit often, consider passing a connection
-        # or using a connection pool properly.
+def check_audio_access(filename, user_id):
+    """Проверка доступа по БД для ссылок без подписи; результат кэшируется на AUDIO_ACL_CACHE_SECONDS"""
+    allowed = audio_access_cache.get(user_id, filename)
+    if allowed is None:
+        sync_status_journal()
         result = db_manager.execute_query(
             """
             SELECT 1
@@ -336,49 +796,54 @@ def serve_audio(filename):
             JOIN SpeechSynthesisRequest req ON res.request_id = req.id
             WHERE res.audio_file_path = %s AND req.user_id = %s
             """,
-            (str(Path('audio_history') / filename), current_user.id)
+            (str(Path('audio_history') / filename), user_id)
         )
-        if result and len(result) > 0:
-            is_authorized = True
-
-    except Exception as db_err:
-        logger.error(f"Error checking audio file access for user {current_user.id}: {str(db_err)}")
-        return jsonify({'error': 'Database error checking access'}), 500
+        allowed = bool(result)
+        audio_access_cache.put(user_id, filename, allowed)
+    return allowed
 
-    if not is_authorized:
-         return jsonify({'error': 'Unauthorized access to audio file'}), 403
+@app.route('/api/audio/<filename>', methods=['GET'])
+def serve_audio(filename):
+    if '..' in filename or filename.startswith('/'):
+        return jsonify({'error': 'Invalid filename'}), 400
 
-    if not audio_file_path.exists():
+    # Подписанная ссылка проверяется без БД; иначе нужна сессия и проверка владельца
+    if 'sig' in request.args:
+        if audio_url_signer.verify(filename, request.args) is None:
+            return jsonify({'error': 'Invalid or expired audio link'}), 403
+    elif not current_user.is_authenticated:
+        return login_manager.unauthorized()
+    else:
+        try:
+            if not check_audio_access(filename, current_user.id):
+                return jsonify({'error': 'Unauthorized access to audio file'}), 403
+        except Exception as db_err:
+            logger.error(f"Error checking audio file access for user {current_user.id}: {str(db_err)}")
+            return jsonify({'error': 'Database error checking access'}), 500
+
+    audio_file_path = audio_manager.find_audio(filename)
+    if audio_file_path is None:
         return jsonify({'error': 'Audio file not found'}), 404
 
     requested_format = request.args.get('format', 'wav').lower()
-    original_format = audio_file_path.suffix[1:].lower()
-
-    if requested_format == original_format:
-        # Serve original file
-        mimetype = f'audio/{original_format}'
-        download_name = f'speech.{original_format}'
-        return send_file(str(audio_file_path), mimetype=mimetype, as_attachment=True, download_name=download_name)
-    elif requested_format == 'mp3' and original_format == 'wav':
-        # Convert WAV to MP3 and serve
-        try:
-            audio = AudioSegment.from_wav(audio_file_path)
-            mp3_buffer = io.BytesIO()
-            audio.export(mp3_buffer, format='mp3')
-            mp3_buffer.seek(0)
-            
-            mimetype = 'audio/mpeg'
-            download_name = f'speech.mp3'
-            return send_file(mp3_buffer, mimetype=mimetype, as_attachment=True, download_name=download_name)
-        except FileNotFoundError:
-             logger.error("ffmpeg not found. Cannot convert to MP3.")
-             return jsonify({'error': 'Audio conversion failed: ffmpeg not found.'}), 500
-        except Exception as e:
-            logger.error(f"Error during WAV to MP3 conversion: {str(e)}")
-            return jsonify({'error': 'Audio conversion failed.'}), 500
-    else:
-        # Unsupported conversion or format
-        return jsonify({'error': f'Unsupported format conversion requested: {original_format} to {requested_format}'}), 400
+    if requested_format not in MIMETYPES:
+        return jsonify({'error': f'Unsupported format requested: {requested_format}'}), 400
+
+    served_path = transcode_cache.get(audio_file_path, requested_format)
+    if served_path is None:
+        return jsonify({'error': 'Audio conversion failed.'}), 500
+
+    # conditional: ETag/Last-Modified, ответы 304 на If-None-Match и поддержка Range
+    response = send_file(
+        str(served_path),
+        mimetype=transcode_cache.mimetype(requested_format),
+        as_attachment=True,
+        download_name=f'speech.{requested_format}',
+        conditional=True,
+        etag=True
+    )
+    response.headers['Cache-Control'] = f'private, max-age={AUDIO_CACHE_MAX_AGE}'
+    return response
 
 if __name__ == '__main__':
     logger.info("Starting application")
@@ -0,0 +1,384 @@
+"""
+ASGI-режим сервиса: I/O-эндпоинты /api/* на asyncio
+
+Ожидание задач, история, выдача аудио и постановка задач обслуживаются
+асинхронно (asyncpg, FileResponse), без потока на соединение. Синтез
+по-прежнему выполняется пулом TaskManager. Остальные маршруты (логин,
+регистрация, потоковый синтез, /metrics, статика) отдаёт Flask-приложение
+через WSGI-адаптер, сессии Flask-Login общие для обоих режимов.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 1010
+"""
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import (
+    DB_POOL_MAX, DB_POOL_MIN, DB_POOL_TIMEOUT, TASK_EVENTS_HEARTBEAT_SECONDS,
+    AUDIO_BASE_URL, AUDIO_CACHE_MAX_AGE, TASK_EVENTS_MAX_SECONDS, TASK_WAIT_MAX_SECONDS, app as flask_app, audio_manager,
+    audio_access_cache, audio_url_signer, db_config, http_requests, logger, sync_status_journal, task_manager,
+    transcode_cache
+)
+from lezgian_tts.admission import AdmissionError
+from lezgian_tts.async_database import AsyncDatabaseManager
+from lezgian_tts.history import build_history_query, format_history, page_params
+from lezgian_tts.transcode_cache import MIMETYPES
+
+async_db = AsyncDatabaseManager(db_config, min_size=DB_POOL_MIN, max_size=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT)
+
+
+class TaskWaiter:
+    """Ожидание завершения задач в цикле событий, без потока на каждого клиента"""
+
+    def __init__(self, task_manager):
+        self.task_manager = task_manager
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        task_manager.completion_observers.append(self._on_finish)
+
+    def _on_finish(self, task_id: str, result: Dict) -> None:
+        # Вызывается из потока воркера TaskManager
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._wake, task_id)
+
+    def _wake(self, task_id: str) -> None:
+        for future in self._waiters.pop(task_id, ()):
+            if not future.done():
+                future.set_result(None)
+
+    async def wait(self, task_id: str, timeout: float) -> Optional[Dict]:
+        result = self.task_manager.get_task_result(task_id)
+        if result is not None:
+            return result
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(task_id, set())
+        waiters.add(future)
+        try:
+            # Повторная проверка: задача могла завершиться до регистрации future
+            if self.task_manager.get_task_result(task_id) is None:
+                await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters.discard(future)
+            if not waiters and self._waiters.get(task_id) is waiters:
+                del self._waiters[task_id]
+        return self.task_manager.get_task_result(task_id)
+
+
+task_waiter = TaskWaiter(task_manager)
+
+
+def _session_user_id(request: Request) -> Optional[int]:
+    """user_id из подписанной cookie сессии Flask (её выставляет /api/login)"""
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        session = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    user_id = session.get('_user_id')
+    return int(user_id) if user_id is not None else None
+
+
+async def _load_user(request: Request) -> bool:
+    """Загружает пользователя сессии в request.state; False - сессии нет"""
+    user_id = _session_user_id(request)
+    user = None
+    if user_id is not None:
+        try:
+            user = await async_db.fetchrow('SELECT id, username, is_superuser FROM "User" WHERE id = $1', user_id)
+        except Exception as e:
+            logger.error(f"Error loading user: {str(e)}")
+    if user is None:
+        return False
+    request.state.user_id = user['id']
+    request.state.username = user['username']
+    request.state.is_superuser = bool(user['is_superuser'])
+    return True
+
+
+def login_required(endpoint):
+    @wraps(endpoint)
+    async def wrapper(request: Request):
+        if not await _load_user(request):
+            return JSONResponse({'error': 'Unauthorized'}, status_code=401)
+        return await endpoint(request)
+    return wrapper
+
+
+def _admission_error_response(error: AdmissionError) -> JSONResponse:
+    logger.warning(f"Synthesis rejected ({error.reason}): {str(error)}")
+    headers = {}
+    if error.retry_after_header is not None:
+        headers['Retry-After'] = error.retry_after_header
+    return JSONResponse({'error': str(error), 'reason': error.reason}, status_code=error.status_code, headers=headers)
+
+
+@login_required
+async def synthesize(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or 'text' not in data:
+        logger.warning("No text in request")
+        return JSONResponse({'error': 'Не указан текст в запросе'}, status_code=400)
+
+    text = data['text']
+    language = data.get('language', 'lez')
+    lane = task_manager.lane_for(text, data.get('priority'))
+    task_id = str(uuid.uuid4())
+    logger.info(f"Queueing synthesis task {task_id} for text: '{text[:50]}...' (language: {language}, lane: {lane})")
+    try:
+        # submit_task синхронно пишет в БД, синтез уходит в пул TaskManager
+        # Профилирование по запросу (X-Profile: 1 или ?profile=1) доступно только администраторам
+        profile = request.state.is_superuser and (request.headers.get('X-Profile') or request.query_params.get('profile')) == '1'
+        await run_in_threadpool(task_manager.submit_task, task_id, text, language, request.state.user_id, lane,
+                                profile=profile)
+    except AdmissionError as e:
+        return _admission_error_response(e)
+    except Exception as e:
+        logger.error(f"Error in synthesize: {str(e)}", exc_info=True)
+        return JSONResponse({'error': str(e)}, status_code=500)
+    return JSONResponse({'task_id': task_id, 'status': 'queued', 'lane': lane})
+
+
+def _task_response(task_id: str, result: Optional[Dict], request: Request) -> Response:
+    if result is None or result['status'] == 'processing':
+        return JSONResponse({'status': 'processing', 'task_id': task_id})
+    if result['status'] in ('expired', 'unknown'):
+        return JSONResponse({'status': result['status'], 'task_id': task_id, 'error': 'Task not found'},
+                            status_code=404)
+    if result['status'] == 'error':
+        return JSONResponse({'status': 'error', 'error': result['error']}, status_code=500)
+
+    audio_file_path = audio_manager.get_audio_path(result['audio_path'])
+    task_manager.pop_task_result(task_id)
+    if not audio_file_path.exists():
+        return JSONResponse({'status': 'error', 'error': 'Audio file not found'}, status_code=404)
+    headers = {}
+    audio_url = _signed_audio_url(result, request)
+    if audio_url is not None:
+        headers['X-Audio-URL'] = audio_url
+    return FileResponse(audio_file_path, media_type='audio/wav', filename='speech.wav', headers=headers)
+
+
+def _signed_audio_url(result: Dict, request: Request) -> Optional[str]:
+    """Подписанная ссылка на аудио задачи - только её владельцу (эндпоинты задач доступны по task_id)"""
+    if 'user_id' not in result or _session_user_id(request) != result['user_id']:
+        return None
+    return audio_url_signer.signed_url(AUDIO_BASE_URL, Path(result['audio_path']).name, result['user_id'])
+
+
+async def get_task_status(request: Request):
+    task_id = request.path_params['task_id']
+    return _task_response(task_id, task_manager.get_task_status(task_id), request)
+
+
+async def wait_task(request: Request):
+    task_id = request.path_params['task_id']
+    if not task_manager.is_known_task(task_id):
+        return JSONResponse({'status': 'unknown', 'error': 'Task not found'}, status_code=404)
+    try:
+        timeout = float(request.query_params.get('timeout', 25))
+    except ValueError:
+        timeout = 25.0
+    timeout = min(max(timeout, 0), TASK_WAIT_MAX_SECONDS)
+    return _task_response(task_id, await task_waiter.wait(task_id, timeout), request)
+
+
+async def task_events(request: Request):
+    task_id = request.path_params['task_id']
+    if not task_manager.is_known_task(task_id):
+        return JSONResponse({'status': 'unknown', 'error': 'Task not found'}, status_code=404)
+
+    async def generate():
+        deadline = time.monotonic() + TASK_EVENTS_MAX_SECONDS
+        while time.monotonic() < deadline:
+            result = await task_waiter.wait(task_id, TASK_EVENTS_HEARTBEAT_SECONDS)
+            if result is None:
+                yield ": keepalive\n\n"
+                continue
+            if result['status'] == 'error':
+                yield f"event: error\ndata: {json.dumps({'status': 'error', 'error': result['error']})}\n\n"
+            else:
+                payload = {
+                    'status': 'success',
+                    'duration': result.get('duration'),
+                    'audio_url': f'/api/task/{task_id}'
+                }
+                download_url = _signed_audio_url(result, request)
+                if download_url is not None:
+                    payload['download_url'] = download_url
+                yield f"event: done\ndata: {json.dumps(payload)}\n\n"
+            return
+        yield "event: timeout\ndata: {}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@login_required
+async def get_history(request: Request):
+    try:
+        before, limit, preview = page_params(request.query_params)
+    except ValueError:
+        return JSONResponse({'error': 'Invalid pagination parameters'}, status_code=400)
+    query, params = build_history_query(request.state.user_id, before, limit, preview, placeholder='$')
+    try:
+        await run_in_threadpool(sync_status_journal)
+        rows = await async_db.fetch(query, *params)
+    except Exception as e:
+        logger.error(f"Error getting history: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+    history, next_cursor = format_history(
+        rows, limit, lambda name: audio_url_signer.signed_url(AUDIO_BASE_URL, name, request.state.user_id)
+    )
+    return JSONResponse({'history': history, 'next_cursor': next_cursor})
+
+
+@login_required
+async def get_user(request: Request):
+    return JSONResponse({'username': request.state.username})
+
+
+async def _check_audio_access(filename: str, user_id: int) -> bool:
+    allowed = audio_access_cache.get(user_id, filename)
+    if allowed is None:
+        await run_in_threadpool(sync_status_journal)
+        row = await async_db.fetchrow(
+            """
+            SELECT 1
+            FROM SpeechSynthesisResult res
+            JOIN SpeechSynthesisRequest req ON res.request_id = req.id
+            WHERE res.audio_file_path = $1 AND req.user_id = $2
+            """,
+            str(Path('audio_history') / filename), user_id
+        )
+        allowed = row is not None
+        audio_access_cache.put(user_id, filename, allowed)
+    return allowed
+
+
+async def serve_audio(request: Request):
+    filename = request.path_params['filename']
+    if '..' in filename or filename.startswith('/'):
+        return JSONResponse({'error': 'Invalid filename'}, status_code=400)
+
+    # Подписанная ссылка проверяется без БД; иначе нужна сессия и проверка владельца
+    if 'sig' in request.query_params:
+        if audio_url_signer.verify(filename, request.query_params) is None:
+            return JSONResponse({'error': 'Invalid or expired audio link'}, status_code=403)
+    elif not await _load_user(request):
+        return JSONResponse({'error': 'Unauthorized'}, status_code=401)
+    else:
+        try:
+            if not await _check_audio_access(filename, request.state.user_id):
+                return JSONResponse({'error': 'Unauthorized access to audio file'}, status_code=403)
+        except Exception as db_err:
+            logger.error(f"Error checking audio file access for user {request.state.user_id}: {str(db_err)}")
+            return JSONResponse({'error': 'Database error checking access'}, status_code=500)
+
+    audio_file_path = audio_manager.find_audio(filename)
+    if audio_file_path is None:
+        return JSONResponse({'error': 'Audio file not found'}, status_code=404)
+
+    requested_format = request.query_params.get('format', 'wav').lower()
+    if requested_format not in MIMETYPES:
+        return JSONResponse({'error': f'Unsupported format requested: {requested_format}'}, status_code=400)
+    # Перекодирование при промахе кэша - работа CPU, уводим из цикла событий
+    served_path = await run_in_threadpool(transcode_cache.get, audio_file_path, requested_format)
+    if served_path is None:
+        return JSONResponse({'error': 'Audio conversion failed.'}, status_code=500)
+    # FileResponse сам выставляет ETag/Last-Modified и обрабатывает Range и If-None-Match
+    return FileResponse(
+        served_path,
+        media_type=transcode_cache.mimetype(requested_format),
+        filename=f'speech.{requested_format}',
+        headers={'Cache-Control': f'private, max-age={AUDIO_CACHE_MAX_AGE}'}
+    )
+
+
+async def health(request: Request):
+    return JSONResponse({'status': 'ok'})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    task_waiter.loop = asyncio.get_running_loop()
+    await async_db.start()
+    logger.info("ASGI application started")
+    try:
+        yield
+    finally:
+        task_waiter.loop = None
+        await async_db.close()
+
+
+routes = [
+    Route('/api/synthesize', synthesize, methods=['POST']),
+    Route('/api/task/{task_id}', get_task_status, methods=['GET']),
+    Route('/api/task/{task_id}/wait', wait_task, methods=['GET']),
+    Route('/api/task/{task_id}/events', task_events, methods=['GET']),
+    Route('/api/history', get_history, methods=['GET']),
+    Route('/api/user', get_user, methods=['GET']),
+    Route('/api/audio/{filename}', serve_audio, methods=['GET']),
+    Route('/health', health, methods=['GET']),
+    # Всё остальное (логин, регистрация, потоковый синтез, метрики, статика) - Flask
+    Mount('/', app=WSGIMiddleware(flask_app)),
+]
+
+# Метки endpoint в той же записи, что у маршрутов Flask: /api/task/<task_id>
+_route_labels = {
+    route.endpoint: route.path.replace('{', '<').replace('}', '>')
+    for route in routes if isinstance(route, Route)
+}
+
+
+class RequestMetricsMiddleware:
+    """Считает ответы асинхронных маршрутов; ответы Flask считает его after_request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            label = _route_labels.get(scope.get('endpoint'))
+            if label is not None:
+                logger.info(f"Response: {scope['method']} {scope['path']} {status['code']}")
+                http_requests.inc(labels=[label, str(status['code'])])
+
+
+application = Starlette(routes=routes, lifespan=lifespan, middleware=[Middleware(RequestMetricsMiddleware)])
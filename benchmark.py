@@ -0,0 +1,345 @@
+"""
+Офлайн-бенчмарк синтезатора LezgianTTS и TaskManager
+
+Не требует Flask и Postgres. Замеряет время этапов (normalize, inference,
+prepare, encode, write), real-time factor, символы в секунду, перцентили
+задержки и пиковый RSS каждой точки на сетке длин текста и уровней
+конкурентности. Этапы TaskManager (queue_wait, db_start, file_write,
+db_finalize, ...) попадают в разбивку вместе с этапами синтезатора.
+
+    python benchmark.py --stub --output bench.json
+    python benchmark.py --model model --lengths 40 160 --concurrency 1 4
+    python benchmark.py --stub --baseline bench.json --max-regression 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+
+from lezgian_tts import AudioManager, LezgianTTS, TaskManager
+
+SAMPLE_TEXT = (
+    "Гьар са шиир зи аял хьиз, за хайи, къалурда за, килиг лугьуз... таза я. "
+    "Салам алейкум, хъсан инсанар! Чи чIал чи рикIел алама."
+)
+
+
+class StubSynthesiser:
+    """Детерминированная замена HF pipeline: тон, длина которого пропорциональна тексту"""
+
+    def __init__(self, sampling_rate: int = 16000, samples_per_char: int = 1000, rtf: float = 0.05):
+        self.sampling_rate = sampling_rate
+        self.samples_per_char = samples_per_char
+        self.rtf = rtf
+        self.model = None
+        self.tokenizer = None
+
+    def _run(self, text: str) -> Dict:
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.float64)
+        freqs = np.repeat(200.0 + codes % 400.0, self.samples_per_char) * 2 * np.pi / self.sampling_rate
+        audio = (0.3 * np.sin(np.cumsum(freqs))).astype(np.float32)[np.newaxis, :]
+        # Имитация стоимости инференса, пропорциональной длительности аудио
+        time.sleep(self.rtf * audio.shape[-1] / self.sampling_rate)
+        return {"audio": audio, "sampling_rate": self.sampling_rate}
+
+    def __call__(self, inputs, **kwargs):
+        if isinstance(inputs, str):
+            return self._run(inputs)
+        return [self._run(text) for text in inputs]
+
+
+class StubTTS(LezgianTTS):
+    def __init__(self, rtf: float = 0.05, **kwargs):
+        self.stub_rtf = rtf
+        super().__init__(model_id="stub", **kwargs)
+
+    def _initialize_model(self) -> None:
+        self.synthesiser = StubSynthesiser(rtf=self.stub_rtf)
+
+
+class InMemoryDatabase:
+    """Заменитель DatabaseManager для бенчмарка TaskManager без Postgres"""
+
+    def __init__(self):
+        self._next_id = 0
+        self._lock = Lock()
+
+    def execute_query(self, query: str, params: tuple = (), conn=None):
+        if "RETURNING id" in query:
+            with self._lock:
+                self._next_id += 1
+                return [(self._next_id,)]
+        return None
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        yield None
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class StageRecorder:
+    def __init__(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+        self._lock = Lock()
+
+    def __call__(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.totals[stage] += seconds
+
+    def reset(self) -> None:
+        with self._lock:
+            self.totals.clear()
+
+
+def process_peak_rss_mb() -> float:
+    """Пик RSS за всё время процесса: не уменьшается между точками сетки"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss - килобайты в Linux и байты в macOS
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def current_rss_mb() -> Optional[float]:
+    """Текущий RSS из /proc/self/statm; None вне Linux"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RSSSampler:
+    """Пик RSS за одну точку сетки: фоновый поток опрашивает текущий RSS"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_mb: Optional[float] = None
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _sample(self) -> None:
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "RSSSampler":
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def make_text(length: int) -> str:
+    repeated = (SAMPLE_TEXT + " ") * (length // len(SAMPLE_TEXT) + 1)
+    return repeated[:length].strip()
+
+
+def summarize(latencies: List[float], audio_seconds: float, chars: int, wall: float,
+              stages: Dict[str, float], requests: int, rss: RSSSampler) -> Dict:
+    latencies_ms = np.array(latencies) * 1000
+    busy = float(np.sum(latencies))
+    return {
+        "requests": requests,
+        "wall_seconds": wall,
+        "latency_ms": {
+            "mean": float(np.mean(latencies_ms)),
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p95": float(np.percentile(latencies_ms, 95)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+        },
+        "rtf": busy / audio_seconds if audio_seconds else None,
+        "chars_per_sec": chars / wall if wall else None,
+        "audio_seconds_per_sec": audio_seconds / wall if wall else None,
+        "stage_ms": {stage: total * 1000 / requests for stage, total in stages.items()},
+        "peak_rss_mb": rss.peak_mb,
+        "process_peak_rss_mb": process_peak_rss_mb(),
+    }
+
+
+def bench_synthesizer(tts: LezgianTTS, recorder: StageRecorder, text: str, concurrency: int,
+                      requests: int, output_dir: Path) -> Dict:
+    audio_manager = AudioManager(output_dir)
+
+    def run_one(_):
+        start = time.perf_counter()
+        speech = tts.synthesize(text)
+        if speech is None:
+            raise RuntimeError("Синтез не удался")
+        buffer = tts.encode_audio(speech)
+        write_start = time.perf_counter()
+        filename = f"{uuid.uuid4()}.wav"
+        audio_manager.save_audio(buffer.getbuffer(), filename)
+        recorder("write", time.perf_counter() - write_start)
+        latency = time.perf_counter() - start
+        audio_manager.delete_audio(filename)
+        return latency, np.squeeze(speech["audio"]).shape[-1] / speech["sampling_rate"]
+
+    recorder.reset()
+    with RSSSampler() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(run_one, range(requests)))
+        wall = time.perf_counter() - start
+    latencies = [latency for latency, _ in results]
+    audio_seconds = sum(seconds for _, seconds in results)
+    return summarize(latencies, audio_seconds, len(text) * requests, wall, dict(recorder.totals), requests, rss)
+
+
+def bench_task_manager(tts: LezgianTTS, recorder: StageRecorder, text: str, concurrency: int,
+                       requests: int, output_dir: Path) -> Dict:
+    audio_manager = AudioManager(output_dir)
+    task_manager = TaskManager(tts, audio_manager, InMemoryDatabase(), max_workers=concurrency)
+    # Этапы самого TaskManager (очередь, БД, запись файла); этапы синтезатора recorder получает от tts
+    task_manager.stage_observers.append(recorder)
+
+    recorder.reset()
+    submitted: Dict[str, float] = {}
+    latencies: List[float] = []
+    audio_seconds = 0.0
+    try:
+        with RSSSampler() as rss:
+            start = time.perf_counter()
+            for _ in range(requests):
+                task_id = str(uuid.uuid4())
+                submitted[task_id] = time.perf_counter()
+                task_manager.submit_task(task_id, text, "lez", user_id=0)
+            pending = set(submitted)
+            while pending:
+                for task_id in list(pending):
+                    result = task_manager.get_task_result(task_id)
+                    if result is None:
+                        continue
+                    latencies.append(time.perf_counter() - submitted[task_id])
+                    pending.discard(task_id)
+                    if result["status"] != "success":
+                        raise RuntimeError(f"Задача {task_id} завершилась ошибкой: {result.get('error')}")
+                    path = audio_manager.get_audio_path(result["audio_path"])
+                    audio_seconds += sf.info(str(path)).duration
+                    path.unlink()
+                time.sleep(0.002)
+            wall = time.perf_counter() - start
+    finally:
+        task_manager.scheduler.shutdown(wait=True)
+        task_manager.stage_observers.remove(recorder)
+    return summarize(latencies, audio_seconds, len(text) * requests, wall, dict(recorder.totals), requests, rss)
+
+
+def compare_with_baseline(results: List[Dict], baseline_path: Path, max_regression: float) -> List[str]:
+    """Сравнивает p95 и RTF с базовым прогоном; возвращает список регрессий"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    index = {(r["scenario"], r["length"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = index.get((result["scenario"], result["length"], result["concurrency"]))
+        if base is None:
+            continue
+        for metric, current, previous in (
+            ("p95", result["latency_ms"]["p95"], base["latency_ms"]["p95"]),
+            ("rtf", result["rtf"], base["rtf"]),
+        ):
+            if current and previous and current > previous * (1 + max_regression):
+                regressions.append(
+                    f"{result['scenario']} len={result['length']} c={result['concurrency']}: "
+                    f"{metric} {previous:.3f} -> {current:.3f}"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк LezgianTTS / TaskManager")
+    parser.add_argument("--model", default="model", help="Путь к модели (игнорируется с --stub)")
+    parser.add_argument("--backend", default="eager")
+    parser.add_argument("--stub", action="store_true", help="Детерминированная модель-заглушка без весов")
+    parser.add_argument("--stub-rtf", type=float, default=0.05, help="Имитируемый RTF заглушки")
+    parser.add_argument("--scenario", choices=("synthesizer", "task_manager", "all"), default="all")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[20, 80, 320, 1280])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=16, help="Запросов на точку сетки")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    parser.add_argument("--baseline", type=Path, help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.stub:
+        tts = StubTTS(rtf=args.stub_rtf)
+    else:
+        tts = LezgianTTS(model_id=args.model, backend=args.backend)
+    tts.logger.setLevel("WARNING")
+    recorder = StageRecorder()
+    tts.stage_observers.append(recorder)
+
+    for _ in range(args.warmup):
+        tts.synthesize(make_text(args.lengths[0]))
+
+    scenarios = {"synthesizer": bench_synthesizer, "task_manager": bench_task_manager}
+    if args.scenario != "all":
+        scenarios = {args.scenario: scenarios[args.scenario]}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = Path(tmp)
+        for name, bench in scenarios.items():
+            for length in args.lengths:
+                text = make_text(length)
+                for concurrency in args.concurrency:
+                    summary = bench(tts, recorder, text, concurrency, args.requests, output_dir)
+                    summary.update({"scenario": name, "length": len(text), "concurrency": concurrency})
+                    results.append(summary)
+                    print(
+                        f"{name:13s} len={len(text):5d} c={concurrency:2d} "
+                        f"p50={summary['latency_ms']['p50']:8.1f}ms p95={summary['latency_ms']['p95']:8.1f}ms "
+                        f"rtf={summary['rtf']:.3f} chars/s={summary['chars_per_sec']:.0f} "
+                        f"rss={summary['peak_rss_mb'] or 0:.0f}MB"
+                    )
+
+    report = {
+        "meta": {
+            "model_id": tts.model_id,
+            "backend": tts.backend,
+            "stub": args.stub,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.max_regression)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ: {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,6 +16,40 @@ db_config = {
     "password": os.getenv("DB_PASSWORD", "postgres")
 }
 
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_user_username ON \"User\"(username);",
+    "CREATE INDEX IF NOT EXISTS idx_session_user ON Session(user_id);",
+    "CREATE INDEX IF NOT EXISTS idx_oauth_user ON OAuthToken(user_id);",
+    "CREATE INDEX IF NOT EXISTS idx_synth_user ON SpeechSynthesisRequest(user_id);",
+    # Страница истории: WHERE user_id = ? AND (create_dttm, id) < (?, ?) ORDER BY create_dttm DESC, id DESC
+    "CREATE INDEX IF NOT EXISTS idx_synth_user_created ON SpeechSynthesisRequest"
+    "(user_id, create_dttm DESC, id DESC) INCLUDE (status, language_code);",
+    "CREATE INDEX IF NOT EXISTS idx_result_request ON SpeechSynthesisResult(request_id);",
+    "CREATE INDEX IF NOT EXISTS idx_result_audio_path ON SpeechSynthesisResult(audio_file_path);",
+]
+
+def create_indexes(cursor):
+    for statement in INDEXES:
+        cursor.execute(statement)
+    print("Индексы созданы")
+
+def create_missing_indexes(conf: dict):
+    """Добавляет недостающие индексы в существующую БД, не удаляя таблицы"""
+    conn = None
+    try:
+        conn = psycopg2.connect(**conf)
+        with conn.cursor() as cursor:
+            create_indexes(cursor)
+            cursor.execute("ANALYZE SpeechSynthesisRequest;")
+        conn.commit()
+    except Exception as e:
+        print(f"Ошибка при создании индексов: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+
 def create_database_structure(conf: dict):
     conn = None
     cursor = None
@@ -108,11 +142,7 @@ def create_database_structure(conf: dict):
             );
         """)
         
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_username ON \"User\"(username);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_session_user ON Session(user_id);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_oauth_user ON OAuthToken(user_id);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_synth_user ON SpeechSynthesisRequest(user_id);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_result_request ON SpeechSynthesisResult(request_id);")
+        create_indexes(cursor)
         
         conn.commit()
         print("Структура базы данных успешно создана")
@@ -128,6 +158,9 @@ def create_database_structure(conf: dict):
             conn.close()
 
 if __name__ == "__main__":
-    create_database_structure(
-        conf=db_config
-    )
+    if "--indexes-only" in sys.argv:
+        create_missing_indexes(conf=db_config)
+    else:
+        create_database_structure(
+            conf=db_config
+        )
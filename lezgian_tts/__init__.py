@@ -0,0 +1,18 @@
+from .synthesizer import LezgianTTS
+from .normalizer import LezgianNormalizer
+from .audio_manager import AudioManager
+from .database_manager import DatabaseManager, PoolTimeoutError
+from .task_manager import TaskManager
+from .synthesis_cache import SynthesisCache, LRUCache
+from .sentence_cache import SentenceAudioCache
+from .batcher import InferenceBatcher
+from .result_store import TaskResultStore
+from .inference_server import InferenceServer, InferenceClient
+from .metrics import MetricsRegistry
+from .admission import AdmissionController, AdmissionError
+from .scheduler import PriorityScheduler
+from .transcode_cache import TranscodeCache
+from .audio_gc import AudioGarbageCollector
+from .status_journal import StatusJournal
+from .batch_jobs import BatchJobManager
+from .profiler import RequestProfiler
@@ -0,0 +1,186 @@
+import math
+import time
+from threading import Lock
+from typing import Dict, List, Optional
+
+
+class AdmissionError(Exception):
+    """Задача отклонена контролем допуска; status_code и retry_after уходят клиенту"""
+
+    def __init__(self, message: str, status_code: int = 429, retry_after: Optional[float] = None,
+                 reason: str = "rate_limited"):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def retry_after_header(self) -> Optional[str]:
+        if self.retry_after is None:
+            return None
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Забирает токен; возвращает 0 при успехе или время до появления токена"""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """
+    Контроль допуска задач синтеза в очередь
+
+    Проверки выполняются до записи в БД, в порядке: длина текста, глубина
+    очереди, оценка ожидания, число незавершённых задач пользователя,
+    token bucket пользователя. Оценка ожидания строится по скользящему
+    среднему времени обработки задачи.
+
+    Интерактивная полоса ограничена max_queue_depth и оценкой ожидания;
+    полоса bulk (длинные тексты и фрагменты пакетных заданий) - отдельной
+    квотой max_bulk_queue без ограничения ожидания, поэтому массовая работа
+    не вытесняет интерактивные запросы. Пакетное задание допускается целиком
+    (admit_job): оно занимает один токен пользователя и один из max_user_jobs
+    слотов до завершения всех фрагментов.
+    """
+
+    def __init__(self, max_queue_depth: int = 100, max_estimated_wait: float = 60.0,
+                 max_user_in_flight: int = 3, user_rate: float = 1.0, user_burst: int = 5,
+                 max_text_length: int = 5000, workers: int = 4, initial_service_time: float = 2.0,
+                 max_bulk_queue: int = 2000, max_user_jobs: int = 2):
+        self.max_queue_depth = max_queue_depth
+        self.max_estimated_wait = max_estimated_wait
+        self.max_user_in_flight = max_user_in_flight
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_text_length = max_text_length
+        self.max_bulk_queue = max_bulk_queue
+        self.max_user_jobs = max_user_jobs
+        self.workers = max(workers, 1)
+        self.avg_service_time = initial_service_time
+        self.rejections: Dict[str, int] = {}
+        self._in_flight: Dict[int, int] = {}
+        self._jobs: Dict[int, int] = {}
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._lock = Lock()
+
+    def estimated_wait(self, queue_depth: int) -> float:
+        return (queue_depth + 1) * self.avg_service_time / self.workers
+
+    def check_text(self, text: str) -> None:
+        if "\x00" in text:
+            # PostgreSQL не хранит NUL в текстовых полях: строка не записалась бы в журнал
+            self._reject("Текст содержит недопустимый символ NUL", 400, None, "invalid_text")
+        if len(text) > self.max_text_length:
+            self._reject(
+                f"Текст слишком длинный ({len(text)} символов, максимум {self.max_text_length})",
+                413, None, "text_too_long"
+            )
+
+    def check_capacity(self, queue_depth: int, units: int = 1, bulk: bool = False) -> None:
+        """
+        Проверка глубины полосы и оценки ожидания для units новых задач
+
+        Args:
+            queue_depth (int): Число задач, ожидающих в той же полосе
+            units (int): Сколько задач ставится в очередь
+            bulk (bool): Полоса bulk - квота max_bulk_queue, ожидание не ограничивается
+        """
+        limit = self.max_bulk_queue if bulk else self.max_queue_depth
+        if units > limit:
+            # Такое задание не поместится никогда, повтор бесполезен
+            self._reject(f"Слишком много задач за раз ({units}, максимум {limit})", 413, None, "too_many_units")
+        if queue_depth + units > limit:
+            self._reject("Очередь синтеза переполнена, повторите позже", 503,
+                         self.estimated_wait(queue_depth), "queue_full")
+        if bulk:
+            return
+        wait = self.estimated_wait(queue_depth)
+        if wait > self.max_estimated_wait:
+            self._reject(f"Ожидаемое время ожидания {wait:.0f} с превышает лимит", 503,
+                         wait - self.max_estimated_wait, "wait_too_long")
+
+    def admit(self, user_id: int, text: str, queue_depth: int, bulk: bool = False) -> None:
+        self.check_text(text)
+        self.check_capacity(queue_depth, bulk=bulk)
+        self._take_slot(user_id, self._in_flight, self.max_user_in_flight, "user_in_flight",
+                        "Слишком много незавершённых задач")
+
+    def release(self, user_id: int) -> None:
+        self._release_slot(user_id, self._in_flight)
+
+    def admit_job(self, user_id: int, texts: List[str], queue_depth: int) -> None:
+        """
+        Допуск пакетного задания целиком
+
+        Args:
+            user_id (int): Владелец задания
+            texts (List[str]): Фрагменты задания, каждый станет задачей полосы bulk
+            queue_depth (int): Число задач, ожидающих в полосе bulk
+        """
+        for text in texts:
+            self.check_text(text)
+        self.check_capacity(queue_depth, len(texts), bulk=True)
+        self._take_slot(user_id, self._jobs, self.max_user_jobs, "user_jobs",
+                        "Слишком много незавершённых пакетных заданий")
+
+    def release_job(self, user_id: int) -> None:
+        self._release_slot(user_id, self._jobs)
+
+    def _take_slot(self, user_id: int, slots: Dict[int, int], limit: int, reason: str, message: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if slots.get(user_id, 0) >= limit:
+                retry_after = self.avg_service_time
+            else:
+                bucket = self._buckets.get(user_id)
+                if bucket is None:
+                    if len(self._buckets) > 10000:
+                        self._prune_buckets(now)
+                    bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+                retry_after = bucket.take(now)
+                if retry_after == 0.0:
+                    slots[user_id] = slots.get(user_id, 0) + 1
+                    return
+                reason = "user_rate"
+        if reason == "user_rate":
+            self._reject("Слишком много запросов, повторите позже", 429, retry_after, reason)
+        self._reject(f"{message} (максимум {limit})", 429, retry_after, reason)
+
+    def _release_slot(self, user_id: int, slots: Dict[int, int]) -> None:
+        with self._lock:
+            count = slots.get(user_id, 0) - 1
+            if count > 0:
+                slots[user_id] = count
+            else:
+                slots.pop(user_id, None)
+
+    def record_service_time(self, seconds: float, alpha: float = 0.2) -> None:
+        self.avg_service_time = (1 - alpha) * self.avg_service_time + alpha * seconds
+
+    def _prune_buckets(self, now: float) -> None:
+        for user_id in [uid for uid, bucket in self._buckets.items() if bucket.is_full(now)]:
+            del self._buckets[user_id]
+
+    def _reject(self, message: str, status_code: int, retry_after: Optional[float], reason: str) -> None:
+        with self._lock:
+            self.rejections[reason] = self.rejections.get(reason, 0) + 1
+        raise AdmissionError(message, status_code, retry_after, reason)
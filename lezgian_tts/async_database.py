@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+
+class AsyncDatabaseManager:
+    """
+    Пул асинхронных соединений с Postgres (asyncpg) для ASGI-режима
+
+    Принимает тот же db_config, что и DatabaseManager. Запросы пишутся
+    с плейсхолдерами asyncpg ($1, $2, ...).
+    """
+
+    def __init__(self, db_config: Dict[str, Any], min_size: int = 1, max_size: int = 10,
+                 timeout: float = 5.0):
+        self.db_config = db_config
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.pool: Optional[asyncpg.Pool] = None
+
+    async def start(self) -> None:
+        self.pool = await asyncpg.create_pool(
+            host=self.db_config.get("host"),
+            port=int(self.db_config.get("port", 5432)),
+            database=self.db_config.get("dbname"),
+            user=self.db_config.get("user"),
+            password=self.db_config.get("password"),
+            min_size=self.min_size,
+            max_size=self.max_size,
+        )
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def fetch(self, query: str, *args) -> List[asyncpg.Record]:
+        try:
+            async with self.pool.acquire(timeout=self.timeout) as conn:
+                return await conn.fetch(query, *args)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Нет свободных соединений с БД (максимум {self.max_size})")
+
+    async def fetchrow(self, query: str, *args) -> Optional[asyncpg.Record]:
+        rows = await self.fetch(query, *args)
+        return rows[0] if rows else None
+
+    def stats(self) -> Dict[str, int]:
+        if self.pool is None:
+            return {"size": 0, "idle": 0, "max_size": self.max_size}
+        return {"size": self.pool.get_size(), "idle": self.pool.get_idle_size(), "max_size": self.max_size}
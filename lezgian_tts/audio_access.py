@@ -0,0 +1,90 @@
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+
+
+class AudioURLSigner:
+    """
+    Подписанные ссылки на аудио с ограниченным сроком действия
+
+    Подпись HMAC-SHA256 покрывает имя файла, пользователя и срок, поэтому
+    ссылку можно проверить без обращения к БД. Срок округляется вверх до
+    granularity секунд: повторные запросы истории выдают одинаковые ссылки,
+    и браузер может брать файл из своего кэша.
+    """
+
+    def __init__(self, secret: bytes, ttl: int = 3600, granularity: int = 300):
+        self.secret = secret
+        self.ttl = ttl
+        self.granularity = max(granularity, 1)
+
+    def _signature(self, filename: str, user_id: int, expires: int) -> str:
+        message = f"{filename}\n{user_id}\n{expires}".encode("utf-8")
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()
+
+    def sign(self, filename: str, user_id: int, now: Optional[float] = None) -> Dict[str, str]:
+        now = time.time() if now is None else now
+        expires = (int(now + self.ttl) // self.granularity + 1) * self.granularity
+        return {
+            "exp": str(expires),
+            "uid": str(user_id),
+            "sig": self._signature(filename, user_id, expires),
+        }
+
+    def signed_url(self, base_url: str, filename: str, user_id: int) -> str:
+        return f"{base_url}/{filename}?{urlencode(self.sign(filename, user_id))}"
+
+    def verify(self, filename: str, params: Mapping[str, str], now: Optional[float] = None) -> Optional[int]:
+        """
+        Проверяет подпись ссылки
+
+        Returns:
+            int: user_id, которому выдана ссылка, или None, если подпись неверна или истекла
+        """
+        try:
+            expires = int(params["exp"])
+            user_id = int(params["uid"])
+            signature = params["sig"]
+        except (KeyError, TypeError, ValueError):
+            return None
+        if expires < (time.time() if now is None else now):
+            return None
+        if not hmac.compare_digest(signature, self._signature(filename, user_id, expires)):
+            return None
+        return user_id
+
+
+class AccessCache:
+    """Кэш результатов проверки доступа (user_id, файл) в БД с коротким TTL"""
+
+    def __init__(self, ttl: float = 60.0, max_items: int = 10000):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items: "OrderedDict[Tuple[int, str], Tuple[bool, float]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, user_id: int, filename: str) -> Optional[bool]:
+        key = (user_id, filename)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            allowed, expires = item
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            return allowed
+
+    def put(self, user_id: int, filename: str, allowed: bool) -> None:
+        with self._lock:
+            self._items[(user_id, filename)] = (allowed, time.monotonic() + self.ttl)
+            self._items.move_to_end((user_id, filename))
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
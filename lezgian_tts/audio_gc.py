@@ -0,0 +1,260 @@
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Event, Thread
+from typing import Dict, List, Optional, Tuple
+
+import soundfile as sf
+
+# Ключ pg_advisory_lock: сборку мусора одновременно выполняет только один процесс
+GC_LOCK_KEY = 0x4C5A5447
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return float('inf')
+
+
+class AudioGarbageCollector:
+    """
+    Фоновая сборка мусора и сжатие хранилища аудио
+
+    За один проход (run_once):
+      - файлы из плоского каталога старой раскладки переносятся в шарды;
+      - удаляются файлы без строки в SpeechSynthesisResult (старше grace_seconds,
+        чтобы не задеть задачи, которые ещё пишут результат);
+      - удаляются файлы запросов старше retention_days вместе со строками результата;
+      - при превышении max_bytes удаляются самые старые результаты;
+      - WAV старше compress_after_hours сжимаются в FLAC без потерь.
+
+    Дисковый уровень SynthesisCache (cache_dir) хранит жёсткие ссылки на файлы
+    истории, поэтому объём считается по уникальным inode: файл и его ссылка в
+    кэше занимают место один раз. Удаляя или сжимая файл истории, сборщик
+    удаляет и ссылки на него из кэша - иначе место не освободится. Записи кэша,
+    не связанные с историей, вытесняются (старые первыми) при превышении
+    cache_max_bytes, а при превышении max_bytes - раньше файлов истории.
+
+    Строки SpeechSynthesisRequest не удаляются: в истории запрос остаётся без аудио.
+    """
+
+    def __init__(self, audio_manager, db_manager, retention_days: Optional[float] = None,
+                 max_bytes: Optional[int] = None, compress_after_hours: Optional[float] = None,
+                 interval: float = 3600.0, grace_seconds: float = 3600.0, batch_size: int = 1000,
+                 transcode_cache=None, cache_dir: Optional[Path] = None, cache_max_bytes: Optional[int] = None,
+                 logger: Optional[logging.Logger] = None):
+        self.audio_manager = audio_manager
+        self.db_manager = db_manager
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.compress_after_hours = compress_after_hours
+        self.interval = interval
+        self.grace_seconds = grace_seconds
+        self.batch_size = batch_size
+        self.transcode_cache = transcode_cache
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        self.last_run: Dict[str, int] = {}
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="tts-audio-gc", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"Ошибка сборки мусора аудио: {str(e)}", exc_info=True)
+
+    def run_once(self) -> Dict[str, int]:
+        """Один проход сборки мусора; возвращает счётчики действий"""
+        stats = {'migrated': 0, 'orphans': 0, 'expired': 0, 'over_budget': 0, 'cache_evicted': 0,
+                 'compressed': 0, 'bytes': 0}
+        with self.db_manager.connection() as conn:
+            locked = self.db_manager.execute_query("SELECT pg_try_advisory_lock(%s)", (GC_LOCK_KEY,), conn=conn)
+            if not locked or not locked[0][0]:
+                self.logger.info("Сборка мусора аудио уже выполняется другим процессом")
+                return stats
+            try:
+                files = self._scan(stats)
+                cache_links = self._scan_cache()
+                rows = self._lookup(files, conn)
+                now = time.time()
+                kept: List[Tuple[datetime, Path, int, int]] = []
+                doomed: List[Tuple[Path, Optional[str], int]] = []
+                expire_before = None
+                if self.retention_days:
+                    expire_before = datetime.now() - timedelta(days=self.retention_days)
+                for logical, (path, size, mtime, inode) in files.items():
+                    created = rows.get(logical)
+                    if created is None:
+                        if now - mtime > self.grace_seconds:
+                            doomed.append((path, None, inode))
+                            stats['orphans'] += 1
+                        else:
+                            kept.append((datetime.fromtimestamp(mtime), path, size, inode))
+                    elif expire_before is not None and created < expire_before:
+                        doomed.append((path, logical, inode))
+                        stats['expired'] += 1
+                    else:
+                        kept.append((created, path, size, inode))
+
+                # Записи кэша без файла истории занимают место сами по себе
+                history_inodes = {inode for _, _, _, inode in files.values()}
+                cache_only = deque(sorted(
+                    (mtime, path, size)
+                    for inode, links in cache_links.items() if inode not in history_inodes
+                    for path, size, mtime in links
+                ))
+                cache_bytes = sum(size for _, _, size in cache_only)
+                evicted_cache: List[Path] = []
+                while cache_only and self.cache_max_bytes is not None and cache_bytes > self.cache_max_bytes:
+                    _, path, size = cache_only.popleft()
+                    evicted_cache.append(path)
+                    cache_bytes -= size
+
+                total = sum(size for _, _, size, _ in kept) + cache_bytes
+                if self.max_bytes and total > self.max_bytes:
+                    while cache_only and total > self.max_bytes:
+                        _, path, size = cache_only.popleft()
+                        evicted_cache.append(path)
+                        total -= size
+                    kept.sort(key=lambda item: item[0])
+                    evicted = 0
+                    while evicted < len(kept) and total > self.max_bytes:
+                        _, path, size, inode = kept[evicted]
+                        doomed.append((path, self._logical_name(path), inode))
+                        total -= size
+                        evicted += 1
+                    kept = kept[evicted:]
+                    stats['over_budget'] = evicted
+                stats['bytes'] = total
+                stats['cache_evicted'] = len(evicted_cache)
+                self._delete(doomed, cache_links, conn)
+                for path in evicted_cache:
+                    self._unlink(path)
+
+                if self.compress_after_hours:
+                    compress_before = now - self.compress_after_hours * 3600
+                    for _, path, _, inode in kept:
+                        if path.suffix == '.wav' and _mtime(path) < compress_before:
+                            if self._compress(path):
+                                # Ссылка из кэша удерживала бы несжатую копию
+                                for link, _, _ in cache_links.get(inode, ()):
+                                    self._unlink(link)
+                                stats['compressed'] += 1
+            finally:
+                self.db_manager.execute_query("SELECT pg_advisory_unlock(%s)", (GC_LOCK_KEY,), conn=conn)
+        self.last_run = stats
+        self.logger.info(f"Сборка мусора аудио: {stats}")
+        return stats
+
+    def _logical_name(self, path: Path) -> str:
+        # Логическое имя всегда <uuid>.wav, даже если файл сжат в FLAC
+        return str(Path(self.audio_manager.AUDIO_HISTORY_DIR.name) / f"{path.stem}.wav")
+
+    def _scan(self, stats: Dict[str, int]) -> Dict[str, Tuple[Path, int, float, int]]:
+        files: Dict[str, Tuple[Path, int, float, int]] = {}
+        root = self.audio_manager.AUDIO_HISTORY_DIR
+        for path in self.audio_manager.iter_stored_files():
+            if path.parent == root and self.audio_manager.shard_depth > 0:
+                target = self.audio_manager.storage_path(path.name)
+                if not target.exists():
+                    os.replace(path, target)
+                    stats['migrated'] += 1
+                    path = target
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files[self._logical_name(path)] = (path, stat.st_size, stat.st_mtime, stat.st_ino)
+        return files
+
+    def _scan_cache(self) -> Dict[int, List[Tuple[Path, int, float]]]:
+        """Файлы дискового уровня кэша синтеза, сгруппированные по inode"""
+        links: Dict[int, List[Tuple[Path, int, float]]] = {}
+        if self.cache_dir is None or not self.cache_dir.is_dir():
+            return links
+        for path in self.cache_dir.glob('*.wav'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            links.setdefault(stat.st_ino, []).append((path, stat.st_size, stat.st_mtime))
+        return links
+
+    def _lookup(self, files: Dict, conn) -> Dict[str, datetime]:
+        """Дата создания запроса для каждого логического имени, у которого есть строка результата"""
+        rows: Dict[str, datetime] = {}
+        names = list(files)
+        for start in range(0, len(names), self.batch_size):
+            result = self.db_manager.execute_query(
+                """
+                SELECT res.audio_file_path, req.create_dttm
+                FROM SpeechSynthesisResult res
+                JOIN SpeechSynthesisRequest req ON res.request_id = req.id
+                WHERE res.audio_file_path = ANY(%s)
+                """,
+                (names[start:start + self.batch_size],),
+                conn=conn
+            )
+            rows.update({path: created for path, created in result or []})
+        return rows
+
+    def _delete(self, doomed: List[Tuple[Path, Optional[str], int]],
+                cache_links: Dict[int, List[Tuple[Path, int, float]]], conn) -> None:
+        # Сначала фиксируем удаление строк, потом удаляем файлы: при сбое между
+        # шагами остаётся файл-сирота, которого уберёт следующий проход
+        for start in range(0, len(doomed), self.batch_size):
+            batch = doomed[start:start + self.batch_size]
+            logical_names = [logical for _, logical, _ in batch if logical is not None]
+            if logical_names:
+                self.db_manager.execute_query(
+                    "DELETE FROM SpeechSynthesisResult WHERE audio_file_path = ANY(%s)", (logical_names,), conn=conn
+                )
+                conn.commit()
+            for path, _, inode in batch:
+                self._unlink(path)
+                # Пока на inode ссылается кэш, данные остаются на диске
+                for link, _, _ in cache_links.get(inode, ()):
+                    self._unlink(link)
+                if self.transcode_cache is not None:
+                    self.transcode_cache.discard(path)
+
+    @staticmethod
+    def _unlink(path: Path) -> None:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _compress(self, path: Path) -> bool:
+        target = path.with_suffix('.flac')
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        os.close(fd)
+        try:
+            data, sample_rate = sf.read(path, dtype='int16')
+            sf.write(tmp_path, data, sample_rate, format='FLAC', subtype='PCM_16')
+            os.replace(tmp_path, target)
+            path.unlink()
+            return True
+        except Exception as e:
+            self.logger.warning(f"Не удалось сжать {path.name}: {str(e)}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return False
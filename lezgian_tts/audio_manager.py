@@ -1,29 +1,92 @@
+import hashlib
+import os
+import shutil
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional, Union
 
 class AudioManager:
     AUDIO_HISTORY_DIR: Path
+    # Подкаталоги audio_history, которые не являются хранилищем истории
+    RESERVED_DIRS = ('cache', 'transcoded', 'profiles')
+    # Форматы, в которых файл может лежать на диске (FLAC - после сжатия сборщиком мусора)
+    STORED_SUFFIXES = ('.wav', '.flac')
 
-    def __init__(self, audio_history_dir: Path):
+    def __init__(self, audio_history_dir: Path, shard_depth: int = 2):
         self.AUDIO_HISTORY_DIR = audio_history_dir
         self.AUDIO_HISTORY_DIR.mkdir(exist_ok=True)
+        # shard_depth уровней подкаталогов по 2 hex-символа хеша имени; 0 - плоский каталог
+        self.shard_depth = shard_depth
 
-    def save_audio(self, audio_data: bytes, filename: str) -> bool:
+    def _shard_dir(self, filename: str) -> Path:
+        digest = hashlib.md5(Path(filename).stem.encode('utf-8')).hexdigest()
+        directory = self.AUDIO_HISTORY_DIR
+        for level in range(self.shard_depth):
+            directory = directory / digest[level * 2:level * 2 + 2]
+        return directory
+
+    def storage_path(self, filename: str) -> Path:
+        """Путь для записи нового файла (каталог шарда создаётся)"""
+        directory = self._shard_dir(filename)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / filename
+
+    def save_audio(self, audio_data: Union[bytes, memoryview], filename: str) -> bool:
         try:
-            file_path = self.AUDIO_HISTORY_DIR / filename
+            file_path = self.storage_path(filename)
             with open(file_path, 'wb') as f:
                 f.write(audio_data)
             return True
         except Exception:
             return False
 
+    def link_audio(self, source_path: Path, filename: str) -> bool:
+        # Жёсткая ссылка вместо копии; если ФС не поддерживает - копируем
+        try:
+            file_path = self.storage_path(filename)
+            try:
+                os.link(source_path, file_path)
+            except FileExistsError:
+                return True
+            except OSError:
+                shutil.copyfile(source_path, file_path)
+            return True
+        except Exception:
+            return False
+
+    def find_audio(self, filename: str) -> Optional[Path]:
+        """
+        Ищет файл по логическому имени (как в SpeechSynthesisResult.audio_file_path)
+
+        Проверяются каталог шарда и плоский каталог старой раскладки, для каждого -
+        исходное расширение и сжатая версия.
+
+        Returns:
+            Path: Путь к существующему файлу или None
+        """
+        name = Path(filename).name
+        stem = Path(name).stem
+        for directory in (self._shard_dir(name), self.AUDIO_HISTORY_DIR):
+            for candidate in [directory / name] + [directory / f"{stem}{suffix}" for suffix in self.STORED_SUFFIXES]:
+                if candidate.exists():
+                    return candidate
+        return None
+
     def get_audio_path(self, filename: str) -> Path:
-        return self.AUDIO_HISTORY_DIR / filename
+        return self.find_audio(filename) or self._shard_dir(Path(filename).name) / Path(filename).name
+
+    def iter_stored_files(self) -> Iterator[Path]:
+        """Все файлы истории: шарды и плоский каталог, без служебных подкаталогов"""
+        for root, dirs, files in os.walk(self.AUDIO_HISTORY_DIR):
+            if Path(root) == self.AUDIO_HISTORY_DIR:
+                dirs[:] = [d for d in dirs if d not in self.RESERVED_DIRS]
+            for name in files:
+                if Path(name).suffix in self.STORED_SUFFIXES:
+                    yield Path(root) / name
 
     def delete_audio(self, filename: str) -> bool:
         try:
-            file_path = self.AUDIO_HISTORY_DIR / filename
-            if file_path.exists():
+            file_path = self.find_audio(filename)
+            if file_path is not None:
                 file_path.unlink()
                 return True
             return False
@@ -32,4 +95,4 @@ class AudioManager:
 
     def check_access(self, filename: str, user_id: int) -> bool:
         # Заглушка: доступ всегда разрешён (реализация зависит от БД)
-        return True 
\ No newline at end of file
+        return True
@@ -0,0 +1,317 @@
+"""
+Подбор числа воркеров и потоков torch под конкретную машину
+
+Каждый из воркеров TaskManager вызывает torch, который по умолчанию берёт
+столько intra-op потоков, сколько ядер: на 16 ядрах 4 воркера дают 64 потока
+и постоянные переключения контекста. Калибровка перебирает сочетания
+воркеры x torch.set_num_threads x interop-потоки (и, по желанию, привязку
+к физическим ядрам), замеряет пропускную способность и хвост задержки на
+типичных лезгинских текстах и сохраняет лучшую конфигурацию в JSON под
+отпечатком машины (процессор, топология, модель, бэкенд, версия torch).
+
+Настройки потоков torch задаются один раз на процесс, поэтому каждое
+сочетание проверяется в отдельном подпроцессе.
+
+Испытание воспроизводит путь TaskManager без InferenceBatcher и кэша
+предложений: каждый воркер синтезирует текст целиком и кодирует WAV. С
+пакетным инференсом нагрузка другая (воркеры ждут общий пакет, и TaskManager
+поднимает их число до размера пакета), поэтому там калибровка не применяется.
+
+    python -m lezgian_tts.autotune --model model --requests 24
+    lezgian-tts-autotune --affinity --max-p95-ms 3000
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .backends import BACKENDS
+
+DEFAULT_TUNING_FILE = Path(os.getenv("TTS_AUTOTUNE_FILE", Path.home() / ".cache" / "lezgian_tts" / "autotune.json"))
+
+REPRESENTATIVE_TEXTS = [
+    "Салам алейкум!",
+    "Чи чӀал чи рикӀел алама.",
+    "Гьар са шиир зи аял хьиз, за хайи, къалурда за, килиг лугьуз… таза я.",
+    "Салам алейкум, хъсан инсанар! Чи чӀал чи рикӀел алама. "
+    "Гьар са шиир зи аял хьиз, за хайи, къалурда за, килиг лугьуз… таза я.",
+]
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_cores() -> List[int]:
+    """
+    По одному логическому CPU на каждое физическое ядро (без SMT-соседей)
+
+    Топология читается из /sys; если она недоступна, все доступные CPU
+    считаются отдельными ядрами.
+    """
+    cores: Dict[Any, int] = {}
+    for cpu in available_cpus():
+        topology = Path(f"/sys/devices/system/cpu/cpu{cpu}/topology")
+        try:
+            key = (
+                (topology / "physical_package_id").read_text().strip(),
+                (topology / "core_id").read_text().strip(),
+            )
+        except OSError:
+            key = cpu
+        cores.setdefault(key, cpu)
+    return sorted(cores.values())
+
+
+def machine_fingerprint(model_id: str, backend: str) -> str:
+    try:
+        import torch
+        torch_version = torch.__version__
+    except ImportError:
+        torch_version = "none"
+    payload = json.dumps({
+        "cpu": _cpu_model(),
+        "logical_cpus": len(available_cpus()),
+        "physical_cores": len(physical_cores()),
+        "model": model_id,
+        "backend": backend,
+        "torch": torch_version,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def candidate_configs(cores: int, interop_options: List[int], affinity: bool) -> List[Dict[str, Any]]:
+    """Сочетания воркеров и потоков, не превышающие число физических ядер (плюс вариант с половиной потоков)"""
+    configs = []
+    workers = 1
+    while workers <= cores:
+        threads_options = sorted({max(cores // workers, 1), max(cores // (2 * workers), 1)})
+        for threads in threads_options:
+            for interop in interop_options:
+                for pinned in ([False, True] if affinity else [False]):
+                    configs.append({
+                        "workers": workers,
+                        "torch_threads": threads,
+                        "interop_threads": interop,
+                        "affinity": pinned,
+                    })
+        workers *= 2
+    return configs
+
+
+def apply_config(config: Dict[str, Any], logger: Optional[logging.Logger] = None) -> None:
+    """
+    Применяет настройки потоков к текущему процессу
+
+    Вызывается до загрузки модели: число interop-потоков torch можно задать
+    только до начала параллельной работы.
+    """
+    logger = logger or logging.getLogger(__name__)
+    import torch
+    torch.set_num_threads(config["torch_threads"])
+    try:
+        torch.set_num_interop_threads(config["interop_threads"])
+    except RuntimeError as e:
+        logger.warning(f"Не удалось задать interop-потоки torch: {str(e)}")
+    if config.get("affinity") and hasattr(os, "sched_setaffinity"):
+        cores = physical_cores()[:config["workers"] * config["torch_threads"]]
+        os.sched_setaffinity(0, cores)
+    logger.info(
+        f"Потоки инференса: воркеров {config['workers']}, torch {config['torch_threads']}, "
+        f"interop {config['interop_threads']}, привязка к ядрам: {'да' if config.get('affinity') else 'нет'}"
+    )
+
+
+def load_tuned_config(fingerprint: str, path: Path = DEFAULT_TUNING_FILE) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get(fingerprint)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_tuned_config(fingerprint: str, config: Dict[str, Any], path: Path = DEFAULT_TUNING_FILE) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(path, encoding="utf-8") as f:
+            tuned = json.load(f)
+    except (FileNotFoundError, ValueError):
+        tuned = {}
+    tuned[fingerprint] = config
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(tuned, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_trial(config: Dict[str, Any], model_id: str, backend: str, texts: List[str], requests: int,
+              warmup: int = 2) -> Dict[str, Any]:
+    """
+    Замер одной конфигурации в текущем процессе (вызывается в подпроцессе калибровки)
+
+    Каждый из workers потоков, как воркер TaskManager без пакетного инференса,
+    вызывает synthesize и encode_audio для целого текста.
+    """
+    apply_config(config)
+    from .synthesizer import LezgianTTS
+    tts = LezgianTTS(model_id=model_id, backend=backend, logger=logging.getLogger("lezgian_tts.autotune.trial"))
+
+    def run_one(index: int):
+        text = texts[index % len(texts)]
+        start = time.perf_counter()
+        speech = tts.synthesize(text)
+        if speech is None or tts.encode_audio(speech) is None:
+            raise RuntimeError("Синтез не удался")
+        return time.perf_counter() - start, tts.audio_duration(speech), len(text)
+
+    with ThreadPoolExecutor(max_workers=config["workers"]) as pool:
+        list(pool.map(run_one, range(warmup * config["workers"])))
+        start = time.perf_counter()
+        results = list(pool.map(run_one, range(requests)))
+        wall = time.perf_counter() - start
+
+    latencies_ms = np.array([latency for latency, _, _ in results]) * 1000
+    return {
+        "requests": requests,
+        "wall_seconds": wall,
+        "audio_seconds_per_sec": sum(seconds for _, seconds, _ in results) / wall,
+        "chars_per_sec": sum(chars for _, _, chars in results) / wall,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def select_best(results: List[Dict[str, Any]], max_p95_ms: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Лучшая конфигурация: максимум аудио-секунд в секунду среди укладывающихся
+    в max_p95_ms (если ни одна не укладывается - с наименьшим p95)
+    """
+    measured = [result for result in results if "measured" in result]
+    if not measured:
+        return None
+    if max_p95_ms is not None:
+        within = [result for result in measured if result["measured"]["p95_ms"] <= max_p95_ms]
+        if not within:
+            return min(measured, key=lambda result: result["measured"]["p95_ms"])
+        measured = within
+    return max(measured, key=lambda result: (result["measured"]["audio_seconds_per_sec"],
+                                             -result["measured"]["p95_ms"]))
+
+
+def sweep(model_id: str = "model", backend: str = "eager", requests: int = 24,
+          texts: Optional[List[str]] = None, interop_options: Optional[List[int]] = None,
+          affinity: bool = False, max_p95_ms: Optional[float] = None, trial_timeout: float = 900.0,
+          logger: Optional[logging.Logger] = None) -> Optional[Dict[str, Any]]:
+    """
+    Калибровка: каждое сочетание замеряется в отдельном подпроцессе
+
+    Returns:
+        Optional[Dict]: Лучшая конфигурация с замерами и списком всех испытаний или None, если ни одно не удалось
+    """
+    logger = logger or logging.getLogger(__name__)
+    texts = texts or REPRESENTATIVE_TEXTS
+    cores = len(physical_cores())
+    results = []
+    for config in candidate_configs(cores, interop_options or [1], affinity):
+        trial = json.dumps({"config": config, "model": model_id, "backend": backend,
+                            "texts": texts, "requests": requests})
+        try:
+            completed = subprocess.run(
+                [sys.executable, "-m", "lezgian_tts.autotune", "--trial", trial],
+                capture_output=True, text=True, timeout=trial_timeout, check=True
+            )
+            measured = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append({**config, "measured": measured})
+            logger.info(
+                f"{config}: {measured['audio_seconds_per_sec']:.2f} с аудио/с, p95 {measured['p95_ms']:.0f} мс"
+            )
+        except (subprocess.SubprocessError, ValueError, IndexError) as e:
+            stderr = getattr(e, "stderr", None) or ""
+            logger.warning(f"{config}: испытание не удалось ({str(e)}) {stderr[-500:]}")
+            results.append({**config, "error": str(e)})
+
+    best = select_best(results, max_p95_ms)
+    if best is None:
+        return None
+    return {**best, "tuned_at": datetime.now().isoformat(timespec="seconds"), "cores": cores, "trials": results}
+
+
+def tuned_config(model_id: str, backend: str, run_if_missing: bool = False,
+                 path: Path = DEFAULT_TUNING_FILE, logger: Optional[logging.Logger] = None,
+                 **sweep_kwargs) -> Optional[Dict[str, Any]]:
+    """Сохранённая конфигурация этой машины; при run_if_missing - калибровка, если её нет"""
+    logger = logger or logging.getLogger(__name__)
+    fingerprint = machine_fingerprint(model_id, backend)
+    config = load_tuned_config(fingerprint, path)
+    if config is None and run_if_missing:
+        logger.info(f"Калибровка потоков для машины {fingerprint}...")
+        config = sweep(model_id, backend, logger=logger, **sweep_kwargs)
+        if config is not None:
+            save_tuned_config(fingerprint, config, path)
+    return config
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Калибровка потоков инференса Lezgian TTS")
+    parser.add_argument("--model", default=os.getenv("TTS_MODEL_ID", "model"))
+    parser.add_argument("--backend", default=os.getenv("TTS_BACKEND", "eager"), choices=BACKENDS)
+    parser.add_argument("--requests", type=int, default=24, help="Запросов на одно испытание")
+    parser.add_argument("--texts-file", help="Тексты для замера, по одному на строку")
+    parser.add_argument("--interop", type=int, nargs="+", default=[1], help="Варианты числа interop-потоков")
+    parser.add_argument("--affinity", action="store_true", help="Проверять и привязку к физическим ядрам")
+    parser.add_argument("--max-p95-ms", type=float, help="Ограничение на p95 задержки")
+    parser.add_argument("--output", type=Path, default=DEFAULT_TUNING_FILE, help="Файл сохранённых конфигураций")
+    parser.add_argument("--trial", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.trial:
+        # Подпроцесс одного испытания: результат - последней строкой stdout
+        logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+        trial = json.loads(args.trial)
+        measured = run_trial(trial["config"], trial["model"], trial["backend"], trial["texts"], trial["requests"])
+        print(json.dumps(measured))
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    texts = None
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    config = sweep(args.model, args.backend, requests=args.requests, texts=texts,
+                   interop_options=args.interop, affinity=args.affinity, max_p95_ms=args.max_p95_ms)
+    if config is None:
+        logging.error("Ни одно испытание не удалось")
+        sys.exit(1)
+    save_tuned_config(machine_fingerprint(args.model, args.backend), config, args.output)
+    print(json.dumps({key: config[key] for key in ("workers", "torch_threads", "interop_threads", "affinity", "measured")},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
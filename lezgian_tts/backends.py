@@ -0,0 +1,333 @@
+import argparse
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BACKENDS = ("eager", "int8", "bf16", "compile", "onnx")
+
+# Тексты разной длины для проверки ONNX-графа при загрузке
+ONNX_PARITY_TEXTS = (
+    "Салам!",
+    "Гьар са шиир зи аял хьиз.",
+    "Гьар са шиир зи аял хьиз, за хайи, къалурда за, чир хьуй вири инсанриз.",
+)
+
+
+def cpu_supports_bf16() -> bool:
+    """Есть ли у процессора нативные инструкции bf16 (AVX512-BF16 или AMX)"""
+    try:
+        import torch
+        if hasattr(torch.backends, "cpu") and hasattr(torch.backends.cpu, "get_cpu_capability"):
+            if torch.backends.cpu.get_cpu_capability() in ("AVX512_BF16", "AMX"):
+                return True
+    except Exception:
+        pass
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+        return "avx512_bf16" in flags or "amx_bf16" in flags
+    except OSError:
+        return False
+
+
+def supports_trimmed_batch(pipeline) -> bool:
+    """Можно ли вызвать модель pipeline напрямую и обрезать волны пакета (VITS/MMS-TTS)"""
+    model = getattr(pipeline, "model", None)
+    config = getattr(model, "config", None)
+    return getattr(pipeline, "tokenizer", None) is not None and getattr(config, "model_type", None) == "vits"
+
+
+def batch_waveforms(pipeline, texts: List[str]) -> List[Dict]:
+    """
+    Пакетный инференс модели VITS без паддинга в результатах
+
+    Входы пакета дополняются до самого длинного, и модель возвращает волны
+    одной длины; каждая обрезается по своей длине из sequence_lengths,
+    иначе короткие тексты получают хвост паддинга. Результаты - в формате
+    HF pipeline: {"audio": float32 (1, samples), "sampling_rate"}.
+    """
+    import torch
+    model = pipeline.model
+    inputs = pipeline.tokenizer(texts, padding=True, return_tensors="pt").to(model.device)
+    with torch.inference_mode():
+        output = model(**inputs)
+    waveforms = output.waveform.float().cpu().numpy()
+    lengths = output.sequence_lengths.cpu().tolist()
+    sampling_rate = model.config.sampling_rate
+    return [
+        {"audio": waveforms[i:i + 1, :int(lengths[i])].copy(), "sampling_rate": sampling_rate}
+        for i in range(len(texts))
+    ]
+
+
+class AutocastSynthesiser:
+    """Обёртка над HF pipeline, выполняющая вызов под torch.autocast"""
+
+    def __init__(self, pipeline, dtype):
+        self._pipeline = pipeline
+        self._dtype = dtype
+
+    def __call__(self, inputs, **kwargs):
+        import torch
+        with torch.inference_mode(), torch.autocast("cpu", dtype=self._dtype):
+            return self._pipeline(inputs, **kwargs)
+
+    def trimmed_batch(self, texts: List[str]) -> List[Dict]:
+        import torch
+        if not supports_trimmed_batch(self._pipeline):
+            return [self(text) for text in texts]
+        with torch.autocast("cpu", dtype=self._dtype):
+            return batch_waveforms(self._pipeline, texts)
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+
+class OnnxSynthesiser:
+    """Синтез через ONNX Runtime с токенизатором и частотой дискретизации из HF pipeline"""
+
+    def __init__(self, pipeline, onnx_path: Path, num_threads: Optional[int] = None):
+        import onnxruntime as ort
+        self._pipeline = pipeline
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+        self.sampling_rate = pipeline.model.config.sampling_rate
+
+    def _run(self, text: str) -> Dict:
+        encoded = self._pipeline.tokenizer(text, return_tensors="np")
+        waveform = self.session.run(
+            ["waveform"],
+            {
+                "input_ids": encoded["input_ids"].astype(np.int64),
+                "attention_mask": encoded["attention_mask"].astype(np.int64),
+            },
+        )[0]
+        return {"audio": waveform.astype(np.float32), "sampling_rate": self.sampling_rate}
+
+    def __call__(self, inputs, **kwargs):
+        if isinstance(inputs, str):
+            return self._run(inputs)
+        return [self._run(text) for text in inputs]
+
+    def trimmed_batch(self, texts: List[str]) -> List[Dict]:
+        # Граф экспортирован без sequence_lengths: тексты выполняются по одному
+        return [self._run(text) for text in texts]
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+
+def export_onnx(pipeline, onnx_path: Path, opset: int = 17) -> Path:
+    """
+    Экспортирует модель pipeline в ONNX с динамическими длинами входа и выхода
+
+    Экспорт трассировкой: если длина выхода вычисляется в Python (предсказатель
+    длительностей VITS), граф может запомнить длину волны примера "салам" для
+    любого текста. Поэтому apply_backend включает граф только после onnx_parity.
+    """
+    import torch
+
+    class WaveformModule(torch.nn.Module):
+        # (input_ids, attention_mask) -> waveform, без ModelOutput на выходе
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).waveform
+
+    module = WaveformModule(pipeline.model).eval()
+    encoded = pipeline.tokenizer("салам", return_tensors="pt")
+    with torch.inference_mode():
+        torch.onnx.export(
+            module,
+            (encoded["input_ids"], encoded["attention_mask"]),
+            str(onnx_path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["waveform"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "tokens"},
+                "attention_mask": {0: "batch", 1: "tokens"},
+                "waveform": {0: "batch", 1: "samples"},
+            },
+            opset_version=opset,
+        )
+    return onnx_path
+
+
+def apply_backend(pipeline, backend: str, model_id: str, logger: Optional[logging.Logger] = None):
+    """
+    Применяет к загруженному HF pipeline оптимизированный бэкенд инференса на CPU
+
+    Args:
+        pipeline: HF pipeline "text-to-speech" в fp32
+        backend (str): Один из BACKENDS
+        model_id (str): Путь к модели (для поиска/сохранения model.onnx)
+        logger (Logger): Логгер
+
+    Returns:
+        Объект с интерфейсом pipeline; при недоступности бэкенда - исходный pipeline
+
+    Бэкенд compile заменяет pipeline.model.forward скомпилированной функцией
+    прямо на объекте модели: второй pipeline поверх той же модели (или повторный
+    вызов apply_backend) получит уже скомпилированный forward и скомпилирует его
+    ещё раз. Для каждого синтезатора модель нужно загружать отдельно.
+    """
+    logger = logger or logging.getLogger(__name__)
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд {backend}, доступны: {', '.join(BACKENDS)}")
+    if backend == "eager":
+        return pipeline
+
+    import torch
+
+    if backend == "int8":
+        pipeline.model = torch.ao.quantization.quantize_dynamic(
+            pipeline.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        logger.info("Бэкенд int8: динамическая квантизация линейных слоёв")
+        return pipeline
+
+    if backend == "bf16":
+        if not cpu_supports_bf16():
+            logger.warning("Процессор не поддерживает bf16, используется eager fp32")
+            return pipeline
+        logger.info("Бэкенд bf16: autocast на CPU")
+        return AutocastSynthesiser(pipeline, torch.bfloat16)
+
+    if backend == "compile":
+        # Замена на самой модели, а не на pipeline (см. docstring)
+        pipeline.model.forward = torch.compile(pipeline.model.forward, dynamic=True)
+        logger.info("Бэкенд compile: граф torch.compile (inductor, динамические формы)")
+        return pipeline
+
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        logger.warning("onnxruntime не установлен, используется eager fp32")
+        return pipeline
+    model_dir = Path(model_id)
+    onnx_path = model_dir / "model.onnx" if model_dir.is_dir() else Path(f"{model_id.replace('/', '_')}.onnx")
+    try:
+        if not onnx_path.exists():
+            logger.info(f"Экспорт модели в {onnx_path}...")
+            export_onnx(pipeline, onnx_path)
+        synthesiser = OnnxSynthesiser(pipeline, onnx_path, torch.get_num_threads())
+        report = onnx_parity(pipeline, synthesiser)
+    except Exception as e:
+        logger.warning(f"Не удалось подготовить ONNX-бэкенд ({str(e)}), используется eager fp32")
+        return pipeline
+    if not report["passed"]:
+        ratios = ", ".join(f"{item['length_ratio']:.2f}" for item in report["items"])
+        logger.warning(f"ONNX-граф {onnx_path} не прошёл проверку длин волн (отношения: {ratios}), "
+                       f"используется eager fp32")
+        return pipeline
+    logger.info(f"Бэкенд onnx: {onnx_path}")
+    return synthesiser
+
+
+def onnx_parity(pipeline, synthesiser, texts=ONNX_PARITY_TEXTS, max_length_deviation: float = 0.25) -> Dict:
+    """
+    Сравнивает длины волн ONNX-графа и eager-модели на текстах разной длины
+
+    Ловит граф, у которого длина выхода застыла на примере экспорта. Корреляция
+    не проверяется: шум VITS в ONNX Runtime не зависит от seed torch, поэтому
+    и допуск по длине шире, чем в check_parity.
+    """
+    import torch
+    items = []
+    for text in texts:
+        with torch.inference_mode():
+            reference = pipeline(text)
+        metrics = compare_waveforms(reference["audio"], synthesiser(text)["audio"])
+        metrics["passed"] = abs(metrics["length_ratio"] - 1.0) <= max_length_deviation
+        metrics["text"] = text
+        items.append(metrics)
+    return {"passed": all(item["passed"] for item in items), "items": items}
+
+
+def compare_waveforms(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Сравнение двух волн: отношение длин, корреляция и SNR на общей части"""
+    reference = np.squeeze(np.asarray(reference, dtype=np.float64))
+    candidate = np.squeeze(np.asarray(candidate, dtype=np.float64))
+    length = min(len(reference), len(candidate))
+    ref, cand = reference[:length], candidate[:length]
+    noise = np.sum((ref - cand) ** 2)
+    signal = np.sum(ref ** 2)
+    if np.std(ref) > 0 and np.std(cand) > 0:
+        correlation = float(np.corrcoef(ref, cand)[0, 1])
+    else:
+        correlation = 0.0
+    return {
+        "length_ratio": len(candidate) / max(len(reference), 1),
+        "correlation": correlation,
+        "snr_db": float(10 * np.log10(signal / noise)) if noise > 0 else float("inf"),
+    }
+
+
+def check_parity(reference_tts, candidate_tts, texts: List[str], seed: int = 0,
+                 min_correlation: float = 0.9, max_length_deviation: float = 0.05) -> Dict:
+    """
+    Проверяет, что бэкенд выдаёт волны, близкие к eager fp32
+
+    Перед каждым синтезом фиксируется seed, чтобы стохастические части модели
+    (шум предсказателя длительностей) совпадали у обоих синтезаторов.
+    """
+    import torch
+    items = []
+    for text in texts:
+        torch.manual_seed(seed)
+        reference = reference_tts.synthesize(text)
+        torch.manual_seed(seed)
+        candidate = candidate_tts.synthesize(text)
+        if reference is None or candidate is None:
+            items.append({"text": text, "passed": False, "error": "синтез не удался"})
+            continue
+        metrics = compare_waveforms(reference["audio"], candidate["audio"])
+        metrics["passed"] = (
+            metrics["correlation"] >= min_correlation
+            and abs(metrics["length_ratio"] - 1.0) <= max_length_deviation
+        )
+        metrics["text"] = text
+        items.append(metrics)
+    return {"passed": all(item["passed"] for item in items), "items": items}
+
+
+def main() -> None:
+    from .synthesizer import LezgianTTS
+
+    parser = argparse.ArgumentParser(description="Проверка соответствия бэкенда eager-модели")
+    parser.add_argument("--model", default=os.getenv("TTS_MODEL_ID", "model"))
+    parser.add_argument("--backend", required=True, choices=BACKENDS)
+    parser.add_argument("--text", action="append", help="Тексты для проверки (можно несколько раз)")
+    args = parser.parse_args()
+
+    texts = args.text or ["Салам!", "Гьар са шиир зи аял хьиз, за хайи, къалурда за."]
+    reference = LezgianTTS(model_id=args.model)
+    candidate = LezgianTTS(model_id=args.model, backend=args.backend)
+
+    for name, tts in (("eager", reference), (args.backend, candidate)):
+        start = time.perf_counter()
+        audio_seconds = 0.0
+        for text in texts:
+            speech = tts.synthesize(text)
+            if speech is not None:
+                audio_seconds += np.squeeze(speech["audio"]).shape[-1] / speech["sampling_rate"]
+        elapsed = time.perf_counter() - start
+        print(f"{name}: RTF {elapsed / max(audio_seconds, 1e-9):.3f}")
+
+    report = check_parity(reference, candidate, texts)
+    for item in report["items"]:
+        print(item)
+    print("PASSED" if report["passed"] else "FAILED")
+
+
+if __name__ == "__main__":
+    main()
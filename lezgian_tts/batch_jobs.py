@@ -0,0 +1,264 @@
+import json
+import logging
+import time
+import uuid
+import zipfile
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import soundfile as sf
+
+from .scheduler import BULK
+from .streaming import MAX_WAV_DATA_SIZE, wav_header
+
+# Размер блока при чтении файлов для потоковой выдачи
+STREAM_BLOCK_FRAMES = 64 * 1024
+
+
+class _ZipStream:
+    """Несжимаемый поток для zipfile: записанные байты забираются генератором через drain()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class BatchJob:
+    def __init__(self, job_id: str, user_id: int, language: str, texts: List[str]):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.language = language
+        self.created = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.items: List[Dict[str, Any]] = [
+            {'index': i, 'text': text, 'status': 'queued', 'audio_path': None, 'error': None}
+            for i, text in enumerate(texts)
+        ]
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def done(self) -> bool:
+        return self.completed + self.failed == len(self.items)
+
+    @property
+    def status(self) -> str:
+        if not self.done:
+            return 'processing' if self.completed + self.failed else 'queued'
+        if self.failed == len(self.items):
+            return 'error'
+        return 'partial' if self.failed else 'success'
+
+    def summary(self, with_items: bool = True) -> Dict[str, Any]:
+        summary = {
+            'job_id': self.job_id,
+            'status': self.status,
+            'total': len(self.items),
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+        if with_items:
+            summary['items'] = [
+                {key: item[key] for key in ('index', 'status', 'error')} for item in self.items
+            ]
+        return summary
+
+
+class BatchJobManager:
+    """
+    Пакетные задания синтеза: список текстов или документ одной заявкой
+
+    Документ делится на предложения, которые склеиваются в фрагменты до
+    unit_chars символов. Каждый фрагмент - обычная задача TaskManager
+    в полосе bulk, поэтому фрагменты выполняются параллельно всеми
+    воркерами и не задерживают интерактивные запросы. Прогресс и результат
+    отдаются по заданию целиком: zip-архив с файлами по элементам или
+    один WAV, склеенный из всех элементов.
+    """
+
+    def __init__(self, task_manager, tts, audio_manager, max_items: int = 500, unit_chars: int = 300,
+                 ttl: float = 3600.0, logger: Optional[logging.Logger] = None):
+        self.task_manager = task_manager
+        self.tts = tts
+        self.audio_manager = audio_manager
+        self.max_items = max_items
+        self.unit_chars = unit_chars
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger(__name__)
+        self._jobs: Dict[str, BatchJob] = {}
+        # task_id фрагмента -> (задание, индекс элемента)
+        self._units: Dict[str, Any] = {}
+        self._lock = Lock()
+        admission = task_manager.admission
+        if admission is not None and max_items > admission.max_bulk_queue:
+            # Задание больше квоты полосы bulk не было бы допущено никогда
+            self.logger.warning(f"Размер пакетного задания ограничен квотой bulk: {admission.max_bulk_queue}")
+            self.max_items = admission.max_bulk_queue
+        task_manager.completion_observers.append(self._on_task_finished)
+
+    def split_document(self, document: str) -> List[str]:
+        units: List[str] = []
+        current = ""
+        for sentence in self.tts.split_sentences(document, max_chars=self.unit_chars):
+            if current and len(current) + len(sentence) + 1 > self.unit_chars:
+                units.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            units.append(current)
+        return units
+
+    def create_job(self, user_id: int, texts: Optional[List[str]] = None, document: Optional[str] = None,
+                   language: str = 'lez') -> BatchJob:
+        """
+        Создаёт задание и ставит все его фрагменты в очередь
+
+        Raises:
+            ValueError: Нет текстов или их больше max_items
+            AdmissionError: Задание не допущено: квота полосы bulk, лимит заданий
+                или частота запросов пользователя (если в TaskManager настроен контроль допуска)
+        """
+        if document is not None:
+            texts = self.split_document(document)
+        texts = [text.strip() for text in texts or [] if isinstance(text, str) and text.strip()]
+        if not texts:
+            raise ValueError("Задание не содержит текста")
+        if len(texts) > self.max_items:
+            raise ValueError(f"Слишком много элементов ({len(texts)}, максимум {self.max_items})")
+
+        admission = self.task_manager.admission
+        if admission is not None:
+            # Задание занимает слот пользователя до завершения всех фрагментов
+            admission.admit_job(user_id, texts, self.task_manager.scheduler.qsize(BULK))
+
+        self._evict_expired()
+        job = BatchJob(str(uuid.uuid4()), user_id, language, texts)
+        unit_ids = [f"{job.job_id}-{i:04d}" for i in range(len(texts))]
+        with self._lock:
+            self._jobs[job.job_id] = job
+            for i, unit_id in enumerate(unit_ids):
+                self._units[unit_id] = (job, i)
+        self.logger.info(f"Пакетное задание {job.job_id}: {len(texts)} элементов")
+        for unit_id, text in zip(unit_ids, texts):
+            self.task_manager.submit_task(unit_id, text, language, user_id, priority=BULK, admit=False)
+        return job
+
+    def get_job(self, job_id: str, user_id: int) -> Optional[BatchJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def active_jobs(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.done)
+
+    def _on_task_finished(self, task_id: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            unit = self._units.pop(task_id, None)
+        if unit is None:
+            return
+        job, index = unit
+        # Результат фрагмента нужен только заданию, клиент его не запрашивает
+        self.task_manager.pop_task_result(task_id)
+        with self._lock:
+            item = job.items[index]
+            if result['status'] == 'success':
+                item['status'] = 'success'
+                item['audio_path'] = result['audio_path']
+                job.completed += 1
+            else:
+                item['status'] = 'error'
+                item['error'] = result.get('error')
+                job.failed += 1
+            finished = job.done
+            if finished:
+                job.finished_at = time.monotonic()
+        if finished and self.task_manager.admission is not None:
+            self.task_manager.admission.release_job(job.user_id)
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at is not None and now - job.finished_at > self.ttl
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _item_paths(self, job: BatchJob):
+        for item in job.items:
+            if item['status'] != 'success':
+                continue
+            path = self.audio_manager.find_audio(item['audio_path'])
+            if path is not None:
+                yield item, path
+
+    def iter_zip(self, job: BatchJob) -> Iterator[bytes]:
+        """Потоковый zip (без сжатия - WAV почти не сжимается) с файлами элементов и manifest.json"""
+        stream = _ZipStream()
+        with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for item, path in self._item_paths(job):
+                arcname = f"{item['index'] + 1:04d}{path.suffix}"
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime(path.stat().st_mtime)[:6])
+                with open(path, 'rb') as src, archive.open(info, mode='w', force_zip64=True) as dest:
+                    while True:
+                        block = src.read(STREAM_BLOCK_FRAMES)
+                        if not block:
+                            break
+                        dest.write(block)
+                        yield stream.drain()
+            manifest = job.summary()
+            for entry, item in zip(manifest['items'], job.items):
+                entry['text'] = item['text']
+            archive.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+        yield stream.drain()
+
+    def iter_concatenated_wav(self, job: BatchJob, gap_ms: int = 300) -> Iterator[bytes]:
+        """
+        Один WAV из всех успешных элементов по порядку, с паузой gap_ms между ними
+
+        Проверки выполняются до начала ответа, а не внутри генератора: после
+        отправки заголовков ошибку уже не вернуть клиенту.
+
+        Raises:
+            ValueError: Элементы с разной частотой или числом каналов либо итог больше 4 ГиБ
+        """
+        files = [(path, sf.info(str(path))) for _, path in self._item_paths(job)]
+        if not files:
+            return iter(())
+        formats = {(info.samplerate, info.channels) for _, info in files}
+        if len(formats) != 1:
+            raise ValueError(f"Элементы задания в разных форматах {sorted(formats)}, склейка невозможна")
+        sample_rate, channels = formats.pop()
+        gap = np.zeros(int(sample_rate * gap_ms / 1000) * channels, dtype='<i2').tobytes()
+        data_size = sum(info.frames * 2 * channels for _, info in files) + len(gap) * (len(files) - 1)
+        if data_size > MAX_WAV_DATA_SIZE:
+            raise ValueError(f"Склеенное аудио ({data_size / 1024 ** 3:.1f} ГиБ) не помещается в WAV, "
+                             f"скачайте задание в zip")
+        return self._concatenate(files, gap, wav_header(sample_rate, data_size, channels))
+
+    @staticmethod
+    def _concatenate(files, gap: bytes, header: bytes) -> Iterator[bytes]:
+        """Отдаёт заголовок и PCM файлов, разделённых паузой gap"""
+        yield header
+        for i, (path, _) in enumerate(files):
+            if i:
+                yield gap
+            for block in sf.blocks(str(path), blocksize=STREAM_BLOCK_FRAMES, dtype='int16', always_2d=False):
+                yield block.astype('<i2', copy=False).tobytes()
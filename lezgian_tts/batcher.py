@@ -0,0 +1,93 @@
+import logging
+import queue
+import time
+from concurrent.futures import Future
+from threading import Thread
+from typing import Dict, List, Optional, Tuple
+
+
+class InferenceBatcher:
+    """
+    Планировщик динамических микропакетов для модели TTS
+
+    Собирает запросы из очереди в течение окна max_wait_ms (или до max_batch_size),
+    группирует их по длине в токенах, чтобы уменьшить паддинг, и выполняет
+    каждую группу одним пакетным вызовом LezgianTTS.synthesize_batch.
+    """
+
+    def __init__(self, tts, max_batch_size: int = 8, max_wait_ms: float = 20.0,
+                 max_padding_ratio: float = 0.25, logger: Optional[logging.Logger] = None):
+        self.tts = tts
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_padding_ratio = max_padding_ratio
+        self.logger = logger or logging.getLogger(__name__)
+        self._queue: "queue.Queue[Optional[Tuple[str, int, Future]]]" = queue.Queue()
+        self._running = True
+        self._worker = Thread(target=self._run, name="tts-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        if not self._running:
+            future.set_exception(RuntimeError("Планировщик пакетов остановлен"))
+            return future
+        self._queue.put((text, self.tts.estimate_tokens(text), future))
+        return future
+
+    def synthesize(self, text: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        return self.submit(text).result(timeout)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._running = False
+        self._queue.put(None)
+        if wait:
+            self._worker.join()
+
+    def _collect(self) -> List[Tuple[str, int, Future]]:
+        item = self._queue.get()
+        if item is None:
+            return []
+        items = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            items.append(item)
+        return items
+
+    def _group(self, items: List[Tuple[str, int, Future]]) -> List[List[Tuple[str, int, Future]]]:
+        # Сортируем по длине и режем на группы, внутри которых паддинг не превышает max_padding_ratio
+        groups: List[List[Tuple[str, int, Future]]] = []
+        for item in sorted(items, key=lambda it: it[1]):
+            if groups and item[1] <= groups[-1][0][1] * (1 + self.max_padding_ratio):
+                groups[-1].append(item)
+            else:
+                groups.append([item])
+        return groups
+
+    def _run(self) -> None:
+        while self._running or not self._queue.empty():
+            items = self._collect()
+            if not items:
+                continue
+            for group in self._group(items):
+                texts = [text for text, _, _ in group]
+                try:
+                    speeches = self.tts.synthesize_batch(texts)
+                except Exception as e:
+                    self.logger.error(f"Ошибка пакетного синтеза: {str(e)}", exc_info=True)
+                    speeches = [None] * len(group)
+                for (_, _, future), speech in zip(group, speeches):
+                    future.set_result(speech)
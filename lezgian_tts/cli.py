@@ -0,0 +1,313 @@
+"""
+Пакетный синтез корпуса без веб-приложения и БД
+
+Читает корпус (TXT - одна реплика на строку, или JSONL с полями id и text),
+распределяет реплики по пулу процессов - в каждом своя модель и заданное
+число потоков torch - и пишет аудио и manifest.jsonl (длительность, RTF,
+sha256 файла). Повторный запуск с тем же каталогом пропускает реплики,
+уже записанные в манифест, поэтому прерванный прогон можно продолжить.
+
+    lezgian-tts-corpus corpus.txt -o out --workers 4 --threads 2
+    python -m lezgian_tts.cli dictionary.jsonl -o out --format flac --batch-size 8
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .backends import BACKENDS
+
+MANIFEST_NAME = "manifest.jsonl"
+AUDIO_FORMATS = ("wav", "flac", "ogg")
+SAFE_NAME_RE = re.compile(r"[^\w.-]+")
+
+Item = Tuple[str, str]
+
+# Сколько пачек читается наперёд для группировки реплик по длине
+LENGTH_SORT_WINDOW = 32
+
+# Модель процесса-воркера (создаётся в _init_worker)
+_worker_tts = None
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_corpus(path: Path, text_field: str = "text", id_field: str = "id") -> Iterator[Item]:
+    """
+    Реплики корпуса как пары (id, text)
+
+    Для TXT id - номер строки; в JSONL id берётся из id_field, а при его
+    отсутствии тоже используется номер строки. Пустые строки пропускаются.
+    """
+    is_jsonl = path.suffix.lower() in (".jsonl", ".ndjson")
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if is_jsonl:
+                try:
+                    record = json.loads(line)
+                    text = record[text_field]
+                except (ValueError, KeyError, TypeError) as e:
+                    raise ValueError(f"{path}:{line_no}: неверная запись JSONL ({e})") from None
+                item_id = str(record.get(id_field, line_no))
+            else:
+                text, item_id = line, str(line_no)
+            text = str(text).strip()
+            if text:
+                yield item_id, text
+
+
+def load_manifest(path: Path, audio_dir: Path) -> Dict[str, str]:
+    """
+    id готовых реплик -> хэш их текста
+
+    Учитываются только успешные записи, файл которых существует. Оборванная
+    последняя строка (прерывание во время записи) игнорируется.
+    """
+    done: Dict[str, str] = {}
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "success" and (audio_dir / record["path"]).exists():
+                done[record["id"]] = record["text_hash"]
+            else:
+                done.pop(record.get("id"), None)
+    return done
+
+
+def output_name(item_id: str, fmt: str) -> str:
+    safe = SAFE_NAME_RE.sub("_", item_id).strip("._") or "item"
+    if safe != item_id:
+        # id с недопустимыми символами могут совпасть после замены
+        safe = f"{safe}-{text_hash(item_id)[:8]}"
+    return f"{safe}.{fmt}"
+
+
+def _cpu_count() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_worker(model_id: str, backend: str, threads: Optional[int], use_gpu: bool) -> None:
+    global _worker_tts
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    from .synthesizer import LezgianTTS
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _worker_tts = LezgianTTS(model_id=model_id, use_gpu=use_gpu, backend=backend,
+                             logger=logging.getLogger(f"lezgian_tts.cli.worker-{os.getpid()}"))
+
+
+def _synthesize_chunk(items: List[Item], audio_dir: str, fmt: str) -> List[Dict[str, Any]]:
+    """Синтезирует пачку реплик в процессе-воркере и возвращает записи манифеста"""
+    tts = _worker_tts
+    start = time.perf_counter()
+    speeches = tts.synthesize_batch([text for _, text in items])
+    # Реплики пачки близки по длине (см. _chunks), поэтому время делится между ними
+    # пропорционально длине текста
+    elapsed = time.perf_counter() - start
+    total_chars = sum(len(text) for _, text in items) or 1
+
+    records = []
+    for (item_id, text), speech in zip(items, speeches):
+        record: Dict[str, Any] = {"id": item_id, "text_hash": text_hash(text), "chars": len(text)}
+        if speech is None:
+            record.update(status="error", error="Синтез не удался")
+            records.append(record)
+            continue
+        filename = output_name(item_id, fmt)
+        target = Path(audio_dir) / filename
+        tmp_path = target.with_name(f".{filename}.tmp")
+        try:
+            buffer = tts.encode_audio(speech, fmt)
+            if buffer is None:
+                raise RuntimeError("Не удалось закодировать аудио")
+            with open(tmp_path, "wb") as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp_path, target)
+        except Exception as e:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            record.update(status="error", error=str(e))
+            records.append(record)
+            continue
+        duration = tts.audio_duration(speech)
+        seconds = elapsed * len(text) / total_chars
+        record.update(
+            status="success",
+            path=filename,
+            duration=round(duration, 3),
+            sampling_rate=speech["sampling_rate"],
+            synth_seconds=round(seconds, 3),
+            rtf=round(seconds / duration, 4) if duration else None,
+            sha256=file_sha256(target),
+        )
+        records.append(record)
+    return records
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _chunks(items: Iterator[Item], size: int, window: int = LENGTH_SORT_WINDOW) -> Iterator[List[Item]]:
+    """
+    Пачки по size реплик близкой длины
+
+    Корпус читается окнами по size * window реплик; окно сортируется по длине
+    текста и режется на пачки, поэтому модель почти не тратит время на паддинг,
+    а корпус не читается в память целиком.
+    """
+    buffer: List[Item] = []
+
+    def flush() -> Iterator[List[Item]]:
+        buffer.sort(key=lambda item: len(item[1]))
+        for start in range(0, len(buffer), size):
+            yield buffer[start:start + size]
+        buffer.clear()
+
+    for item in items:
+        buffer.append(item)
+        if len(buffer) >= size * window:
+            yield from flush()
+    if buffer:
+        yield from flush()
+
+
+def run(args: argparse.Namespace) -> int:
+    logger = logging.getLogger("lezgian_tts.cli")
+    output_dir = Path(args.output)
+    audio_dir = output_dir / "audio"
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+
+    done = {} if args.overwrite else load_manifest(manifest_path, audio_dir)
+    seen = set()
+    skipped = 0
+
+    def pending_items() -> Iterator[Item]:
+        nonlocal skipped
+        for item_id, text in read_corpus(Path(args.input), args.text_field, args.id_field):
+            if item_id in seen:
+                logger.warning(f"Повторный id '{item_id}' пропущен")
+                continue
+            seen.add(item_id)
+            if done.get(item_id) == text_hash(text):
+                skipped += 1
+                continue
+            yield item_id, text
+
+    stats = {"success": 0, "error": 0, "audio_seconds": 0.0}
+    next_log = args.log_every
+    start = time.perf_counter()
+    manifest_mode = "w" if args.overwrite else "a"
+    executor = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(args.model, args.backend, args.threads, args.gpu),
+    )
+    with executor, open(manifest_path, manifest_mode, encoding="utf-8") as manifest:
+        if manifest.tell() and not _ends_with_newline(manifest_path):
+            # Завершаем оборванную строку, чтобы новые записи не склеились с ней
+            manifest.write("\n")
+        in_flight = set()
+        chunks = _chunks(pending_items(), args.batch_size)
+
+        def drain(return_when) -> None:
+            nonlocal in_flight, next_log
+            finished, in_flight = wait(in_flight, return_when=return_when)
+            for future in finished:
+                for record in future.result():
+                    stats[record["status"]] += 1
+                    stats["audio_seconds"] += record.get("duration", 0.0)
+                    if record["status"] == "error":
+                        logger.error(f"{record['id']}: {record['error']}")
+                    manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+                # Манифест сбрасывается после каждой пачки: при прерывании теряется не больше пачки
+                manifest.flush()
+                os.fsync(manifest.fileno())
+            processed = stats["success"] + stats["error"]
+            if processed >= next_log:
+                next_log = processed + args.log_every
+                logger.info(f"Готово {processed} реплик ({skipped} пропущено), "
+                            f"{stats['audio_seconds'] / 3600:.2f} ч аудио")
+
+        for chunk in chunks:
+            # Ограничиваем число отправленных пачек, чтобы не читать весь корпус в память
+            if len(in_flight) >= args.workers * 2:
+                drain(FIRST_COMPLETED)
+            in_flight.add(executor.submit(_synthesize_chunk, chunk, str(audio_dir), args.format))
+        while in_flight:
+            drain(FIRST_COMPLETED)
+
+    wall = time.perf_counter() - start
+    logger.info(
+        f"Синтезировано {stats['success']} реплик, ошибок {stats['error']}, пропущено {skipped}; "
+        f"{stats['audio_seconds']:.1f} с аудио за {wall:.1f} с"
+    )
+    return 1 if stats["error"] else 0
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Пакетный синтез корпуса Lezgian TTS")
+    parser.add_argument("input", help="Корпус: .txt (реплика на строку) или .jsonl")
+    parser.add_argument("-o", "--output", required=True, help="Каталог для аудио и manifest.jsonl")
+    parser.add_argument("--model", default=os.getenv("TTS_MODEL_ID", "model"))
+    parser.add_argument("--backend", default=os.getenv("TTS_BACKEND", "eager"), choices=BACKENDS)
+    parser.add_argument("--gpu", action="store_true", help="Синтез на GPU (обычно вместе с --workers 1)")
+    parser.add_argument("--workers", type=int, default=max(_cpu_count() // 2, 1),
+                        help="Число процессов, в каждом своя копия модели")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("TTS_TORCH_THREADS", "0")) or None,
+                        help="Потоков torch на процесс (по умолчанию - ядра поровну между процессами)")
+    parser.add_argument("--batch-size", type=int, default=4, help="Реплик за один вызов модели")
+    parser.add_argument("--format", default="wav", choices=AUDIO_FORMATS)
+    parser.add_argument("--text-field", default="text", help="Поле с текстом в JSONL")
+    parser.add_argument("--id-field", default="id", help="Поле с идентификатором в JSONL")
+    parser.add_argument("--overwrite", action="store_true", help="Синтезировать заново, игнорируя манифест")
+    parser.add_argument("--log-every", type=int, default=500, help="Печатать прогресс каждые N реплик")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.workers < 1 or args.batch_size < 1:
+        parser.error("--workers и --batch-size должны быть положительными")
+    if not args.threads:
+        # Без явного числа потоков torch в каждом процессе берёт все ядра: workers x ядер потоков
+        args.threads = max(_cpu_count() // args.workers, 1)
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,177 @@
+import os
+import time
 import psycopg2
-from typing import Dict, Any, Optional
+from contextlib import contextmanager
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from threading import Condition
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class PoolTimeoutError(PoolError):
+    """Не удалось получить соединение из пула за отведённое время"""
+
 
 class DatabaseManager:
-    def __init__(self, db_config: Dict[str, Any]):
+    def __init__(self, db_config: Dict[str, Any], min_size: int = 1, max_size: int = 10,
+                 timeout: float = 5.0, health_check_interval: float = 30.0, max_idle: float = 300.0):
         self.db_config = db_config
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_idle = max_idle
+        self._idle: List[Tuple[Any, float]] = []
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._cond = Condition()
+        self._pid = os.getpid()
 
-    def connect(self):
+    def _open(self):
         return psycopg2.connect(**self.db_config)
 
+    def _check_fork(self) -> None:
+        # После fork соединения родителя использовать нельзя: сокет общий
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._size = 0
+            self._in_use = 0
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def connect(self, timeout: Optional[float] = None):
+        """Берёт соединение из пула (или открывает новое, если пул не заполнен)"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._cond:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._size < self.max_size:
+                    conn, last_used = None, 0.0
+                    self._size += 1
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"Нет свободных соединений с БД (занято {self._in_use} из {self.max_size})"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        if conn is not None and self._is_healthy(conn, last_used):
+            return conn
+        if conn is not None:
+            self._close_quietly(conn)
+        try:
+            return self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def close_connection(self, conn, discard: bool = False):
+        """Возвращает соединение в пул (незавершённая транзакция откатывается)"""
+        if not conn:
+            return
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            if discard or conn.closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._prune_idle()
+            self._cond.notify()
+
+    def _prune_idle(self) -> None:
+        now = time.monotonic()
+        while len(self._idle) > 0 and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.pop(0)
+            self._size -= 1
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Соединение из пула на время блока: commit при успехе, rollback при исключении"""
+        conn = self.connect(timeout)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self.close_connection(conn)
+
+    def warmup(self) -> None:
+        """Открывает min_size соединений заранее"""
+        conns = []
+        try:
+            for _ in range(self.min_size):
+                conns.append(self.connect())
+        finally:
+            for conn in conns:
+                self.close_connection(conn)
+
+    def close_all(self) -> None:
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                self._close_quietly(conn)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'max_size': self.max_size,
+            }
+
     def execute_query(self, query: str, params: tuple = (), conn=None):
         own_conn = False
         if conn is None:
@@ -19,15 +183,11 @@ class DatabaseManager:
             if cur.description is not None:
                 result = cur.fetchall()
             else:
-                if own_conn:
-                    conn.commit()
                 result = None
+            if own_conn:
+                conn.commit()
             return result
         finally:
             cur.close()
             if own_conn:
-                conn.close()
-
-    def close_connection(self, conn):
-        if conn:
-            conn.close() 
\ No newline at end of file
+                self.close_connection(conn)
@@ -0,0 +1,95 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(create_dttm: datetime, request_id: int) -> str:
+    return f"{create_dttm.isoformat()},{request_id}"
+
+
+def parse_cursor(value: Optional[str]) -> Optional[Cursor]:
+    """Разбирает курсор вида '<create_dttm ISO>,<id>'; ValueError при неверном формате"""
+    if not value:
+        return None
+    created, _, request_id = value.rpartition(",")
+    return datetime.fromisoformat(created), int(request_id)
+
+
+def build_history_query(user_id: int, before: Optional[Cursor], limit: int, preview: Optional[int],
+                        placeholder: str = "%s") -> Tuple[str, List[Any]]:
+    """
+    Запрос страницы истории пользователя (keyset-пагинация по (create_dttm, id))
+
+    Сортировка совпадает с индексом idx_synth_user_created, поэтому Postgres
+    читает ровно limit + 1 строк индекса, без сортировки всей истории.
+
+    Args:
+        user_id (int): Пользователь
+        before (Cursor): Вернуть записи строго раньше курсора; None - с начала
+        limit (int): Размер страницы (запрашивается на одну строку больше)
+        preview (int): Обрезать текст до preview символов; None - полный текст
+        placeholder (str): "%s" для psycopg2 или "$" для asyncpg ($1, $2, ...)
+
+    Returns:
+        Tuple[str, List]: Текст запроса и параметры
+    """
+    params: List[Any] = []
+
+    def arg(value: Any) -> str:
+        params.append(value)
+        return f"${len(params)}" if placeholder == "$" else "%s"
+
+    text_column = "s.input_text" if preview is None else f"left(s.input_text, {arg(preview)})"
+    where = f"s.user_id = {arg(user_id)}"
+    if before is not None:
+        where += f" AND (s.create_dttm, s.id) < ({arg(before[0])}, {arg(before[1])})"
+    query = f"""
+        SELECT
+            s.id,
+            s.create_dttm,
+            {text_column},
+            length(s.input_text),
+            s.language_code,
+            s.status,
+            r.audio_file_path,
+            r.duration_seconds
+        FROM SpeechSynthesisRequest s
+        LEFT JOIN SpeechSynthesisResult r ON s.id = r.request_id
+        WHERE {where}
+        ORDER BY s.create_dttm DESC, s.id DESC
+        LIMIT {arg(limit + 1)}
+    """
+    return query, params
+
+
+def page_params(args: Dict[str, Any]) -> Tuple[Optional[Cursor], int, Optional[int]]:
+    """before, limit и preview из параметров запроса; ValueError при неверных значениях"""
+    before = parse_cursor(args.get("before"))
+    limit = min(max(int(args.get("limit") or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    preview = args.get("preview")
+    preview = max(int(preview), 1) if preview else None
+    return before, limit, preview
+
+
+def format_history(rows: Sequence[Sequence[Any]], limit: int,
+                   audio_url: Callable[[str], str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Элементы ответа /api/history и курсор следующей страницы (None - страница последняя)"""
+    history = []
+    for row in rows[:limit]:
+        history.append({
+            'id': row[0],
+            'date': row[1].strftime('%d.%m.%Y %H:%M'),
+            'text': row[2],
+            'truncated': len(row[2]) < row[3],
+            'language': row[4],
+            'status': row[5],
+            'audio_path': audio_url(Path(row[6]).name) if row[6] else None,
+            'duration': row[7]
+        })
+    next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return history, next_cursor
@@ -0,0 +1,241 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from multiprocessing import get_context
+from multiprocessing.connection import Connection, Listener, answer_challenge, deliver_challenge
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from .backends import BACKENDS
+from .synthesizer import LezgianTTS
+
+DEFAULT_SOCKET_PATH = "/tmp/lezgian_tts.sock"
+
+
+class InferenceServer:
+    """
+    Сервер инференса: одна загрузка модели на несколько процессов
+
+    Модель загружается в родительском процессе, после чего создаются воркеры
+    через fork - веса разделяются между ними по принципу copy-on-write.
+    Каждый воркер принимает запросы с общего Unix-сокета и выполняет их
+    с заданным числом потоков torch. Число потоков задаётся в родителе до
+    загрузки модели: пул потоков, созданный до fork, в дочернем процессе
+    перенастраивать нельзя. Пока все воркеры заняты, соединения ждут в
+    очереди сокета длиной backlog.
+    """
+
+    def __init__(self, model_id: str = "model", socket_path: str = DEFAULT_SOCKET_PATH,
+                 num_workers: int = 2, torch_threads: Optional[int] = None,
+                 authkey: Optional[bytes] = None, logger: Optional[logging.Logger] = None,
+                 backend: str = "eager", backlog: int = 128):
+        self.model_id = model_id
+        self.backend = backend
+        self.socket_path = socket_path
+        self.num_workers = num_workers
+        self.torch_threads = torch_threads
+        self.authkey = authkey
+        self.backlog = backlog
+        self.logger = logger or logging.getLogger(__name__)
+        self.tts: Optional[LezgianTTS] = None
+        self._workers: List[Any] = []
+        self._running = False
+
+    def serve_forever(self) -> None:
+        if self.torch_threads:
+            import torch
+            torch.set_num_threads(self.torch_threads)
+        self.tts = LezgianTTS(model_id=self.model_id, logger=self.logger, backend=self.backend)
+        model = getattr(self.tts.synthesiser, "model", None)
+        if model is not None and hasattr(model, "eval"):
+            model.eval()
+        # Объекты, созданные до fork, не трогаем сборщиком мусора - иначе страницы копируются
+        gc.freeze()
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener = Listener(self.socket_path, family="AF_UNIX", backlog=self.backlog, authkey=self.authkey)
+        os.chmod(self.socket_path, 0o600)
+
+        ctx = get_context("fork")
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        self.logger.info(
+            f"Сервер инференса слушает {self.socket_path} "
+            f"(процессов: {self.num_workers}, потоков torch: {self.torch_threads or 'по умолчанию'})"
+        )
+        try:
+            self._workers = [self._spawn(ctx, listener, i) for i in range(self.num_workers)]
+            while self._running:
+                for i, process in enumerate(self._workers):
+                    if not process.is_alive():
+                        self.logger.warning(f"Воркер инференса {i} завершился (код {process.exitcode}), перезапуск")
+                        self._workers[i] = self._spawn(ctx, listener, i)
+                time.sleep(1.0)
+        finally:
+            for process in self._workers:
+                process.terminate()
+            for process in self._workers:
+                process.join(timeout=5)
+            listener.close()
+
+    def _stop(self, signum, frame) -> None:
+        self._running = False
+
+    def _spawn(self, ctx, listener, index: int):
+        process = ctx.Process(target=self._worker_loop, args=(listener, index), name=f"tts-inference-{index}", daemon=True)
+        process.start()
+        return process
+
+    def _worker_loop(self, listener, index: int) -> None:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                self.logger.error(f"Воркер инференса {index}: ошибка соединения: {str(e)}")
+                continue
+            with conn:
+                try:
+                    request = conn.recv()
+                    conn.send(self._handle(request))
+                except (EOFError, OSError):
+                    continue
+
+    def _handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            if request.get("op") == "info":
+                return {"result": self.tts.get_model_info()}
+            inputs = request["inputs"]
+            if request.get("op") == "batch":
+                return {"result": self.tts.infer_batch(inputs)}
+            kwargs = request.get("kwargs", {})
+            return {"result": self.tts.synthesiser(inputs, **kwargs)}
+        except Exception as e:
+            self.logger.error(f"Ошибка инференса: {str(e)}", exc_info=True)
+            return {"error": str(e)}
+
+
+class RemoteSynthesiser:
+    """
+    Заменитель HF pipeline, который отправляет вызовы на InferenceServer
+
+    Подключение ограничено connect_timeout и повторяется до connect_retries раз
+    с экспоненциальной паузой (сервер перезапускается или очередь сокета полна);
+    ответ ожидается не дольше timeout.
+    """
+
+    tokenizer = None
+
+    def __init__(self, socket_path: str, authkey: Optional[bytes] = None, timeout: float = 120.0,
+                 connect_timeout: float = 5.0, connect_retries: int = 3):
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.connect_retries = connect_retries
+        self._model = None
+
+    def _connect_once(self) -> Connection:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.connect_timeout)
+            sock.connect(self.socket_path)
+            sock.settimeout(None)
+            conn = Connection(sock.detach())
+        finally:
+            sock.close()
+        try:
+            if self.authkey is not None:
+                # Рукопожатие начинается, когда воркер примет соединение
+                if not conn.poll(self.connect_timeout):
+                    raise TimeoutError(f"Сервер инференса не принял соединение за {self.connect_timeout} с")
+                answer_challenge(conn, self.authkey)
+                deliver_challenge(conn, self.authkey)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _connect(self) -> Connection:
+        delay = 0.1
+        for attempt in range(self.connect_retries + 1):
+            try:
+                return self._connect_once()
+            except (OSError, TimeoutError) as e:
+                if attempt == self.connect_retries:
+                    raise ConnectionError(f"Сервер инференса {self.socket_path} недоступен: {str(e)}") from e
+                time.sleep(delay)
+                delay *= 2
+
+    def _request(self, payload: Dict[str, Any]) -> Any:
+        with self._connect() as conn:
+            conn.send(payload)
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Сервер инференса не ответил за {self.timeout} с")
+            response = conn.recv()
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def __call__(self, inputs, **kwargs):
+        return self._request({"op": "synthesize", "inputs": inputs, "kwargs": kwargs})
+
+    def trimmed_batch(self, texts: List[str]) -> List[Dict]:
+        return self._request({"op": "batch", "inputs": texts})
+
+    @property
+    def model(self):
+        # get_model_info ожидает synthesiser.model.config.sampling_rate
+        if self._model is None:
+            info = self._request({"op": "info"})
+            self._model = SimpleNamespace(config=SimpleNamespace(sampling_rate=info.get("sampling_rate")))
+        return self._model
+
+
+class InferenceClient(LezgianTTS):
+    """LezgianTTS, который не загружает модель, а обращается к InferenceServer"""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, model_id: str = "model",
+                 authkey: Optional[bytes] = None, timeout: float = 120.0,
+                 logger: Optional[logging.Logger] = None):
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self.timeout = timeout
+        super().__init__(model_id=model_id, use_gpu=False, logger=logger)
+
+    def _initialize_model(self) -> None:
+        self.synthesiser = RemoteSynthesiser(self.socket_path, self.authkey, self.timeout)
+        self.logger.info(f"Синтез выполняется сервером инференса {self.socket_path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сервер инференса Lezgian TTS")
+    parser.add_argument("--model", default=os.getenv("TTS_MODEL_ID", "model"))
+    parser.add_argument("--socket", default=os.getenv("TTS_INFERENCE_SOCKET", DEFAULT_SOCKET_PATH))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("TTS_INFERENCE_WORKERS", "2")))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("TTS_TORCH_THREADS", "0")) or None)
+    parser.add_argument("--backend", default=os.getenv("TTS_BACKEND", "eager"), choices=BACKENDS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    authkey = os.getenv("TTS_INFERENCE_AUTHKEY")
+    server = InferenceServer(
+        model_id=args.model,
+        socket_path=args.socket,
+        num_workers=args.workers,
+        torch_threads=args.threads,
+        backend=args.backend,
+        authkey=authkey.encode() if authkey else None
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
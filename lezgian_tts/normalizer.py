@@ -0,0 +1,216 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+PALOCHKA = "Ӏ"
+
+# Символы, которыми на практике набирают палочку: латинские I и l, цифра 1,
+# вертикальная черта, строчная ӏ и украинские І/і
+PALOCHKA_VARIANTS = "Il1|ӏІі"
+# Палочка встречается только после смычных к, п, т, ц, ч (кӀ, пӀ, тӀ, цӀ, чӀ)
+PALOCHKA_BASES = "кптцчКПТЦЧ"
+
+# Посимвольная замена до разбора: типографские кавычки, тире, неразрывные и невидимые символы
+CHAR_MAP = str.maketrans({
+    "\u00a0": " ", "\u2009": " ", "\u202f": " ", "\t": " ",
+    "\u00ad": None, "\u200b": None, "\u200c": None, "\u200d": None, "\ufeff": None,
+    "«": '"', "»": '"', "„": '"', "“": '"', "”": '"',
+    "‘": "'", "’": "'",
+    "–": "—", "‒": "—", "―": "—",
+})
+
+DIGITS = ["нул", "сад", "кьвед", "пуд", "кьуд", "вад", "ругуд", "ирид", "муьжуьд", "кӀуьд"]
+TEENS = ["цуд", "цуьсад", "цуькьвед", "цуьпуд", "цуькьуд", "цуьвад", "цуьругуд", "цуьирид", "цуьмуьжуьд", "цуькӀуьд"]
+# Счёт двадцатками: 20, 40, 60, 80 и их формы с соединительным -ни (къад + ни -> къанни)
+SCORES = {1: "къад", 2: "яхцӀур", 3: "пудкъад", 4: "кьудкъад"}
+SCORES_JOINED = {1: "къанни", 2: "яхцӀурни", 3: "пудкъанни", 4: "кьудкъанни"}
+
+DEFAULT_ABBREVIATIONS: Dict[str, str] = {
+    "%": "процент",
+    "№": "номер",
+    "км": "километр",
+    "кг": "килограмм",
+    "см": "сантиметр",
+    "мм": "миллиметр",
+    "т.ж.": "гьакӀни",
+    "й.": "йис",
+}
+
+NUMBER_LIMIT = 10 ** 12
+
+# Десятичная дробь читается через "запятая": 3,5 - пуд запятая вад
+DECIMAL_SEPARATOR = "запятая"
+SIGNS = {"-": "минус", "−": "минус", "+": "плюс"}
+PUNCTUATION = ".,!?;:…"
+
+# Число с разделением разрядов пробелом (неразрывные пробелы уже заменены CHAR_MAP): 100 000, 1 000 000
+NUMBER = r"(?<!\d)\d{1,3}(?: \d{3})+(?!\d)|\d+"
+MONTHS = ["январь", "февраль", "март", "апрель", "май", "июнь",
+          "июль", "август", "сентябрь", "октябрь", "ноябрь", "декабрь"]
+
+
+def _below_hundred(n: int) -> str:
+    if n < 10:
+        return DIGITS[n]
+    if n < 20:
+        return TEENS[n - 10]
+    scores, rest = divmod(n, 20)
+    if not rest:
+        return SCORES[scores]
+    return f"{SCORES_JOINED[scores]} {_below_hundred(rest)}"
+
+
+def _attributive(words: str) -> str:
+    # Перед счётным словом "сад" и "кьвед" сокращаются: са миллион, кьве виш, кьве агъзур
+    return words[:-1] if words.endswith(("сад", "кьвед")) else words
+
+
+def number_to_words(n: int) -> str:
+    """
+    Количественное числительное словами (двадцатеричный счёт)
+
+    21 - къанни сад, 45 - яхцӀурни вад, 200 - кьве виш, 1990 - агъзурни кӀуьд вишни кьудкъанни цуд.
+    Числа от NUMBER_LIMIT и больше читаются по цифрам.
+    """
+    if n >= NUMBER_LIMIT:
+        return " ".join(DIGITS[int(d)] for d in str(n))
+    if n < 100:
+        return _below_hundred(n)
+    parts = []
+    for size, word in ((10 ** 9, "миллиард"), (10 ** 6, "миллион"), (1000, "агъзур"), (100, "виш")):
+        count, n = divmod(n, size)
+        if not count:
+            continue
+        part = word if count == 1 and size <= 1000 else f"{_attributive(number_to_words(count))} {word}"
+        parts.append(part + ("ни" if n else ""))
+    if n:
+        parts.append(_below_hundred(n))
+    return " ".join(parts)
+
+
+def digits_to_words(digits: str) -> str:
+    """
+    Группа цифр после разделителя (дробная часть, минуты, части даты)
+
+    Ведущие нули читаются по одному: 05 - нул вад, 00 - нул нул.
+    """
+    stripped = digits.lstrip("0")
+    zeros = ["нул"] * (len(digits) - len(stripped))
+    return " ".join(zeros + ([number_to_words(int(stripped))] if stripped else []))
+
+
+class LezgianNormalizer:
+    """
+    Нормализация лезгинского текста в каноническую форму за один проход
+
+    Все правила собраны в одно регулярное выражение с именованными группами,
+    поэтому текст сканируется один раз: палочка приводится к Ӏ, числа и
+    сокращения раскрываются словами, пробелы и повторы знаков препинания
+    схлопываются. Числа читаются с учётом разделителей: разряды через пробел
+    (100 000), десятичные дроби (3.5, 1,5), время (12:30), знак (-5, +5),
+    даты (12.05.2024 - день, месяц словом, год), а прочие группы из трёх и
+    более чисел через точку, запятую, двоеточие или косую черту (версии,
+    списки) - по группам через пробел. Результат идемпотентен (normalize(normalize(x)) ==
+    normalize(x)) и кэшируется: одинаковые по смыслу запросы дают один ключ
+    кэша синтеза и одну длину в токенах.
+    """
+
+    def __init__(self, abbreviations: Optional[Dict[str, str]] = None, cache_size: int = 4096):
+        self.abbreviations = dict(DEFAULT_ABBREVIATIONS)
+        if abbreviations:
+            self.abbreviations.update(abbreviations)
+        # Длинные сокращения проверяются раньше своих префиксов
+        abbreviation_pattern = "|".join(
+            self._abbreviation_pattern(key) for key in sorted(self.abbreviations, key=len, reverse=True)
+        )
+        # Предпроверка первого символа: позиции, с которых не начинается ни одно правило,
+        # отсекаются одним классом символов без перебора альтернатив
+        first_chars = set(PALOCHKA_VARIANTS) | {key[0] for key in self.abbreviations} | set(PUNCTUATION) | set(SIGNS)
+        first_class = re.escape("".join(sorted(first_chars)))
+        letter_variants = re.escape(PALOCHKA_VARIANTS.replace("1", ""))
+        self._pattern = re.compile(
+            rf"(?=[{first_class}\d\s])(?:"
+            # Цифра 1 - палочка, только если за ней не идёт число: "к1ел", но "к12"
+            rf"(?P<palochka>(?<=[{PALOCHKA_BASES}])(?:[{letter_variants}]|1(?!\d)))"
+            rf"|(?P<abbr>{abbreviation_pattern})"
+            r"|(?P<date>(?<!\d)(?<!\d[.,:/])(?:0?[1-9]|[12]\d|3[01])(?P<datesep>[./])(?:0?[1-9]|1[0-2])(?P=datesep)"
+            r"(?:\d{4}|\d{2})(?!\d|[.,:/]\d))"
+            r"|(?P<numseq>\d+(?:[.,:/]\d+){2,})"
+            r"|(?P<time>(?:[01]?\d|2[0-3]):[0-5]\d(?![\d:]))"
+            rf"|(?P<decimal>(?:{NUMBER})[.,]\d+)"
+            rf"|(?P<sign>(?<!\w)[{re.escape(''.join(SIGNS))}](?=\d))"
+            rf"|(?P<number>{NUMBER})"
+            # Повторы знака (в том числе через пробел) схлопываются в один, многоточие - в "…"
+            r"|(?P<punct>\s*(?:(?P<ellipsis>(?:\.{3,}|…)(?:\s*(?:\.{2,}|…))*)|(?P<mark>[.,!?;:])(?:\s*(?P=mark))*))"
+            # Одиночные пробелы не трогаем, чтобы не вызывать замену на каждом слове
+            r"|(?P<space>\s{2,}|[^\S ])"
+            r")"
+        )
+        self._symbol_starts = {key[0] for key in self.abbreviations if not key[0].isalnum()}
+        # Совпадение может содержать пробелы перед точками ("й ."), ищем без них
+        self._expansions = {re.sub(r"\s+", "", key): value for key, value in self.abbreviations.items()}
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    @staticmethod
+    def _abbreviation_pattern(key: str) -> str:
+        # Границы слова нужны только буквенным сокращениям: "50%" и "№5" пишутся слитно,
+        # а перед единицей измерения может стоять число: "5км"
+        # Пробелы перед знаками внутри сокращения допускаются: правило punct всё равно
+        # убрало бы их, и повторная нормализация раскрыла бы "й ." как "й."
+        pattern = "".join(
+            rf"\s*{re.escape(char)}" if i and char in PUNCTUATION else re.escape(char) for i, char in enumerate(key)
+        )
+        if key[0].isalnum():
+            pattern = rf"(?<![^\W\d_]){pattern}"
+        if key[-1].isalnum():
+            # За сокращением может сразу идти число: "км5"
+            pattern = rf"{pattern}(?![^\W\d_])"
+        return pattern
+
+    def _spaced(self, match: "re.Match", words: str, state: List[int]) -> str:
+        # Слова отделяются от вплотную примыкающих букв, цифр и палочки: "5км" -> "вад километр".
+        # Между двумя раскрытиями пробел ставит левое, state[0] - где оно его поставило
+        text, start, end = match.string, match.start(), match.end()
+        if start > 0 and text[start - 1].isalpha() and state[0] != start:
+            words = " " + words
+        if end < len(text) and (text[end].isalnum() or text[end] in self._symbol_starts
+                                or text[end] in PALOCHKA_VARIANTS):
+            words += " "
+            state[0] = end
+        return words
+
+    def _replace(self, match: "re.Match", state: List[int]) -> str:
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "palochka":
+            return PALOCHKA
+        if kind == "abbr":
+            return self._spaced(match, self._expansions[re.sub(r"\s+", "", value)], state)
+        if kind == "number":
+            return self._spaced(match, number_to_words(int(value.replace(" ", ""))), state)
+        if kind == "date":
+            day, month, year = re.split(r"[./]", value)
+            words = f"{number_to_words(int(day))} {MONTHS[int(month) - 1]} {number_to_words(int(year))}"
+            return self._spaced(match, words, state)
+        if kind == "numseq":
+            words = " ".join(digits_to_words(part) for part in re.split(r"[.,:/]", value))
+            return self._spaced(match, words, state)
+        if kind == "time":
+            hours, minutes = value.split(":")
+            return self._spaced(match, f"{number_to_words(int(hours))} {digits_to_words(minutes)}", state)
+        if kind == "decimal":
+            whole, fraction = re.split(r"[.,]", value)
+            words = f"{number_to_words(int(whole.replace(' ', '')))} {DECIMAL_SEPARATOR} {digits_to_words(fraction)}"
+            return self._spaced(match, words, state)
+        if kind == "sign":
+            return SIGNS[value] + " "
+        if kind == "punct":
+            return "…" if match.group("ellipsis") else match.group("mark")
+        return " "
+
+    def _normalize(self, text: str) -> str:
+        state = [-1]
+        return self._pattern.sub(lambda match: self._replace(match, state), text.translate(CHAR_MAP)).strip()
+
+    def cache_info(self):
+        return self.normalize.cache_info()
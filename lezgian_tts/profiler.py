@@ -0,0 +1,209 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+TASK_ID_RE = re.compile(r"[\w-]+")
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+class RequestProfiler:
+    """
+    Профилирование отдельных задач синтеза по запросу или по выборке
+
+    Для профилируемой задачи в потоке воркера включается cProfile (и, если
+    задано, torch.profiler), а tracemalloc отслеживает пик памяти. Длительности
+    этапов LezgianTTS и TaskManager (inference, prepare, encode, db_start, ...)
+    собираются через их stage_observers для текущего потока. Результат
+    сохраняется в output_dir под task_id:
+
+      - <task_id>.json - сводка: этапы, топ функций, пик памяти, топ аллокаций;
+      - <task_id>.prof - дамп pstats (snakeviz, python -m pstats);
+      - <task_id>.torch.json - трасса torch.profiler для chrome://tracing.
+
+    cProfile и сводка этапов видят только поток воркера: при включённом
+    InferenceBatcher инференс идёт в его потоке и виден лишь как ожидание
+    внутри этапа задачи (и в трассе torch).
+
+    tracemalloc в каждый момент измеряет не больше одной задачи: пик считается
+    от объёма памяти на старте задачи, а задачи, профилируемые одновременно с
+    ней, сохраняются без пика памяти (peak_memory_bytes = None). tracemalloc
+    видит аллокации всех потоков, поэтому в пик попадают и непрофилируемые
+    задачи, выполняемые параллельно. Пока он включён, каждая аллокация Python
+    во всём процессе записывает трассу из 10 кадров: Python-часть синтеза во
+    всех воркерах заметно замедляется (буферы тензоров torch не отслеживаются),
+    а трассы занимают дополнительную память. При sample_rate > 0
+    эти издержки ложатся на выборку рабочих запросов, поэтому доля выборки
+    должна быть малой (порядка 0.001-0.01).
+    """
+
+    def __init__(self, output_dir: Path, sample_rate: float = 0.0, use_torch: bool = False,
+                 top_n: int = 40, max_profiles: int = 200, logger: Optional[logging.Logger] = None):
+        self.output_dir = output_dir
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.sample_rate = sample_rate
+        self.use_torch = use_torch
+        self.top_n = top_n
+        self.max_profiles = max_profiles
+        self.logger = logger or logging.getLogger(__name__)
+        self.profiles_total = 0
+        self._local = threading.local()
+        self._lock = Lock()
+        # Владелец tracemalloc: пик одной задачи не смешивается с пиком другой
+        self._memory_lock = Lock()
+
+    def should_profile(self, requested: bool = False) -> bool:
+        return requested or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        """Наблюдатель этапов: учитывает этап, если текущий поток профилирует задачу"""
+        stages = getattr(self._local, "stages", None)
+        if stages is not None:
+            stages.append((stage, seconds))
+
+    @contextmanager
+    def profile(self, task_id: str, meta: Optional[Dict[str, Any]] = None):
+        baseline = self._start_tracemalloc()
+        self._local.stages = []
+        torch_profiler = self._start_torch()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            wall = time.perf_counter() - started
+            stages, self._local.stages = self._local.stages, None
+            if torch_profiler is not None:
+                torch_profiler.__exit__(None, None, None)
+            try:
+                self._save(task_id, profiler, torch_profiler, stages, wall, baseline, meta or {})
+            except Exception as e:
+                self.logger.error(f"Не удалось сохранить профиль задачи {task_id}: {str(e)}", exc_info=True)
+            finally:
+                if baseline is not None:
+                    self._stop_tracemalloc()
+
+    def _start_tracemalloc(self) -> Optional[int]:
+        """Объём отслеживаемой памяти на старте задачи; None - память измеряет другая задача"""
+        if not self._memory_lock.acquire(blocking=False):
+            return None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def _stop_tracemalloc(self) -> None:
+        tracemalloc.stop()
+        self._memory_lock.release()
+
+    def _start_torch(self):
+        if not self.use_torch:
+            return None
+        try:
+            import torch
+            torch_profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+            torch_profiler.__enter__()
+            return torch_profiler
+        except Exception as e:
+            self.logger.warning(f"torch.profiler недоступен: {str(e)}")
+            return None
+
+    def _save(self, task_id: str, profiler: cProfile.Profile, torch_profiler, stages, wall: float,
+              baseline: Optional[int], meta: Dict[str, Any]) -> None:
+        peak = None
+        allocations = []
+        if baseline is not None:
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            allocations = tracemalloc.take_snapshot().statistics("lineno")[:self.top_n]
+
+        profiler.dump_stats(self.output_dir / f"{task_id}.prof")
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(self.top_n)
+
+        stage_totals: Dict[str, float] = {}
+        for stage, seconds in stages:
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+
+        summary = {
+            "task_id": task_id,
+            "created": time.time(),
+            "wall_seconds": wall,
+            "stages": stage_totals,
+            "peak_memory_bytes": peak,
+            "top_allocations": [
+                {"location": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+                for stat in allocations
+            ],
+            "cprofile": report.getvalue(),
+            "torch_trace": False,
+            **meta,
+        }
+        if torch_profiler is not None:
+            torch_profiler.export_chrome_trace(str(self.output_dir / f"{task_id}.torch.json"))
+            summary["torch_trace"] = True
+            summary["torch_ops"] = torch_profiler.key_averages().table(sort_by="cpu_time_total", row_limit=self.top_n)
+
+        with open(self.output_dir / f"{task_id}.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        with self._lock:
+            self.profiles_total += 1
+        memory = f"пик памяти {peak / 1024 / 1024:.1f} МБ" if peak is not None else "память не измерялась"
+        self.logger.info(f"Профиль задачи {task_id}: {wall:.3f} с, {memory}")
+        self._enforce_limit()
+
+    def _summaries(self) -> List[Path]:
+        """Файлы сводок, старые первыми"""
+        summaries = [path for path in self.output_dir.glob("*.json") if not path.name.endswith(".torch.json")]
+        return sorted(summaries, key=_mtime)
+
+    def _enforce_limit(self) -> None:
+        summaries = self._summaries()
+        for path in summaries[:max(len(summaries) - self.max_profiles, 0)]:
+            task_id = path.stem
+            for suffix in (".json", ".prof", ".torch.json"):
+                try:
+                    (self.output_dir / f"{task_id}{suffix}").unlink()
+                except FileNotFoundError:
+                    pass
+
+    def list_profiles(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Краткие сводки последних профилей, новые первыми"""
+        profiles = []
+        for path in reversed(self._summaries()[-limit:]):
+            summary = self.get_profile(path.stem)
+            if summary is not None:
+                profiles.append({key: summary.get(key) for key in
+                                 ("task_id", "created", "wall_seconds", "stages", "peak_memory_bytes", "torch_trace")})
+        return profiles
+
+    def get_profile(self, task_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.profile_path(task_id, "json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def profile_path(self, task_id: str, kind: str) -> Path:
+        """Путь к файлу профиля: kind - json, prof или torch"""
+        if not TASK_ID_RE.fullmatch(task_id):
+            raise ValueError("Неверный task_id")
+        suffix = {"json": ".json", "prof": ".prof", "torch": ".torch.json"}[kind]
+        return self.output_dir / f"{task_id}{suffix}"
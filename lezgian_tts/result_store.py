@@ -0,0 +1,110 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+# Примерный размер служебной части записи (словарь, строки статуса и пути)
+ENTRY_OVERHEAD_BYTES = 512
+
+
+class TaskResultStore:
+    """
+    Хранилище результатов задач с ограничением по памяти и времени жизни
+
+    Записи вытесняются по LRU, когда суммарный объём превышает max_bytes,
+    и удаляются через ttl секунд после сохранения.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl: float = 600.0,
+                 max_items: int = 10000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_items = max_items
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float, int]]" = OrderedDict()
+        self._size = 0
+        self._last_sweep = time.monotonic()
+        self._lock = Lock()
+
+    @staticmethod
+    def _entry_size(result: Dict[str, Any]) -> int:
+        audio_data = result.get('audio_data')
+        return ENTRY_OVERHEAD_BYTES + (len(audio_data) if audio_data is not None else 0)
+
+    def put(self, task_id: str, result: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        size = self._entry_size(result)
+        with self._lock:
+            self._remove(task_id)
+            self._entries[task_id] = (result, now + self.ttl, size)
+            self._size += size
+            self._sweep_expired(now)
+            self._enforce_budget()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(task_id)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(task_id)
+            return entry[0]
+
+    def pop(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._remove(task_id)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return entry[0]
+
+    def evict_expired(self) -> int:
+        with self._lock:
+            before = len(self._entries)
+            self._sweep_expired(time.monotonic(), force=True)
+            return before - len(self._entries)
+
+    def _remove(self, task_id: str) -> Optional[Tuple[Dict[str, Any], float, int]]:
+        entry = self._entries.pop(task_id, None)
+        if entry is not None:
+            self._size -= entry[2]
+        return entry
+
+    def _sweep_expired(self, now: float, force: bool = False) -> None:
+        # Полный проход раз в десятую часть TTL, чтобы put оставался амортизированно O(1)
+        if not force and now - self._last_sweep < self.ttl / 10:
+            return
+        self._last_sweep = now
+        expired = [task_id for task_id, (_, expires_at, _) in self._entries.items() if expires_at <= now]
+        for task_id in expired:
+            self._remove(task_id)
+        self.expirations += len(expired)
+
+    def _enforce_budget(self) -> None:
+        while self._entries and (self._size > self.max_bytes or len(self._entries) > self.max_items):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'items': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
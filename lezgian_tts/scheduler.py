@@ -0,0 +1,174 @@
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class _Job:
+    __slots__ = ("fn", "args", "future", "cost", "user_id", "lane", "enqueued_at", "taken")
+
+    def __init__(self, fn: Callable, args: Tuple, cost: float, user_id: Any, lane: str):
+        self.fn = fn
+        self.args = args
+        self.future: Future = Future()
+        self.cost = cost
+        self.user_id = user_id
+        self.lane = lane
+        self.enqueued_at = time.monotonic()
+        self.taken = False
+
+
+class _Lane:
+    """
+    Очередь одной полосы: задачи сгруппированы по пользователям
+
+    Выбор между пользователями - справедливая очередь с виртуальным временем:
+    каждая выданная задача сдвигает время пользователя на её стоимость, и
+    следующей выдаётся задача с минимальным max(время пользователя, время
+    полосы) + стоимость. Для разных пользователей это shortest-job-first,
+    а пользователь с потоком задач не может вытеснить остальных.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.users: Dict[Any, List[Tuple[float, int, _Job]]] = {}
+        self.user_time: Dict[Any, float] = {}
+        self.virtual_time = 0.0
+        # Порядок поступления для защиты от голодания (выданные задачи удаляются лениво)
+        self.arrivals: Deque[_Job] = deque()
+        self.size = 0
+
+    def push(self, job: _Job, seq: int) -> None:
+        heapq.heappush(self.users.setdefault(job.user_id, []), (job.cost, seq, job))
+        self.arrivals.append(job)
+        self.size += 1
+
+    def oldest(self) -> Optional[_Job]:
+        while self.arrivals and self.arrivals[0].taken:
+            self.arrivals.popleft()
+        return self.arrivals[0] if self.arrivals else None
+
+    def pop_fair(self) -> _Job:
+        best_user, best_finish = None, None
+        for user_id, heap in self.users.items():
+            start = max(self.user_time.get(user_id, 0.0), self.virtual_time)
+            finish = start + heap[0][0]
+            if best_finish is None or finish < best_finish:
+                best_user, best_finish = user_id, finish
+        job = heapq.heappop(self.users[best_user])[2]
+        self.virtual_time = best_finish - job.cost
+        self.user_time[best_user] = best_finish
+        return self._take(job)
+
+    def pop_job(self, job: _Job) -> _Job:
+        heap = self.users[job.user_id]
+        heap.remove(next(entry for entry in heap if entry[2] is job))
+        heapq.heapify(heap)
+        return self._take(job)
+
+    def _take(self, job: _Job) -> _Job:
+        job.taken = True
+        self.size -= 1
+        if not self.users[job.user_id]:
+            del self.users[job.user_id]
+        if not self.users:
+            # Полоса опустела - сбрасываем виртуальное время, чтобы оно не росло бесконечно
+            self.user_time.clear()
+            self.virtual_time = 0.0
+        return job
+
+
+class PriorityScheduler:
+    """
+    Пул потоков с приоритетными полосами вместо общей FIFO-очереди
+
+    Полосы перечисляются в порядке приоритета (по умолчанию interactive, затем
+    bulk): воркер берёт задачу из первой непустой полосы. Внутри полосы
+    задачи выбираются по оценке стоимости (число символов) со справедливым
+    чередованием пользователей. Задача, прождавшая дольше max_wait, выдаётся
+    вне очереди, поэтому длинные и массовые запросы не голодают.
+    """
+
+    def __init__(self, max_workers: int = 4, lanes: Sequence[str] = (INTERACTIVE, BULK),
+                 max_wait: float = 30.0, logger: Optional[logging.Logger] = None):
+        self.max_workers = max_workers
+        self.max_wait = max_wait
+        self.logger = logger or logging.getLogger(__name__)
+        self.lanes: Dict[str, _Lane] = {name: _Lane(name) for name in lanes}
+        self.promoted = 0
+        self._seq = itertools.count()
+        self._cond = Condition()
+        self._running = True
+        self._threads = [
+            Thread(target=self._run, name=f"tts-scheduler-{i}", daemon=True) for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn: Callable, *args, cost: float = 0.0, user_id: Any = None,
+               lane: str = INTERACTIVE) -> Future:
+        if lane not in self.lanes:
+            raise ValueError(f"Неизвестная полоса {lane}, доступны: {', '.join(self.lanes)}")
+        job = _Job(fn, args, cost, user_id, lane)
+        with self._cond:
+            if not self._running:
+                job.future.set_exception(RuntimeError("Планировщик задач остановлен"))
+                return job.future
+            self.lanes[lane].push(job, next(self._seq))
+            self._cond.notify()
+        return job.future
+
+    def qsize(self, lane: Optional[str] = None) -> int:
+        with self._cond:
+            if lane is not None:
+                return self.lanes[lane].size
+            return sum(l.size for l in self.lanes.values())
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next_job(self) -> Optional[_Job]:
+        now = time.monotonic()
+        starving = None
+        for lane in self.lanes.values():
+            oldest = lane.oldest()
+            if oldest is not None and now - oldest.enqueued_at > self.max_wait:
+                if starving is None or oldest.enqueued_at < starving.enqueued_at:
+                    starving = oldest
+        if starving is not None:
+            self.promoted += 1
+            return self.lanes[starving.lane].pop_job(starving)
+        for lane in self.lanes.values():
+            if lane.size:
+                return lane.pop_fair()
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    # Задачи, поставленные до shutdown, всё равно выполняются
+                    if not self._running:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                job.future.set_result(job.fn(*job.args))
+            except BaseException as e:
+                self.logger.error(f"Ошибка задачи в полосе {job.lane}: {str(e)}", exc_info=True)
+                job.future.set_exception(e)
@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import struct
+from concurrent.futures import Future
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .synthesis_cache import LRUCache
+
+# Значение в LRU: 4 байта частоты дискретизации + PCM int16
+_HEADER = struct.Struct("<I")
+
+Piece = Tuple[np.ndarray, int]
+
+
+class SentenceAudioCache:
+    """
+    Кэш аудио отдельных предложений и синтез текста по предложениям
+
+    Текст делится на предложения (LezgianTTS.split_sentences), каждое ищется
+    в LRU по нормализованному тексту и модели; синтезируются только промахи -
+    пакетами до max_batch_size предложений близкой длины (или через
+    InferenceBatcher, если он есть, который группирует их сам). Готовые куски
+    склеиваются с паузой silence_ms и короткими затуханиями на стыках либо,
+    при silence_ms = 0, с перекрёстным затуханием crossfade_ms. Одинаковые
+    предложения из одновременных запросов синтезируются один раз.
+    """
+
+    def __init__(self, max_items: int = 4096, max_bytes: int = 128 * 1024 * 1024, max_chars: int = 200,
+                 crossfade_ms: float = 10.0, silence_ms: float = 120.0, max_batch_size: int = 8,
+                 logger: Optional[logging.Logger] = None):
+        self.memory = LRUCache(max_items, max_bytes)
+        self.max_chars = max_chars
+        self.max_batch_size = max(max_batch_size, 1)
+        self.crossfade_ms = crossfade_ms
+        self.silence_ms = silence_ms
+        self.logger = logger or logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(normalized_segment: str, model_id: str) -> str:
+        payload = "\x1f".join((model_id, normalized_segment))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Piece]:
+        value = self.memory.get(key)
+        if value is None:
+            return None
+        (sample_rate,) = _HEADER.unpack_from(value)
+        return np.frombuffer(value, dtype=np.int16, offset=_HEADER.size), sample_rate
+
+    def put(self, key: str, pcm: np.ndarray, sample_rate: int) -> None:
+        self.memory.put(key, _HEADER.pack(sample_rate) + pcm.astype(np.int16, copy=False).tobytes())
+
+    def synthesize(self, tts, text: str, batcher=None) -> Optional[Dict]:
+        """
+        Синтезирует текст по предложениям с повторным использованием кэша
+
+        Args:
+            tts (LezgianTTS): Синтезатор
+            text (str): Текст для синтеза
+            batcher (InferenceBatcher): Планировщик пакетов; если None - tts.synthesize_batch
+
+        Returns:
+            Optional[Dict]: Речь в формате synthesize (audio - PCM int16) и
+                synthesized_seconds - сколько секунд аудио реально синтезировала модель;
+                None при ошибке синтеза любого предложения
+        """
+        segments = tts.split_sentences(text, self.max_chars)
+        if not segments:
+            return None
+        keys = [self.make_key(segment, tts.model_id) for segment in segments]
+
+        pieces: Dict[str, Piece] = {}
+        waiting: Dict[str, Future] = {}
+        leading: Dict[str, Future] = {}
+        for key, segment in zip(keys, segments):
+            if key in pieces or key in waiting or key in leading:
+                continue
+            piece = self.get(key)
+            if piece is not None:
+                pieces[key] = piece
+                continue
+            with self._lock:
+                future = self._in_flight.get(key)
+                if future is None:
+                    leading[key] = self._in_flight[key] = Future()
+                else:
+                    waiting[key] = future
+        with self._lock:
+            self.hits += len(keys) - len(leading)
+            self.misses += len(leading)
+
+        synthesized_seconds = 0.0
+        if leading:
+            try:
+                missing = {key: segment for key, segment in zip(keys, segments) if key in leading}
+                results = self._synthesize_missing(tts, list(missing.values()), batcher)
+                for key, piece in zip(missing, results):
+                    if piece is not None:
+                        self.put(key, *piece)
+                        synthesized_seconds += len(piece[0]) / piece[1]
+                    leading[key].set_result(piece)
+            except BaseException as e:
+                for future in leading.values():
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for key in leading:
+                        self._in_flight.pop(key, None)
+            for key, future in leading.items():
+                pieces[key] = future.result()
+        for key, future in waiting.items():
+            pieces[key] = future.result()
+
+        ordered = [pieces[key] for key in keys]
+        if any(piece is None for piece in ordered):
+            return None
+        sample_rates = {sample_rate for _, sample_rate in ordered}
+        if len(sample_rates) != 1:
+            self.logger.error(f"Разная частота дискретизации предложений: {sorted(sample_rates)}")
+            return None
+        sample_rate = sample_rates.pop()
+        return {
+            "audio": self.join([pcm for pcm, _ in ordered], sample_rate),
+            "sampling_rate": sample_rate,
+            "synthesized_seconds": synthesized_seconds,
+        }
+
+    def _synthesize_missing(self, tts, segments: List[str], batcher) -> List[Optional[Piece]]:
+        if batcher is not None:
+            futures = [batcher.submit(segment) for segment in segments]
+            speeches = [future.result() for future in futures]
+        else:
+            # Пакеты из предложений близкой длины: паддинг внутри пакета минимален,
+            # а текст из сотен предложений не становится одним вызовом модели
+            speeches: List[Optional[Dict]] = [None] * len(segments)
+            order = sorted(range(len(segments)), key=lambda i: len(segments[i]))
+            for start in range(0, len(order), self.max_batch_size):
+                chunk = order[start:start + self.max_batch_size]
+                for i, speech in zip(chunk, tts.synthesize_batch([segments[i] for i in chunk])):
+                    speeches[i] = speech
+        return [
+            (tts.to_pcm16(speech), speech["sampling_rate"]) if speech is not None else None
+            for speech in speeches
+        ]
+
+    def join(self, pieces: List[np.ndarray], sample_rate: int) -> np.ndarray:
+        """Склеивает PCM-куски: пауза с затуханиями на стыках или перекрёстное затухание"""
+        if len(pieces) == 1:
+            return pieces[0]
+        fade = int(sample_rate * self.crossfade_ms / 1000)
+        silence = int(sample_rate * self.silence_ms / 1000)
+        pieces = [piece.astype(np.float32) for piece in pieces]
+
+        if silence > 0 or fade == 0:
+            gap = np.zeros(silence, dtype=np.float32)
+            parts = []
+            for i, piece in enumerate(pieces):
+                n = min(fade, len(piece) // 2)
+                if n:
+                    ramp = np.linspace(0.0, 1.0, n, dtype=np.float32)
+                    if i > 0:
+                        piece[:n] *= ramp
+                    if i < len(pieces) - 1:
+                        piece[-n:] *= ramp[::-1]
+                if i > 0:
+                    parts.append(gap)
+                parts.append(piece)
+            joined = np.concatenate(parts)
+        else:
+            parts = []
+            tail = pieces[0]
+            for piece in pieces[1:]:
+                n = min(fade, len(tail), len(piece))
+                if n:
+                    ramp = np.linspace(0.0, 1.0, n, dtype=np.float32)
+                    parts.append(tail[:-n])
+                    parts.append(tail[-n:] * ramp[::-1] + piece[:n] * ramp)
+                else:
+                    parts.append(tail)
+                tail = piece[n:]
+            parts.append(tail)
+            joined = np.concatenate(parts)
+        return np.clip(joined, -32768, 32767).astype(np.int16)
+
+    @property
+    def size_bytes(self) -> int:
+        return self.memory.size_bytes
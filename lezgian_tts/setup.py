@@ -8,4 +8,10 @@ setup(
         "transformers",
         "scipy",
     ],
+    entry_points={
+        "console_scripts": [
+            "lezgian-tts-corpus=lezgian_tts.cli:main",
+            "lezgian-tts-autotune=lezgian_tts.autotune:main",
+        ],
+    },
 )
\ No newline at end of file
@@ -0,0 +1,204 @@
+import atexit
+import logging
+from collections import deque
+from datetime import datetime
+from threading import Condition, Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+# Ошибки данных конкретных строк (NUL в тексте, нарушение внешнего ключа и т.п.):
+# повтор их не исправит, в отличие от недоступности БД
+ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, ValueError)
+
+
+class StatusJournal:
+    """
+    Журнал отложенной записи статусов задач синтеза (write-behind)
+
+    Переходы queued -> processing -> success/error и строки результата
+    копятся в памяти и сбрасываются в БД пачками: одна транзакция на сброс,
+    многострочные INSERT/UPDATE через execute_values. Переходы одной задачи
+    между сбросами сливаются в одну запись.
+
+    id запросов выделяются заранее блоками из последовательности таблицы,
+    поэтому задаче не нужно ждать INSERT ... RETURNING id. Перед чтением
+    статусов из БД (история, проверка доступа) вызывается flush().
+
+    Если пачка не записалась из-за данных отдельных строк, она делится пополам,
+    пока сбойные задачи не окажутся по одной; они откладываются в dead_letters
+    (последние max_dead_letters) и больше не записываются. При прочих ошибках
+    пачка целиком возвращается в очередь.
+    """
+
+    def __init__(self, db_manager, flush_interval: float = 0.2, max_batch: int = 500,
+                 id_block_size: int = 100, max_dead_letters: int = 100,
+                 logger: Optional[logging.Logger] = None):
+        self.db_manager = db_manager
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.id_block_size = id_block_size
+        self.logger = logger or logging.getLogger(__name__)
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+        self.dropped_rows = 0
+        self.dead_letters: deque = deque(maxlen=max_dead_letters)
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._ids: List[int] = []
+        self._ids_lock = Lock()
+        # Сброс выполняется одним потоком за раз, иначе пачки могут записаться не по порядку
+        self._flush_lock = Lock()
+        self._cond = Condition()
+        self._running = True
+        self._thread = Thread(target=self._run, name="tts-status-journal", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def allocate_id(self) -> int:
+        """id новой строки SpeechSynthesisRequest из заранее выделенного блока"""
+        with self._ids_lock:
+            if not self._ids:
+                rows = self.db_manager.execute_query(
+                    "SELECT nextval(pg_get_serial_sequence('SpeechSynthesisRequest', 'id')) "
+                    "FROM generate_series(1, %s)",
+                    (self.id_block_size,)
+                )
+                self._ids = [row[0] for row in reversed(rows)]
+            return self._ids.pop()
+
+    def record_queued(self, request_id: int, user_id: int, text: str, language: str,
+                      create_dttm: datetime) -> None:
+        self._merge(request_id, {
+            'insert': (user_id, text, create_dttm, language),
+            'status': 'queued',
+        })
+
+    def record_started(self, request_id: int, start_dttm: datetime) -> None:
+        self._merge(request_id, {'status': 'processing', 'start': start_dttm})
+
+    def record_finished(self, request_id: int, status: str, end_dttm: datetime,
+                        result: Optional[Tuple[str, float, int]] = None) -> None:
+        """
+        Args:
+            result: (audio_file_path, duration_seconds, characters_processed) для успешной задачи
+        """
+        changes: Dict[str, Any] = {'status': status, 'end': end_dttm}
+        if result is not None:
+            changes['result'] = result
+        self._merge(request_id, changes)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _merge(self, request_id: int, changes: Dict[str, Any]) -> None:
+        with self._cond:
+            entry = self._pending.setdefault(request_id, {})
+            entry.update(changes)
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def flush(self) -> int:
+        """Записывает накопленные переходы; возвращает число записанных задач"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+            try:
+                written = self._write_isolating(batch)
+            except Exception as e:
+                with self._cond:
+                    self.flush_errors += 1
+                    # Возвращаем пачку; более новые переходы поверх неё сохраняются
+                    for request_id, entry in batch.items():
+                        newer = self._pending.get(request_id)
+                        if newer is not None:
+                            entry.update(newer)
+                        self._pending[request_id] = entry
+                self.logger.error(f"Ошибка записи журнала статусов ({len(batch)} задач): {str(e)}")
+                raise
+            self.flushes += 1
+            self.flushed_rows += written
+            return written
+
+    def _write_isolating(self, batch: Dict[int, Dict[str, Any]]) -> int:
+        """Пишет пачку, отбрасывая задачи, строки которых БД не принимает; возвращает число записанных"""
+        try:
+            self._write(batch)
+            return len(batch)
+        except ROW_ERRORS as e:
+            if len(batch) == 1:
+                (request_id, entry), = batch.items()
+                self.dropped_rows += 1
+                self.dead_letters.append({'request_id': request_id, 'entry': entry, 'error': str(e)})
+                self.logger.error(f"Переходы задачи {request_id} отброшены журналом статусов: {str(e)}")
+                return 0
+            items = list(batch.items())
+            middle = len(items) // 2
+            return self._write_isolating(dict(items[:middle])) + self._write_isolating(dict(items[middle:]))
+
+    def _write(self, batch: Dict[int, Dict[str, Any]]) -> None:
+        inserts, updates, results = [], [], []
+        for request_id, entry in batch.items():
+            if 'insert' in entry:
+                user_id, text, create_dttm, language = entry['insert']
+                inserts.append((request_id, user_id, text, entry['status'], create_dttm,
+                                entry.get('start'), entry.get('end'), language))
+            else:
+                updates.append((request_id, entry['status'], entry.get('start'), entry.get('end')))
+            if 'result' in entry:
+                results.append((request_id,) + tuple(entry['result']))
+
+        with self.db_manager.connection() as conn:
+            with conn.cursor() as cur:
+                if inserts:
+                    execute_values(cur, """
+                        INSERT INTO SpeechSynthesisRequest
+                        (id, user_id, input_text, status, create_dttm,
+                         processing_start_dttm, processing_end_dttm, language_code)
+                        VALUES %s
+                    """, inserts, template="(%s, %s, %s, %s, %s, %s::timestamp, %s::timestamp, %s)")
+                if updates:
+                    execute_values(cur, """
+                        UPDATE SpeechSynthesisRequest AS s
+                        SET status = v.status,
+                            processing_start_dttm = COALESCE(v.start_dttm, s.processing_start_dttm),
+                            processing_end_dttm = COALESCE(v.end_dttm, s.processing_end_dttm)
+                        FROM (VALUES %s) AS v(id, status, start_dttm, end_dttm)
+                        WHERE s.id = v.id
+                    """, updates, template="(%s, %s, %s::timestamp, %s::timestamp)")
+                if results:
+                    execute_values(cur, """
+                        INSERT INTO SpeechSynthesisResult
+                        (request_id, audio_file_path, duration_seconds, characters_processed)
+                        VALUES %s
+                    """, results)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._running:
+                    self._cond.wait(self.flush_interval)
+                running = self._running
+            try:
+                self.flush()
+            except Exception:
+                pass
+            if not running:
+                return
+
+    def close(self) -> None:
+        """Останавливает фоновый поток и записывает остаток (вызывается и при выходе процесса)"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        try:
+            self.flush()
+        except Exception:
+            pass
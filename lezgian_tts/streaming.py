@@ -0,0 +1,70 @@
+import struct
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+# Размер блока данных "неизвестной длины" для потокового WAV (так делают ffmpeg и sox)
+STREAMING_DATA_SIZE = 0xFFFFFFFF
+# Поле размера RIFF 32-битное и включает 36 байт заголовка
+MAX_WAV_DATA_SIZE = 0xFFFFFFFF - 36
+
+
+def wav_header(sample_rate: int, data_size: Optional[int] = None, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+    """
+    Формирует заголовок RIFF/WAVE для PCM
+
+    Args:
+        sample_rate (int): Частота дискретизации
+        data_size (Optional[int]): Размер блока данных в байтах (None - поток неизвестной длины)
+        channels (int): Количество каналов
+        bits_per_sample (int): Разрядность отсчёта
+
+    Returns:
+        bytes: 44-байтовый заголовок
+
+    Raises:
+        ValueError: data_size больше MAX_WAV_DATA_SIZE (около 4 ГиБ) - такой WAV не записать
+    """
+    block_align = channels * bits_per_sample // 8
+    byte_rate = sample_rate * block_align
+    if data_size is None:
+        data_size = STREAMING_DATA_SIZE
+        riff_size = STREAMING_DATA_SIZE
+    else:
+        if data_size > MAX_WAV_DATA_SIZE:
+            raise ValueError(f"Аудио {data_size} байт не помещается в WAV (максимум {MAX_WAV_DATA_SIZE})")
+        riff_size = 36 + data_size
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def to_pcm16(audio_data: np.ndarray) -> bytes:
+    """Приводит фрагмент к little-endian int16 PCM"""
+    audio_data = np.asarray(audio_data)
+    if audio_data.dtype.kind == "f":
+        audio_data = np.clip(audio_data, -1.0, 1.0) * 32767
+    return audio_data.astype("<i2", copy=False).tobytes()
+
+
+def iter_pcm_stream(chunks: Iterable[Tuple[np.ndarray, int]]) -> Iterator[bytes]:
+    """Отдаёт фрагменты как сырой PCM int16"""
+    for audio_data, _ in chunks:
+        yield to_pcm16(audio_data)
+
+
+def iter_wav_stream(chunks: Iterable[Tuple[np.ndarray, int]]) -> Iterator[bytes]:
+    """
+    Отдаёт фрагменты как потоковый WAV: заголовок перед первым фрагментом, затем PCM
+
+    Частота дискретизации берётся из первого фрагмента, поэтому заголовок
+    уходит клиенту сразу после синтеза первого предложения.
+    """
+    header_sent = False
+    for audio_data, sample_rate in chunks:
+        if not header_sent:
+            yield wav_header(sample_rate)
+            header_sent = True
+        yield to_pcm16(audio_data)
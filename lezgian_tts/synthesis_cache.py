@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Optional, Union
+
+AudioBytes = Union[bytes, memoryview]
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш байтовых значений с ограничением по числу записей и объёму"""
+
+    def __init__(self, max_items: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, AudioBytes]" = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[AudioBytes]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: AudioBytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = value
+            self._size += len(value)
+            while self._items and (len(self._items) > self.max_items or self._size > self.max_bytes):
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    def pop(self, key: str) -> Optional[AudioBytes]:
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._size -= len(value)
+            return value
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SynthesisCache:
+    """
+    Кэш результатов синтеза с адресацией по содержимому
+
+    Ключ строится из нормализованного текста, языка и идентификатора модели.
+    Первый уровень - LRU в памяти, второй - WAV-файлы на диске.
+    Одинаковые запросы, пришедшие одновременно, ожидают один и тот же синтез.
+    """
+
+    def __init__(self, cache_dir: Path, max_memory_items: int = 256,
+                 max_memory_bytes: int = 64 * 1024 * 1024,
+                 logger: Optional[logging.Logger] = None):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.memory = LRUCache(max_memory_items, max_memory_bytes)
+        self.logger = logger or logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(normalized_text: str, language: str, model_id: str) -> str:
+        payload = "\x1f".join((model_id, language, normalized_text))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.wav"
+
+    def get(self, key: str) -> Optional[AudioBytes]:
+        audio_data = self.memory.get(key)
+        if audio_data is not None:
+            return audio_data
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as f:
+                audio_data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self.logger.warning(f"Не удалось прочитать кэш {path}: {str(e)}")
+            return None
+        self.memory.put(key, audio_data)
+        return audio_data
+
+    def put(self, key: str, audio_data: AudioBytes, source_path: Optional[Path] = None) -> None:
+        self.memory.put(key, audio_data)
+        path = self.get_path(key)
+        if source_path is not None:
+            # Файл уже записан на диск - достаточно жёсткой ссылки на него
+            try:
+                os.link(source_path, path)
+                return
+            except FileExistsError:
+                return
+            except OSError:
+                pass
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio_data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Не удалось записать кэш {path}: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def link_to(self, key: str, target_path: Path) -> bool:
+        """Создаёт target_path как жёсткую ссылку на файл из дискового уровня кэша"""
+        try:
+            os.link(self.get_path(key), target_path)
+        except OSError:
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def get_or_synthesize(self, key: str, synthesize: Callable[[], Optional[AudioBytes]],
+                          source_path: Optional[Path] = None) -> Optional[AudioBytes]:
+        """
+        Возвращает аудио из кэша или синтезирует его ровно один раз
+
+        Args:
+            key (str): Ключ кэша (см. make_key)
+            synthesize (Callable): Функция синтеза, возвращающая WAV-байты или None
+            source_path (Optional[Path]): Файл, который synthesize записывает на диск;
+                дисковый уровень кэша ссылается на него вместо повторной записи
+
+        Returns:
+            Optional[AudioBytes]: WAV-байты или None при ошибке синтеза
+        """
+        audio_data = self.get(key)
+        if audio_data is not None:
+            with self._lock:
+                self.hits += 1
+            return audio_data
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.hits += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            # Лидер мог завершиться между проверкой кэша и захватом блокировки
+            audio_data = self.get(key)
+            with self._lock:
+                if audio_data is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if audio_data is None:
+                audio_data = synthesize()
+                if audio_data is not None:
+                    self.put(key, audio_data, source_path)
+            future.set_result(audio_data)
+            return audio_data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
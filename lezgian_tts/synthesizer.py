@@ -1,13 +1,24 @@
+import io
 import os
+import re
+import time
 import logging
 import numpy as np
-from typing import Optional, Dict, Union
+from contextlib import contextmanager
+from typing import Callable, Optional, Dict, Iterator, List, Tuple, Union
 from transformers import pipeline
 import scipy.io.wavfile
 import soundfile as sf
+from .backends import apply_backend, batch_waveforms, supports_trimmed_batch
+from .normalizer import LezgianNormalizer
+
+SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+')
+CLAUSE_END_RE = re.compile(r'(?<=[,;:—])\s+')
+
 
 class LezgianTTS:
-    def __init__(self, model_id: str = "model", use_gpu: bool = False, logger: Optional[logging.Logger] = None):
+    def __init__(self, model_id: str = "model", use_gpu: bool = False, logger: Optional[logging.Logger] = None,
+                 backend: str = "eager", normalizer: Optional[LezgianNormalizer] = None):
         """
         Инициализация синтезатора речи
         
@@ -15,11 +26,17 @@ class LezgianTTS:
             model_id (str): Путь к модели или идентификатор в HuggingFace Hub
             use_gpu (bool): Использовать ли GPU для вычислений
             logger (Logger): Логгер для записи событий (если None, будет создан новый)
+            backend (str): Бэкенд инференса на CPU ('eager', 'int8', 'bf16', 'compile', 'onnx')
+            normalizer (LezgianNormalizer): Нормализатор текста (если None, будет создан со словарём по умолчанию)
         """
         self._setup_logger(logger)
+        self.normalizer = normalizer or LezgianNormalizer()
         self.model_id = model_id
         self.use_gpu = use_gpu
+        self.backend = backend
         self.synthesiser = None
+        # Наблюдатели этапов: вызываются как observer(stage, seconds) для бенчмарков и метрик
+        self.stage_observers: List[Callable[[str, float], None]] = []
         self._initialize_model()
 
     def _setup_logger(self, logger: Optional[logging.Logger]) -> None:
@@ -31,6 +48,20 @@ class LezgianTTS:
                 format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
             )
 
+    @contextmanager
+    def _stage(self, name: str):
+        """Замер длительности этапа синтеза (normalize, inference, prepare, encode)"""
+        if not self.stage_observers:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            for observer in self.stage_observers:
+                observer(name, elapsed)
+
     def _initialize_model(self) -> None:
         """Загрузка и инициализация модели TTS"""
         try:
@@ -48,7 +79,10 @@ class LezgianTTS:
                 trust_remote_code=True
             )
             
-            self.logger.info(f"Модель {self.model_id} успешно загружена")
+            if not self.use_gpu and self.backend != "eager":
+                self.synthesiser = apply_backend(self.synthesiser, self.backend, self.model_id, self.logger)
+            
+            self.logger.info(f"Модель {self.model_id} успешно загружена (бэкенд: {self.backend})")
             
         except Exception as e:
             self.logger.error(f"Ошибка при загрузке модели: {str(e)}", exc_info=True)
@@ -72,9 +106,11 @@ class LezgianTTS:
         try:
             self.logger.info(f"Синтез речи для текста: '{text[:50]}...'")
             
-            normalized_text = self._normalize_text(text)
+            with self._stage("normalize"):
+                normalized_text = self.normalize_text(text)
             
-            speech = self.synthesiser(normalized_text, **kwargs)
+            with self._stage("inference"):
+                speech = self.synthesiser(normalized_text, **kwargs)
             
             if not self._validate_audio_output(speech):
                 return None
@@ -85,6 +121,129 @@ class LezgianTTS:
             self.logger.error(f"Ошибка синтеза речи: {str(e)}", exc_info=True)
             return None
 
+    def synthesize_batch(self, texts: List[str], **kwargs) -> List[Optional[Dict]]:
+        """
+        Синтезирует речь для нескольких текстов одним пакетным вызовом модели (см. infer_batch)
+        
+        Args:
+            texts (List[str]): Тексты для синтеза
+            **kwargs: Дополнительные параметры для модели
+            
+        Returns:
+            List[Optional[Dict]]: Результаты в порядке входных текстов (None для неудачных)
+        """
+        if not self.synthesiser:
+            self.logger.error("Модель не инициализирована")
+            return [None] * len(texts)
+
+        if len(texts) == 1:
+            return [self.synthesize(texts[0], **kwargs)]
+
+        try:
+            self.logger.info(f"Пакетный синтез речи для {len(texts)} текстов")
+            
+            with self._stage("normalize"):
+                normalized_texts = [self.normalize_text(text) for text in texts]
+            
+            with self._stage("inference"):
+                if kwargs:
+                    speeches = [self.synthesiser(text, **kwargs) for text in normalized_texts]
+                else:
+                    speeches = self.infer_batch(normalized_texts)
+            
+            return [speech if self._validate_audio_output(speech) else None for speech in speeches]
+            
+        except Exception as e:
+            self.logger.error(f"Ошибка пакетного синтеза речи: {str(e)}", exc_info=True)
+            return [None] * len(texts)
+
+    def infer_batch(self, normalized_texts: List[str]) -> List[Dict]:
+        """
+        Пакетный инференс нормализованных текстов
+        
+        Модель вызывается напрямую, и волна каждого текста обрезается по его
+        собственной длине: pipeline с batch_size вернул бы волны, дополненные
+        до самой длинной в пакете. Если синтезатор не даёт такого доступа к
+        модели, тексты синтезируются по одному.
+        
+        Args:
+            normalized_texts (List[str]): Тексты после normalize_text
+            
+        Returns:
+            List[Dict]: Результаты в формате pipeline в порядке входных текстов
+        """
+        trimmed_batch = getattr(self.synthesiser, "trimmed_batch", None)
+        if trimmed_batch is not None:
+            return trimmed_batch(normalized_texts)
+        if supports_trimmed_batch(self.synthesiser):
+            return batch_waveforms(self.synthesiser, normalized_texts)
+        return [self.synthesiser(text) for text in normalized_texts]
+
+    def estimate_tokens(self, text: str) -> int:
+        """Оценка длины текста в токенах модели (используется для группировки в пакеты)"""
+        tokenizer = getattr(self.synthesiser, "tokenizer", None)
+        normalized_text = self.normalize_text(text)
+        if tokenizer is None:
+            return len(normalized_text)
+        try:
+            return len(tokenizer(normalized_text)["input_ids"])
+        except Exception:
+            return len(normalized_text)
+
+    def split_sentences(self, text: str, max_chars: int = 200) -> List[str]:
+        """
+        Делит нормализованный текст на предложения, а слишком длинные - на фразы
+        
+        Args:
+            text (str): Текст для разбиения
+            max_chars (int): Максимальная длина фрагмента в символах
+            
+        Returns:
+            List[str]: Непустые фрагменты в исходном порядке
+        """
+        segments = []
+        for sentence in SENTENCE_END_RE.split(self.normalize_text(text)):
+            if len(sentence) <= max_chars:
+                segments.append(sentence)
+                continue
+            current = ""
+            for clause in CLAUSE_END_RE.split(sentence):
+                if len(clause) > max_chars and current:
+                    # Накопленные фразы идут раньше кусков длинной фразы
+                    segments.append(current)
+                    current = ""
+                while len(clause) > max_chars:
+                    cut = clause.rfind(" ", 0, max_chars)
+                    cut = cut if cut > 0 else max_chars
+                    segments.append(clause[:cut])
+                    clause = clause[cut:].lstrip()
+                if current and len(current) + len(clause) + 1 > max_chars:
+                    segments.append(current)
+                    current = clause
+                else:
+                    current = f"{current} {clause}" if current else clause
+            if current:
+                segments.append(current)
+        return [segment.strip() for segment in segments if segment.strip()]
+
+    def synthesize_stream(self, text: str, max_chars: int = 200, **kwargs) -> Iterator[Tuple[np.ndarray, int]]:
+        """
+        Синтезирует текст по предложениям и отдаёт аудио по мере готовности
+        
+        Args:
+            text (str): Текст для синтеза
+            max_chars (int): Максимальная длина фрагмента в символах
+            **kwargs: Дополнительные параметры для модели
+            
+        Yields:
+            Tuple[np.ndarray, int]: PCM-фрагмент (int16) и частота дискретизации
+        """
+        for segment in self.split_sentences(text, max_chars):
+            speech = self.synthesize(segment, **kwargs)
+            if speech is None:
+                raise RuntimeError(f"Не удалось синтезировать фрагмент: '{segment[:50]}...'")
+            yield self._prepare_audio_data(speech["audio"]), speech["sampling_rate"]
+
     def save_to_file(self, text: str, output_path: str, format: str = 'wav', **kwargs) -> bool:
         """
         Синтезирует речь и сохраняет её в файл
@@ -98,20 +257,35 @@ class LezgianTTS:
         Returns:
             bool: True если сохранение прошло успешно, False при ошибке
         """
-        try:
-            speech = self.synthesize(text, **kwargs)
-            if speech is None:
-                return False
+        speech = self.synthesize(text, **kwargs)
+        if speech is None:
+            return False
+        return self.write_audio(speech, output_path, format)
 
+    def write_audio(self, speech: Dict, output_path: str, format: str = 'wav') -> bool:
+        """
+        Сохраняет уже синтезированную речь в файл
+        
+        Args:
+            speech (Dict): Результат synthesize/synthesize_batch
+            output_path (str): Путь для сохранения файла
+            format (str): Формат файла ('wav', 'mp3', 'ogg')
+            
+        Returns:
+            bool: True если сохранение прошло успешно, False при ошибке
+        """
+        try:
             audio_data = speech["audio"]
             sr = speech["sampling_rate"]
             
-            audio_data = self._prepare_audio_data(audio_data)
+            with self._stage("prepare"):
+                audio_data = self._prepare_audio_data(audio_data)
             
-            if format.lower() == 'wav':
-                scipy.io.wavfile.write(output_path, sr, audio_data)
-            else:
-                sf.write(output_path, audio_data, sr, format=format.lower())
+            with self._stage("encode"):
+                if format.lower() == 'wav':
+                    scipy.io.wavfile.write(output_path, sr, audio_data)
+                else:
+                    sf.write(output_path, audio_data, sr, format=format.lower())
             
             self.logger.info(f"Аудио успешно сохранено в {output_path} (формат: {format})")
             return True
@@ -120,10 +294,44 @@ class LezgianTTS:
             self.logger.error(f"Ошибка при сохранении аудио: {str(e)}", exc_info=True)
             return False
 
+    def encode_audio(self, speech: Dict, format: str = 'wav') -> Optional[io.BytesIO]:
+        """
+        Кодирует синтезированную речь в буфер в памяти
+        
+        Буфер можно сохранить на диск и отдать клиенту без повторного кодирования
+        (buffer.getbuffer() даёт memoryview без копирования).
+        
+        Args:
+            speech (Dict): Результат synthesize/synthesize_batch
+            format (str): Формат ('wav', 'flac', 'ogg')
+            
+        Returns:
+            Optional[io.BytesIO]: Буфер с закодированным аудио или None при ошибке
+        """
+        try:
+            with self._stage("prepare"):
+                audio_data = self._prepare_audio_data(speech["audio"])
+            sr = speech["sampling_rate"]
+            
+            with self._stage("encode"):
+                buffer = io.BytesIO()
+                if format.lower() == 'wav':
+                    scipy.io.wavfile.write(buffer, sr, audio_data)
+                else:
+                    sf.write(buffer, audio_data, sr, format=format.lower())
+            return buffer
+            
+        except Exception as e:
+            self.logger.error(f"Ошибка при кодировании аудио: {str(e)}", exc_info=True)
+            return None
+
+    def normalize_text(self, text: str) -> str:
+        """Каноническая форма текста, которая подаётся в модель и используется в ключах кэша"""
+        return self._normalize_text(text)
+
     def _normalize_text(self, text: str) -> str:
-        """Нормализация входного текста"""
-        # TODO: Добавить специфичную для лезгинского языка нормализацию
-        return text.strip()
+        """Нормализация входного текста (палочка, числа, сокращения, пробелы и пунктуация)"""
+        return self.normalizer.normalize(text)
 
     def _validate_audio_output(self, speech: Dict) -> bool:
         """Проверка корректности выходных данных модели"""
@@ -153,6 +361,17 @@ class LezgianTTS:
             
         return audio_data
 
+    def to_pcm16(self, speech: Dict) -> np.ndarray:
+        """PCM int16 (моно) из результата synthesize/synthesize_batch"""
+        return self._prepare_audio_data(speech["audio"])
+
+    def audio_duration(self, speech: Dict) -> float:
+        """Длительность синтезированной речи в секундах"""
+        audio_data = speech["audio"]
+        if isinstance(audio_data, list):
+            audio_data = audio_data[0]
+        return np.squeeze(audio_data).shape[-1] / speech["sampling_rate"]
+
     def get_model_info(self) -> Dict:
         """Получение информации о загруженной модели"""
         if not self.synthesiser:
@@ -161,5 +380,6 @@ class LezgianTTS:
         return {
             "model_id": self.model_id,
             "device": "GPU" if self.use_gpu else "CPU",
+            "backend": self.backend,
             "sampling_rate": self.synthesiser.model.config.sampling_rate if hasattr(self.synthesiser.model, 'config') else "unknown"
         }
\ No newline at end of file
@@ -1,123 +1,329 @@
-from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
-from typing import Dict, Optional, Any
+import logging
+import re
+import time
+from contextlib import contextmanager
+from threading import Event, Lock
+from typing import Callable, Dict, List, Optional, Any, Set, Tuple
 from datetime import datetime
+from pathlib import Path
+from .result_store import TaskResultStore
+from .scheduler import BULK, INTERACTIVE, PriorityScheduler
+
+# uuid4 задачи, у элементов пакетного задания - с номером элемента
+TASK_ID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?:-\d{4,})?")
 
 class TaskManager:
-    def __init__(self, tts, audio_manager, db_manager):
+    def __init__(self, tts, audio_manager, db_manager, cache=None, batcher=None, max_workers: int = 4,
+                 result_store: Optional[TaskResultStore] = None, admission=None, journal=None,
+                 interactive_max_chars: int = 300, starvation_seconds: float = 30.0, sentence_cache=None,
+                 profiler=None, logger: Optional[logging.Logger] = None):
         self.tts = tts
+        self.logger = logger or logging.getLogger(__name__)
         self.audio_manager = audio_manager
         self.db_manager = db_manager
-        self.executor = ThreadPoolExecutor(max_workers=4)
-        self.task_results: Dict[str, Any] = {}
-        self.task_lock = Lock()
+        self.cache = cache
+        self.batcher = batcher
+        # Кэш предложений: текст синтезируется по предложениям, повторяющиеся берутся из кэша
+        self.sentence_cache = sentence_cache
+        self.admission = admission
+        # Профилировщик задач (RequestProfiler); включается для задачи флагом profile или по выборке
+        self.profiler = profiler
+        # Журнал отложенной записи статусов; без него каждый переход пишется в БД сразу
+        self.journal = journal
+        if batcher is not None:
+            # Воркеры блокируются на ожидании пакета, поэтому их должно хватать на полный пакет
+            max_workers = max(max_workers, batcher.max_batch_size)
+        # Короткие тексты идут в полосу interactive, длинные - в bulk
+        self.interactive_max_chars = interactive_max_chars
+        self.scheduler = PriorityScheduler(max_workers=max_workers, max_wait=starvation_seconds)
+        if admission is not None:
+            # Оценка ожидания должна учитывать фактическое число воркеров планировщика
+            admission.workers = self.scheduler.max_workers
+        self.task_results = result_store or TaskResultStore()
+        # Наблюдатели этапов: observer(stage, seconds), как у LezgianTTS
+        self.stage_observers: List[Callable[[str, float], None]] = []
+        # Наблюдатели завершения: observer(task_id, result), вызываются из потока воркера
+        self.completion_observers: List[Callable[[str, Dict[str, Any]], None]] = []
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.audio_seconds_total = 0.0
+        self.tasks_total: Dict[str, int] = {'success': 0, 'error': 0}
+        self._stats_lock = Lock()
+        self._task_events: Dict[str, Event] = {}
+        self._task_users: Dict[str, int] = {}
+        self._admitted: Set[str] = set()
 
-    def submit_task(self, task_id: str, text: str, language: str, user_id: int):
-        conn = self.db_manager.connect()
-        request_db_id = None
+    @contextmanager
+    def _stage(self, name: str):
+        start = time.perf_counter()
         try:
-            result = self.db_manager.execute_query(
-                """
-                INSERT INTO SpeechSynthesisRequest 
-                (user_id, input_text, status, create_dttm, language_code)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id
-                """,
-                (user_id, text, 'queued', datetime.now(), language),
-                conn=conn
-            )
-            conn.commit()
-            if result and len(result) > 0:
-                request_db_id = result[0][0]
+            yield
+        finally:
+            self._observe(name, time.perf_counter() - start)
+
+    def _observe(self, name: str, seconds: float) -> None:
+        for observer in self.stage_observers:
+            observer(name, seconds)
+
+    def _finish(self, task_id: str, result: Dict[str, Any]) -> None:
+        with self._stats_lock:
+            user_id = self._task_users.pop(task_id, None)
+            admitted = task_id in self._admitted
+            self._admitted.discard(task_id)
+        if user_id is not None:
+            result['user_id'] = user_id
+        self.task_results.put(task_id, result)
+        with self._stats_lock:
+            self.tasks_total[result['status']] = self.tasks_total.get(result['status'], 0) + 1
+            event = self._task_events.pop(task_id, None)
+        if event is not None:
+            event.set()
+        for observer in self.completion_observers:
+            observer(task_id, result)
+        if admitted:
+            self.admission.release(user_id)
+
+    def is_known_task(self, task_id: str) -> bool:
+        with self._stats_lock:
+            if task_id in self._task_events:
+                return True
+        return self.task_results.get(task_id) is not None
+
+    def wait_for_task(self, task_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Ждёт завершения задачи не дольше timeout секунд; None - задача ещё выполняется"""
+        result = self.task_results.get(task_id)
+        if result is not None:
+            return result
+        with self._stats_lock:
+            event = self._task_events.get(task_id)
+        if event is not None:
+            event.wait(timeout)
+        return self.task_results.get(task_id)
+
+    def lane_for(self, text: str, priority: Optional[str] = None) -> str:
+        """Полоса задачи: клиент может понизить приоритет до bulk, но не повысить"""
+        if priority == BULK or len(text) > self.interactive_max_chars:
+            return BULK
+        return INTERACTIVE
+
+    def submit_task(self, task_id: str, text: str, language: str, user_id: int,
+                    priority: Optional[str] = None, admit: bool = True, profile: bool = False):
+        """
+        Ставит задачу синтеза в очередь
+
+        admit=False - задача уже допущена вызывающим кодом (например, часть пакетного
+        задания, которое проверяется целиком) и не занимает слот пользователя.
+        profile=True - профилировать задачу (если задан profiler); без флага задача
+        может попасть в профилирование по выборке.
+        """
+        lane = self.lane_for(text, priority)
+        admitted = admit and self.admission is not None
+        if admitted:
+            # Бросает AdmissionError до записи в БД; каждая полоса проверяется по своей очереди
+            self.admission.admit(user_id, text, self.scheduler.qsize(lane), bulk=lane == BULK)
+        with self._stats_lock:
+            self._task_events[task_id] = Event()
+            self._task_users[task_id] = user_id
+            if admitted:
+                self._admitted.add(task_id)
+        try:
+            with self._stage('db_insert'):
+                request_db_id = self._record_queued(user_id, text, language)
         except Exception as db_err:
-            with self.task_lock:
-                self.task_results[task_id] = {'status': 'error', 'error': str(db_err)}
-            conn.close()
+            self._finish(task_id, {'status': 'error', 'error': str(db_err)})
             return
-        self.executor.submit(self.process_synthesis, text, language, task_id, request_db_id, conn)
+        with self._stats_lock:
+            self.queue_depth += 1
+        profile = self.profiler is not None and self.profiler.should_profile(profile)
+        self.scheduler.submit(
+            self.process_synthesis, text, language, task_id, request_db_id, time.monotonic(), profile,
+            cost=len(text), user_id=user_id, lane=lane
+        )
 
     def get_task_status(self, task_id: str) -> Dict:
-        with self.task_lock:
-            return self.task_results.get(task_id, {'status': 'processing'})
+        """
+        Результат задачи или её состояние, если результата нет
 
-    def process_synthesis(self, text: str, language: str, task_id: str, request_db_id: Optional[int], conn):
-        start_time = datetime.now()
-        output_filename = f'{task_id}.wav'
-        output_filepath = self.audio_manager.get_audio_path(output_filename)
+        'processing' - задача в очереди или выполняется; 'expired' - id корректен,
+        но результата уже нет (истёк TTL, вытеснен, выдан) или задачи не было;
+        'unknown' - id не похож на id задачи.
+        """
+        result = self.task_results.get(task_id)
+        if result is not None:
+            return result
+        with self._stats_lock:
+            if task_id in self._task_events:
+                return {'status': 'processing'}
+        # _finish сохраняет результат до удаления события: задача могла завершиться между проверками
+        result = self.task_results.get(task_id)
+        if result is not None:
+            return result
+        return {'status': 'expired' if TASK_ID_RE.fullmatch(task_id) else 'unknown'}
+
+    def get_task_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self.task_results.get(task_id)
+
+    def pop_task_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self.task_results.pop(task_id)
+
+    def _record_queued(self, user_id: int, text: str, language: str) -> Optional[int]:
+        if self.journal is not None:
+            request_db_id = self.journal.allocate_id()
+            self.journal.record_queued(request_db_id, user_id, text, language, datetime.now())
+            return request_db_id
+        result = self.db_manager.execute_query(
+            """
+            INSERT INTO SpeechSynthesisRequest 
+            (user_id, input_text, status, create_dttm, language_code)
+            VALUES (%s, %s, %s, %s, %s) RETURNING id
+            """,
+            (user_id, text, 'queued', datetime.now(), language)
+        )
+        return result[0][0] if result else None
+
+    def _record_started(self, request_db_id: int, start_time: datetime) -> None:
+        if self.journal is not None:
+            self.journal.record_started(request_db_id, start_time)
+            return
+        self.db_manager.execute_query(
+            """
+            UPDATE SpeechSynthesisRequest
+            SET status = %s, processing_start_dttm = %s
+            WHERE id = %s
+            """,
+            ('processing', start_time, request_db_id)
+        )
 
-        if request_db_id is not None:
+    def _record_finished(self, request_db_id: int, status: str,
+                         result: Optional[Tuple[str, float, int]] = None) -> None:
+        """result - (audio_file_path, duration_seconds, characters_processed) успешной задачи"""
+        end_time = datetime.now()
+        if self.journal is not None:
+            self.journal.record_finished(request_db_id, status, end_time, result)
+            return
+        with self.db_manager.connection() as conn:
             self.db_manager.execute_query(
                 """
                 UPDATE SpeechSynthesisRequest
-                SET status = %s, processing_start_dttm = %s
+                SET status = %s, processing_end_dttm = %s
                 WHERE id = %s
                 """,
-                ('processing', start_time, request_db_id),
+                (status, end_time, request_db_id),
                 conn=conn
             )
-            conn.commit()
-        try:
-            success = self.tts.save_to_file(text, str(output_filepath))
-            if not success:
-                if request_db_id is not None:
-                    self.db_manager.execute_query(
-                        """
-                        UPDATE SpeechSynthesisRequest
-                        SET status = %s, processing_end_dttm = %s
-                        WHERE id = %s
-                        """,
-                        ('error', datetime.now(), request_db_id),
-                        conn=conn
-                    )
-                    conn.commit()
-                with self.task_lock:
-                    self.task_results[task_id] = {'status': 'error', 'error': 'Ошибка синтеза речи'}
-                self.audio_manager.delete_audio(output_filename)
-                conn.close()
-                return
-            with open(output_filepath, 'rb') as f:
-                audio_data = f.read()
-            duration = (datetime.now() - start_time).total_seconds()
-            if request_db_id is not None:
-                self.db_manager.execute_query(
-                    """
-                    UPDATE SpeechSynthesisRequest
-                    SET status = %s, processing_end_dttm = %s
-                    WHERE id = %s
-                    """,
-                    ('success', datetime.now(), request_db_id),
-                    conn=conn
-                )
-                relative_filepath = str(output_filepath.relative_to(output_filepath.parent.parent))
+            if result is not None:
                 self.db_manager.execute_query(
                     """
                     INSERT INTO SpeechSynthesisResult 
                     (request_id, audio_file_path, duration_seconds, characters_processed)
                     VALUES (%s, %s, %s, %s)
                     """,
-                    (request_db_id, relative_filepath, duration, len(text)),
+                    (request_db_id,) + tuple(result),
                     conn=conn
                 )
-                conn.commit()
-            with self.task_lock:
-                self.task_results[task_id] = {
+
+    def _render_audio(self, text: str, language: str, output_filepath) -> bool:
+        if self.cache is None:
+            return self._synthesize_to_file(text, output_filepath) is not None
+        key = self.cache.make_key(self.tts.normalize_text(text), language, self.tts.model_id)
+        if self.cache.link_to(key, output_filepath):
+            return True
+        audio_data = self.cache.get_or_synthesize(
+            key,
+            lambda: self._synthesize_to_file(text, output_filepath),
+            source_path=output_filepath
+        )
+        if audio_data is None:
+            return False
+        return (
+            output_filepath.exists()
+            or self.cache.link_to(key, output_filepath)
+            or self.audio_manager.save_audio(audio_data, output_filepath.name)
+        )
+
+    def _synthesize_to_file(self, text: str, output_filepath) -> Optional[memoryview]:
+        # Волна кодируется один раз; тот же буфер сохраняется на диск и попадает в кэш
+        if self.sentence_cache is not None:
+            speech = self.sentence_cache.synthesize(self.tts, text, self.batcher)
+        elif self.batcher is not None:
+            speech = self.batcher.synthesize(text)
+        else:
+            speech = self.tts.synthesize(text)
+        if speech is None:
+            return None
+        with self._stats_lock:
+            self.audio_seconds_total += speech.get("synthesized_seconds", self.tts.audio_duration(speech))
+        buffer = self.tts.encode_audio(speech)
+        if buffer is None:
+            return None
+        audio_data = buffer.getbuffer()
+        with self._stage('file_write'):
+            saved = self.audio_manager.save_audio(audio_data, output_filepath.name)
+        return audio_data if saved else None
+
+    def process_synthesis(self, text: str, language: str, task_id: str, request_db_id: Optional[int],
+                          enqueued_at: Optional[float] = None, profile: bool = False):
+        if profile and self.profiler is not None:
+            with self.profiler.profile(task_id, {'chars': len(text), 'language': language}):
+                self._run_synthesis(text, language, task_id, request_db_id, enqueued_at)
+        else:
+            self._run_synthesis(text, language, task_id, request_db_id, enqueued_at)
+
+    def _run_synthesis(self, text: str, language: str, task_id: str, request_db_id: Optional[int],
+                       enqueued_at: Optional[float]):
+        with self._stats_lock:
+            self.queue_depth -= 1
+            self.in_flight += 1
+        if enqueued_at is not None:
+            self._observe('queue_wait', time.monotonic() - enqueued_at)
+        started = time.monotonic()
+        try:
+            self._process_synthesis(text, language, task_id, request_db_id)
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+            if self.admission is not None:
+                self.admission.record_service_time(time.monotonic() - started)
+
+    def _process_synthesis(self, text: str, language: str, task_id: str, request_db_id: Optional[int]):
+        start_time = datetime.now()
+        output_filename = f'{task_id}.wav'
+        output_filepath = self.audio_manager.storage_path(output_filename)
+
+        # _finish вызывается ровно один раз при любом исходе: он освобождает слот допуска
+        # и будит ожидающих клиентов, поэтому ошибка записи в БД не должна его пропустить
+        result = {'status': 'error', 'error': 'Ошибка синтеза речи'}
+        try:
+            if request_db_id is not None:
+                with self._stage('db_start'):
+                    self._try_record(task_id, self._record_started, request_db_id, start_time)
+            if not self._render_audio(text, language, output_filepath):
+                self.audio_manager.delete_audio(output_filename)
+            else:
+                duration = (datetime.now() - start_time).total_seconds()
+                if request_db_id is not None:
+                    # В БД - логическое имя audio_history/<файл>, каталог шарда вычисляется по нему
+                    relative_filepath = str(Path(self.audio_manager.AUDIO_HISTORY_DIR.name) / output_filename)
+                    with self._stage('db_finalize'):
+                        self._record_finished(request_db_id, 'success', (relative_filepath, duration, len(text)))
+                result = {
                     'status': 'success',
-                    'audio_data': audio_data,
                     'duration': duration,
                     'audio_path': str(output_filepath.name)
                 }
         except Exception as e:
-            if request_db_id is not None:
-                self.db_manager.execute_query(
-                    """
-                    UPDATE SpeechSynthesisRequest
-                    SET status = %s, processing_end_dttm = %s
-                    WHERE id = %s
-                    """,
-                    ('error', datetime.now(), request_db_id),
-                    conn=conn
-                )
-                conn.commit()
-            with self.task_lock:
-                self.task_results[task_id] = {'status': 'error', 'error': str(e)}
+            self.logger.error(f"Ошибка задачи {task_id}: {str(e)}", exc_info=True)
+            result = {'status': 'error', 'error': str(e)}
         finally:
-            conn.close() 
\ No newline at end of file
+            if result['status'] == 'error' and request_db_id is not None:
+                self._try_record(task_id, self._record_finished, request_db_id, 'error')
+            self._finish(task_id, result)
+
+    def _try_record(self, task_id: str, record: Callable, *args) -> bool:
+        """Запись статуса в БД; ошибка только логируется, чтобы задача всё равно завершилась"""
+        try:
+            record(*args)
+            return True
+        except Exception as e:
+            self.logger.error(f"Не удалось записать статус задачи {task_id} в БД: {str(e)}", exc_info=True)
+            return False
@@ -0,0 +1,180 @@
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional
+
+import soundfile as sf
+
+MIMETYPES = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+    "ogg": "audio/ogg",
+    "flac": "audio/flac",
+}
+
+
+class TranscodeCache:
+    """
+    Дисковый кэш перекодированных версий аудиофайлов
+
+    Версия в формате fmt для файла <имя>.wav (.flac) хранится как cache_dir/<имя>.<fmt>
+    и создаётся при первом запросе (или заранее, см. warm). Общий объём
+    ограничен max_bytes, вытесняются давно не запрошенные файлы. Версия,
+    которая старше исходного файла, создаётся заново.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 512 * 1024 * 1024,
+                 logger: Optional[logging.Logger] = None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self._files: "OrderedDict[Path, int]" = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        # Блокировка версии и число потоков, которые её держат или ждут: запись
+        # удаляется последним из них, иначе новый поток создал бы вторую блокировку
+        self._key_locks: Dict[Path, List] = {}
+        self._load_index()
+
+    @staticmethod
+    def mimetype(fmt: str) -> str:
+        return MIMETYPES.get(fmt, "application/octet-stream")
+
+    def _load_index(self) -> None:
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.suffix[1:] in MIMETYPES and path.is_file():
+                stat = path.stat()
+                entries.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._files[path] = size
+            self._size += size
+
+    def get(self, source_path: Path, fmt: str) -> Optional[Path]:
+        """
+        Путь к версии source_path в формате fmt (создаёт её при необходимости)
+
+        Args:
+            source_path (Path): Исходный файл (WAV или FLAC)
+            fmt (str): Один из MIMETYPES
+
+        Returns:
+            Path: Путь к файлу или None, если перекодировать не удалось
+        """
+        if fmt not in MIMETYPES:
+            raise ValueError(f"Неподдерживаемый формат {fmt}, доступны: {', '.join(MIMETYPES)}")
+        source_path = Path(source_path)
+        if source_path.suffix[1:].lower() == fmt:
+            return source_path
+        target = self.cache_dir / f"{source_path.stem}.{fmt}"
+
+        with self._lock:
+            entry = self._key_locks.setdefault(target, [Lock(), 0])
+            entry[1] += 1
+        # Один файл перекодирует только один поток, остальные ждут результат
+        try:
+            with entry[0]:
+                if self._is_fresh(target, source_path):
+                    with self._lock:
+                        self.hits += 1
+                        if target in self._files:
+                            self._files.move_to_end(target)
+                    return target
+                with self._lock:
+                    self.misses += 1
+                try:
+                    self._transcode(source_path, target, fmt)
+                except Exception as e:
+                    self.logger.error(f"Ошибка перекодирования {source_path.name} в {fmt}: {str(e)}")
+                    return None
+                self._add(target)
+                return target
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[target]
+
+    def warm(self, source_path: Path, formats) -> None:
+        """Заранее создаёт версии файла в перечисленных форматах"""
+        for fmt in formats:
+            self.get(source_path, fmt)
+
+    def discard(self, source_path: Path) -> None:
+        """Удаляет все версии файла (например, вместе с исходным файлом)"""
+        stem = Path(source_path).stem
+        for fmt in MIMETYPES:
+            target = self.cache_dir / f"{stem}.{fmt}"
+            with self._lock:
+                size = self._files.pop(target, None)
+                if size is not None:
+                    self._size -= size
+            try:
+                target.unlink()
+            except FileNotFoundError:
+                pass
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    @staticmethod
+    def _is_fresh(target: Path, source_path: Path) -> bool:
+        try:
+            return target.stat().st_mtime >= source_path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+
+    def _transcode(self, source_path: Path, target: Path, fmt: str) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            if fmt == "mp3":
+                # libsndfile из зависимостей не всегда собран с MP3, поэтому ffmpeg через pydub
+                from pydub import AudioSegment
+                AudioSegment.from_file(source_path).export(tmp_path, format="mp3")
+            elif fmt == "ogg":
+                data, sample_rate = sf.read(source_path, dtype="float32")
+                try:
+                    sf.write(tmp_path, data, sample_rate, format="OGG", subtype="OPUS")
+                except (sf.LibsndfileError, ValueError, TypeError):
+                    # Старый libsndfile без Opus или частота, которую Opus не поддерживает
+                    sf.write(tmp_path, data, sample_rate, format="OGG", subtype="VORBIS")
+            else:
+                data, sample_rate = sf.read(source_path, dtype="int16")
+                sf.write(tmp_path, data, sample_rate, format=fmt.upper(), subtype="PCM_16")
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _add(self, target: Path) -> None:
+        size = target.stat().st_size
+        evicted = []
+        with self._lock:
+            old = self._files.pop(target, None)
+            if old is not None:
+                self._size -= old
+            self._files[target] = size
+            self._size += size
+            while len(self._files) > 1 and self._size > self.max_bytes:
+                path, evicted_size = self._files.popitem(last=False)
+                self._size -= evicted_size
+                evicted.append(path)
+        for path in evicted:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
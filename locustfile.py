@@ -1,5 +1,4 @@
 from locust import HttpUser, task, between
-import gevent
 
 class WebsiteUser(HttpUser):
     wait_time = between(1, 5)
@@ -21,7 +20,7 @@ class WebsiteUser(HttpUser):
         task_id = synthesize_response.json()["task_id"]
 
         while True:
-            status_response = self.client.get(f"/api/task/{task_id}")
+            status_response = self.client.get(f"/api/task/{task_id}/wait?timeout=25", name="/api/task/[id]/wait")
 
             if status_response.status_code == 200:
                 content_type = status_response.headers.get('Content-Type')
@@ -38,8 +37,6 @@ class WebsiteUser(HttpUser):
                     print(f"Unexpected content type for task {task_id}: {content_type}")
                     break
 
-            elif status_response.status_code != 404:
+            else:
                     print(f"Polling task {task_id} failed: {status_response.status_code}")
                     break
-
-            gevent.sleep(0.5)
@@ -0,0 +1,95 @@
+import pytest
+
+from lezgian_tts.admission import AdmissionController, AdmissionError
+
+
+def rejection(call, *args, **kwargs):
+    with pytest.raises(AdmissionError) as info:
+        call(*args, **kwargs)
+    return info.value
+
+
+def test_text_checks():
+    admission = AdmissionController(max_text_length=10)
+
+    assert rejection(admission.check_text, "x" * 11).status_code == 413
+    error = rejection(admission.check_text, "сал\x00ам")
+    assert (error.status_code, error.reason) == (400, "invalid_text")
+    admission.check_text("салам")
+
+
+def test_interactive_queue_and_wait_limits():
+    admission = AdmissionController(max_queue_depth=10, max_estimated_wait=5.0, workers=2,
+                                    initial_service_time=1.0)
+
+    error = rejection(admission.check_capacity, 10)
+    assert (error.status_code, error.reason) == (503, "queue_full")
+    assert error.retry_after_header is not None
+    # (9 + 1) * 1 с / 2 воркера = 5 с - на границе лимита
+    admission.check_capacity(9)
+    admission.workers = 1
+    assert rejection(admission.check_capacity, 9).reason == "wait_too_long"
+
+
+def test_bulk_lane_has_its_own_quota():
+    admission = AdmissionController(max_queue_depth=10, max_estimated_wait=1.0, max_bulk_queue=500)
+
+    # Полоса bulk не ограничена ожиданием и интерактивной очередью
+    admission.check_capacity(100, units=400, bulk=True)
+    assert rejection(admission.check_capacity, 200, units=400, bulk=True).status_code == 503
+
+
+def test_job_that_never_fits_is_413():
+    admission = AdmissionController(max_queue_depth=100, max_bulk_queue=500)
+
+    error = rejection(admission.admit_job, 1, ["текст"] * 501, 0)
+    assert (error.status_code, error.reason) == (413, "too_many_units")
+    assert error.retry_after is None
+    # Задание размером с BATCH_MAX_ITEMS по умолчанию допускается на пустой очереди
+    admission.admit_job(1, ["текст"] * 500, 0)
+
+
+def test_jobs_are_charged_to_the_user():
+    admission = AdmissionController(max_user_jobs=1, user_rate=0.001, user_burst=2)
+
+    admission.admit_job(1, ["текст"], 0)
+    assert rejection(admission.admit_job, 1, ["текст"], 0).reason == "user_jobs"
+    admission.admit_job(2, ["текст"], 0)
+
+    admission.release_job(1)
+    admission.admit_job(1, ["текст"], 0)
+    admission.release_job(1)
+    # Оба токена пользователя уже потрачены на задания
+    assert rejection(admission.admit_job, 1, ["текст"], 0).reason == "user_rate"
+
+
+def test_user_in_flight_and_release():
+    admission = AdmissionController(max_user_in_flight=2, user_rate=1000, user_burst=1000)
+
+    admission.admit(1, "салам", 0)
+    admission.admit(1, "салам", 0)
+    error = rejection(admission.admit, 1, "салам", 0)
+    assert (error.status_code, error.reason) == (429, "user_in_flight")
+    admission.admit(2, "салам", 0)
+
+    admission.release(1)
+    admission.admit(1, "салам", 0)
+    assert admission.rejections == {"user_in_flight": 1}
+
+
+def test_token_bucket_limits_rate():
+    admission = AdmissionController(max_user_in_flight=100, user_rate=0.001, user_burst=2)
+
+    admission.admit(1, "салам", 0)
+    admission.admit(1, "салам", 0)
+    error = rejection(admission.admit, 1, "салам", 0)
+    assert error.reason == "user_rate"
+    assert error.retry_after > 0
+
+
+def test_service_time_average():
+    admission = AdmissionController(initial_service_time=2.0, workers=4)
+    admission.record_service_time(4.0, alpha=0.5)
+
+    assert admission.avg_service_time == pytest.approx(3.0)
+    assert admission.estimated_wait(3) == pytest.approx(3.0)
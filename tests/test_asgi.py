@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("a2wsgi")
+pytest.importorskip("asyncpg")
+pytest.importorskip("httpx")
+pytest.importorskip("transformers")
+
+from starlette.testclient import TestClient  # noqa: E402
+
+USER = {'id': 1, 'username': 'user', 'is_superuser': False}
+
+
+@pytest.fixture(scope="module")
+def asgi_app():
+    """asgi без модели и БД: синтез - через (неподнятый) сервер инференса, запросы asyncpg подменяются"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("TTS_INFERENCE_SOCKET", "/nonexistent/tts.sock")
+        patch.setenv("SECRET_KEY", "test-secret")
+        import asgi
+        yield asgi
+
+
+@pytest.fixture
+def client(asgi_app, monkeypatch):
+    async def fetchrow(query, *args):
+        return USER if '"User"' in query else None
+
+    async def fetch(query, *args):
+        return []
+
+    monkeypatch.setattr(asgi_app.async_db, "fetchrow", fetchrow)
+    monkeypatch.setattr(asgi_app.async_db, "fetch", fetch)
+    flask_app = asgi_app.flask_app
+    cookie = flask_app.session_interface.get_signing_serializer(flask_app).dumps({'_user_id': str(USER['id'])})
+    client = TestClient(asgi_app.application)
+    client.cookies.set(flask_app.config['SESSION_COOKIE_NAME'], cookie)
+    return client
+
+
+def test_history(client):
+    response = client.get("/api/history")
+    assert response.status_code == 200
+    assert response.json() == {'history': [], 'next_cursor': None}
+
+
+def test_unsigned_audio_checks_owner(client):
+    # Проверка владельца идёт через БД (после сброса журнала статусов): чужой файл - 403, а не 500
+    response = client.get("/api/audio/0123.wav")
+    assert response.status_code == 403
+
+
+def test_requires_session(asgi_app):
+    client = TestClient(asgi_app.application)
+    assert client.get("/api/history").status_code == 401
+    assert client.get("/api/audio/0123.wav").status_code == 401
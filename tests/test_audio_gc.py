@@ -0,0 +1,115 @@
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+from lezgian_tts.audio_gc import AudioGarbageCollector
+from lezgian_tts.audio_manager import AudioManager
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+
+class FakeDatabase:
+    """Минимальная замена DatabaseManager: строки результатов - словарь логическое имя -> дата запроса"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.deleted = []
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection()
+
+    def execute_query(self, query, params=None, conn=None):
+        if "advisory" in query:
+            return [(True,)]
+        if "DELETE" in query:
+            self.deleted.extend(params[0])
+            for name in params[0]:
+                self.rows.pop(name, None)
+            return None
+        return [(name, self.rows[name]) for name in params[0] if name in self.rows]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    audio_manager = AudioManager(tmp_path / "audio_history")
+    cache_dir = audio_manager.AUDIO_HISTORY_DIR / "cache"
+    cache_dir.mkdir()
+    return audio_manager, cache_dir
+
+
+def write(path, size):
+    path.write_bytes(b"\0" * size)
+    return path
+
+
+def age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_expired_file_is_unlinked_from_cache(storage):
+    audio_manager, cache_dir = storage
+    history = write(audio_manager.storage_path("old.wav"), 1000)
+    cached = cache_dir / "key.wav"
+    os.link(history, cached)
+    db = FakeDatabase({"audio_history/old.wav": datetime.now() - timedelta(days=10)})
+
+    gc = AudioGarbageCollector(audio_manager, db, retention_days=1, cache_dir=cache_dir)
+    stats = gc.run_once()
+
+    assert stats["expired"] == 1
+    assert db.deleted == ["audio_history/old.wav"]
+    assert not history.exists()
+    assert not cached.exists()
+
+
+def test_hard_links_are_counted_once(storage):
+    audio_manager, cache_dir = storage
+    history = write(audio_manager.storage_path("fresh.wav"), 1000)
+    os.link(history, cache_dir / "key.wav")
+    db = FakeDatabase({"audio_history/fresh.wav": datetime.now()})
+
+    gc = AudioGarbageCollector(audio_manager, db, max_bytes=1500, cache_dir=cache_dir)
+    stats = gc.run_once()
+
+    assert stats["bytes"] == 1000
+    assert stats["over_budget"] == 0
+    assert history.exists()
+
+
+def test_cache_only_entries_are_evicted_before_history(storage):
+    audio_manager, cache_dir = storage
+    history = write(audio_manager.storage_path("fresh.wav"), 1000)
+    older = write(cache_dir / "older.wav", 600)
+    newer = write(cache_dir / "newer.wav", 600)
+    age(older, 100)
+    db = FakeDatabase({"audio_history/fresh.wav": datetime.now()})
+
+    gc = AudioGarbageCollector(audio_manager, db, max_bytes=2000, cache_dir=cache_dir)
+    stats = gc.run_once()
+
+    assert stats["cache_evicted"] == 1
+    assert stats["bytes"] == 1600
+    assert not older.exists()
+    assert newer.exists()
+    assert history.exists()
+
+
+def test_cache_tier_budget(storage):
+    audio_manager, cache_dir = storage
+    entries = [write(cache_dir / f"{i}.wav", 100) for i in range(5)]
+    for i, path in enumerate(entries):
+        age(path, 100 - i)
+
+    gc = AudioGarbageCollector(audio_manager, FakeDatabase({}), cache_dir=cache_dir, cache_max_bytes=250)
+    stats = gc.run_once()
+
+    assert stats["cache_evicted"] == 3
+    assert [path.exists() for path in entries] == [False, False, False, True, True]
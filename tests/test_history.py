@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from lezgian_tts.history import (
+    MAX_PAGE_SIZE, build_history_query, encode_cursor, format_history, page_params, parse_cursor
+)
+
+BASE = datetime(2024, 5, 1, 12, 0)
+
+
+def make_rows(count):
+    # Пары записей с одинаковым create_dttm: порядок внутри пары задаёт id
+    return [
+        (request_id, BASE + timedelta(minutes=request_id // 2), f"текст {request_id}", 8, "lez", "success",
+         f"audio_history/{request_id}.wav", 1.5)
+        for request_id in range(1, count + 1)
+    ]
+
+
+def fetch_page(rows, before, limit):
+    """То же, что запрос build_history_query: ORDER BY (create_dttm, id) DESC, строго до курсора, limit + 1"""
+    ordered = sorted(rows, key=lambda row: (row[1], row[0]), reverse=True)
+    if before is not None:
+        ordered = [row for row in ordered if (row[1], row[0]) < before]
+    return ordered[:limit + 1]
+
+
+def test_cursor_round_trip():
+    assert parse_cursor(encode_cursor(BASE, 42)) == (BASE, 42)
+    assert parse_cursor(None) is None
+    with pytest.raises(ValueError):
+        parse_cursor("вчера,1")
+
+
+def test_query_params():
+    query, params = build_history_query(7, (BASE, 5), 20, 100)
+    assert params == [100, 7, BASE, 5, 21]
+    assert query.count("%s") == 5
+
+    query, params = build_history_query(7, None, 20, None, placeholder="$")
+    assert params == [7, 21]
+    assert "$1" in query and "$2" in query and "%s" not in query
+
+
+def test_page_params():
+    assert page_params({}) == (None, 50, None)
+    assert page_params({"limit": "100000", "preview": "0"})[1] == MAX_PAGE_SIZE
+    before, limit, preview = page_params({"before": encode_cursor(BASE, 3), "limit": "0", "preview": "80"})
+    assert (before, limit, preview) == ((BASE, 3), 1, 80)
+    with pytest.raises(ValueError):
+        page_params({"limit": "много"})
+
+
+def test_pages_cover_history_once():
+    rows = make_rows(11)
+    seen = []
+    before = None
+    while True:
+        history, next_cursor = format_history(fetch_page(rows, before, 4), 4, lambda name: f"/audio/{name}")
+        seen.extend(item["id"] for item in history)
+        if next_cursor is None:
+            break
+        before = parse_cursor(next_cursor)
+    # Записи с одинаковым временем не теряются и не повторяются на границе страниц
+    assert seen == list(range(11, 0, -1))
+
+
+def test_format_history_items():
+    rows = [(3, BASE, "сал", 5, "lez", "success", "audio_history/ab.wav", 1.5),
+            (2, BASE, "салам", 5, "lez", "error", None, None)]
+    history, next_cursor = format_history(rows, 2, lambda name: f"/audio/{name}")
+    assert next_cursor is None
+    assert history[0]["truncated"] and history[0]["audio_path"] == "/audio/ab.wav"
+    assert not history[1]["truncated"] and history[1]["audio_path"] is None
+    assert history[0]["date"] == "01.05.2024 12:00"
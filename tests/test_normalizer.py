@@ -0,0 +1,87 @@
+import pytest
+
+from lezgian_tts.normalizer import LezgianNormalizer, number_to_words
+
+
+@pytest.fixture(scope="module")
+def normalizer():
+    return LezgianNormalizer()
+
+
+@pytest.mark.parametrize("number, words", [
+    (0, "нул"),
+    (7, "ирид"),
+    (15, "цуьвад"),
+    (21, "къанни сад"),
+    (45, "яхцӀурни вад"),
+    (80, "кьудкъад"),
+    (100, "виш"),
+    (200, "кьве виш"),
+    (1990, "агъзурни кӀуьд вишни кьудкъанни цуд"),
+    (2024, "кьве агъзурни къанни кьуд"),
+    (1000000, "са миллион"),
+])
+def test_number_to_words(number, words):
+    assert number_to_words(number) == words
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("кI", "кӀ"),
+    ("т1ал", "тӀал"),
+    ("к|ел", "кӀел"),
+    ("к12", "к цуькьвед"),
+    ("тI1", "тӀ сад"),
+    ("5км", "вад километр"),
+    ("км5", "километр вад"),
+    ("50%", "яхцӀурни цуд процент"),
+    ("№5", "номер вад"),
+    ("1990 й.", "агъзурни кӀуьд вишни кьудкъанни цуд йис"),
+    ("3.5", "пуд запятая вад"),
+    ("1,5", "сад запятая вад"),
+    ("3,05", "пуд запятая нул вад"),
+    ("12:30", "цуькьвед къанни цуд"),
+    ("9:05", "кӀуьд нул вад"),
+    ("-5", "минус вад"),
+    ("+5", "плюс вад"),
+    ("(-3,25)", "(минус пуд запятая къанни вад)"),
+    ("5-10", "вад-цуд"),
+    ("12.05.2024", "цуькьвед май кьве агъзурни къанни кьуд"),
+    ("1.2.2024.", "сад февраль кьве агъзурни къанни кьуд."),
+    ("01/02/24", "сад февраль къанни кьуд"),
+    ("1.2.3.4", "сад кьвед пуд кьуд"),
+    ("100 000", "виш агъзур"),
+    ("1\u00a0000\u00a0000 кас", "са миллион кас"),
+    ("-2 500,5", "минус кьве агъзурни вад виш запятая вад"),
+    ("1,2,3", "сад кьвед пуд"),
+    ("Цена 3.5.", "Цена пуд запятая вад."),
+    ("салам  , дуст !!", "салам, дуст!"),
+    ("ваъ . . .", "ваъ."),
+    ("гьа....", "гьа…"),
+    ("«салам» дуст", '"салам" дуст'),
+])
+def test_normalize(normalizer, text, expected):
+    assert normalizer.normalize(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "тI1",
+    "3.5 ва 1,5",
+    "12:30-даз",
+    "-5 градус",
+    "й . 2024",
+    "км%",
+    "т.ж. 5км|",
+    "… ...",
+    "процент|",
+    "100 000 ва 1 000 000",
+    "1 000,5%",
+    "12.05.2024 й.",
+])
+def test_normalize_is_idempotent(normalizer, text):
+    once = normalizer.normalize(text)
+    assert normalizer.normalize(once) == once
+
+
+def test_custom_abbreviations():
+    normalizer = LezgianNormalizer(abbreviations={"мя.": "мисал яз"})
+    assert normalizer.normalize("мя. 5") == "мисал яз вад"
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from lezgian_tts.scheduler import BULK, INTERACTIVE, PriorityScheduler
+
+
+@pytest.fixture
+def blocked_scheduler():
+    """Планировщик с одним воркером, занятым до gate.set(): задачи копятся в очереди"""
+    schedulers = []
+    gate = threading.Event()
+
+    def make(**kwargs):
+        scheduler = PriorityScheduler(max_workers=1, **kwargs)
+        started = threading.Event()
+        scheduler.submit(lambda: (started.set(), gate.wait()))
+        started.wait(5)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make, gate
+    gate.set()
+    for scheduler in schedulers:
+        scheduler.shutdown()
+
+
+def run_order(scheduler, gate, jobs):
+    """Ставит jobs (name, cost, user_id, lane) в очередь, отпускает воркер и возвращает порядок выполнения"""
+    order = []
+    futures = [
+        scheduler.submit(order.append, name, cost=cost, user_id=user_id, lane=lane)
+        for name, cost, user_id, lane in jobs
+    ]
+    gate.set()
+    for future in futures:
+        future.result(5)
+    return order
+
+
+def test_interactive_lane_first(blocked_scheduler):
+    make, gate = blocked_scheduler
+    scheduler = make()
+    order = run_order(scheduler, gate, [
+        ("bulk", 1, 1, BULK),
+        ("interactive", 100, 1, INTERACTIVE),
+    ])
+    assert order == ["interactive", "bulk"]
+
+
+def test_shortest_first_and_fair_between_users(blocked_scheduler):
+    make, gate = blocked_scheduler
+    scheduler = make()
+    order = run_order(scheduler, gate, [
+        ("a-long", 50, "a", INTERACTIVE),
+        ("a-short-1", 10, "a", INTERACTIVE),
+        ("a-short-2", 10, "a", INTERACTIVE),
+        ("a-short-3", 10, "a", INTERACTIVE),
+        ("b", 10, "b", INTERACTIVE),
+    ])
+    # Короткие задачи раньше длинной, а поток задач пользователя a не оттесняет b в конец
+    assert order.index("a-long") == 4
+    assert order.index("b") <= 1
+
+
+def test_starving_job_is_promoted(blocked_scheduler):
+    make, gate = blocked_scheduler
+    scheduler = make(max_wait=0.05)
+    order = []
+    bulk = scheduler.submit(order.append, "bulk", cost=1, lane=BULK)
+    time.sleep(0.1)
+    interactive = scheduler.submit(order.append, "interactive", cost=1, lane=INTERACTIVE)
+    gate.set()
+    bulk.result(5)
+    interactive.result(5)
+    assert order == ["bulk", "interactive"]
+    assert scheduler.promoted == 1
+
+
+def test_qsize_per_lane(blocked_scheduler):
+    make, gate = blocked_scheduler
+    scheduler = make()
+    scheduler.submit(lambda: None, lane=BULK)
+    scheduler.submit(lambda: None, lane=BULK)
+    scheduler.submit(lambda: None, lane=INTERACTIVE)
+    assert (scheduler.qsize(INTERACTIVE), scheduler.qsize(BULK), scheduler.qsize()) == (1, 2, 3)
+
+
+def test_errors_and_shutdown():
+    scheduler = PriorityScheduler(max_workers=1)
+    with pytest.raises(ValueError):
+        scheduler.submit(lambda: None, lane="unknown")
+
+    def fail():
+        raise RuntimeError("сбой")
+
+    with pytest.raises(RuntimeError):
+        scheduler.submit(fail).result(5)
+    assert scheduler.submit(lambda: 42).result(5) == 42
+
+    scheduler.shutdown()
+    with pytest.raises(RuntimeError):
+        scheduler.submit(lambda: None).result(5)
@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("transformers")
+
+from lezgian_tts.normalizer import LezgianNormalizer  # noqa: E402
+from lezgian_tts.synthesizer import LezgianTTS  # noqa: E402
+
+
+@pytest.fixture
+def tts():
+    # Разбиение не обращается к модели, поэтому она не загружается
+    tts = LezgianTTS.__new__(LezgianTTS)
+    tts.normalizer = LezgianNormalizer()
+    return tts
+
+
+def words(text):
+    return text.replace(",", " ").replace(".", " ").split()
+
+
+@pytest.mark.parametrize("text", [
+    "Салам, " + " ".join(f"гаф{i}" for i in range(60)) + ".",
+    "Сад, кьвед, " + " ".join(f"гаф{i}" for i in range(60)) + ", пуд. Кьуд.",
+    " ".join(f"гаф{i}" for i in range(60)) + ", салам, " + " ".join(f"чӀал{i}" for i in range(60)) + ".",
+])
+def test_segments_keep_order(tts, text):
+    segments = tts.split_sentences(text, max_chars=80)
+    assert all(len(segment) <= 80 for segment in segments)
+    assert words(" ".join(segments)) == words(tts.normalize_text(text))
+
+
+def test_short_sentences_untouched(tts):
+    assert tts.split_sentences("Салам! Чи чӀал.", max_chars=80) == ["Салам!", "Чи чӀал."]
@@ -0,0 +1,76 @@
+import pytest
+
+from lezgian_tts.status_journal import StatusJournal
+
+
+class FailingJournal(StatusJournal):
+    """Журнал, который вместо БД копит записанные пачки и отвергает заданные задачи"""
+
+    def __init__(self, bad_ids=(), error=ValueError, **kwargs):
+        self.bad_ids = set(bad_ids)
+        self.error = error
+        self.written = {}
+        super().__init__(db_manager=None, flush_interval=3600, **kwargs)
+
+    def _write(self, batch):
+        if self.bad_ids & set(batch):
+            raise self.error("строка отвергнута")
+        self.written.update(batch)
+
+
+@pytest.fixture
+def make_journal():
+    journals = []
+
+    def make(**kwargs):
+        journal = FailingJournal(**kwargs)
+        journals.append(journal)
+        return journal
+
+    yield make
+    for journal in journals:
+        journal.bad_ids.clear()
+        journal.close()
+
+
+def test_transitions_are_merged(make_journal):
+    journal = make_journal()
+    journal.record_queued(1, 7, "салам", "lez", None)
+    journal.record_started(1, None)
+    journal.record_finished(1, "success", None, ("audio_history/a.wav", 1.5, 5))
+
+    assert journal.flush() == 1
+    assert journal.written[1]["status"] == "success"
+    assert journal.written[1]["insert"] == (7, "салам", None, "lez")
+    assert journal.pending() == 0
+
+
+def test_failing_row_is_dropped_and_others_written(make_journal):
+    journal = make_journal(bad_ids={3})
+    for request_id in range(1, 9):
+        journal.record_queued(request_id, 7, f"текст {request_id}", "lez", None)
+
+    assert journal.flush() == 7
+    assert sorted(journal.written) == [1, 2, 4, 5, 6, 7, 8]
+    assert journal.dropped_rows == 1
+    assert journal.dead_letters[0]["request_id"] == 3
+    assert journal.pending() == 0
+
+    # Следующие сбросы не упираются в отброшенную строку
+    journal.record_started(5, None)
+    assert journal.flush() == 1
+
+
+def test_connection_error_keeps_batch(make_journal):
+    journal = make_journal(bad_ids={1}, error=ConnectionError)
+    journal.record_queued(1, 7, "салам", "lez", None)
+    journal.record_queued(2, 7, "сагърай", "lez", None)
+
+    with pytest.raises(ConnectionError):
+        journal.flush()
+    assert journal.pending() == 2
+    assert journal.flush_errors == 1
+    assert journal.dropped_rows == 0
+
+    journal.bad_ids.clear()
+    assert journal.flush() == 2
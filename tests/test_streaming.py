@@ -0,0 +1,22 @@
+import struct
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from lezgian_tts.streaming import MAX_WAV_DATA_SIZE, STREAMING_DATA_SIZE, wav_header  # noqa: E402
+
+
+def test_header_sizes():
+    header = wav_header(16000, 3200)
+    assert len(header) == 44
+    assert struct.unpack("<I", header[4:8])[0] == 36 + 3200
+    assert struct.unpack("<I", header[40:44])[0] == 3200
+    assert struct.unpack("<I", wav_header(16000)[40:44])[0] == STREAMING_DATA_SIZE
+
+
+def test_header_rejects_oversized_data():
+    assert struct.unpack("<I", wav_header(16000, MAX_WAV_DATA_SIZE)[4:8])[0] == 0xFFFFFFFF
+    # Больше 4 ГиБ поле размера не вмещает: ошибка до отправки ответа, а не struct.error в конце
+    with pytest.raises(ValueError):
+        wav_header(16000, MAX_WAV_DATA_SIZE + 1)
@@ -0,0 +1,49 @@
+import uuid
+from pathlib import Path
+
+from lezgian_tts.admission import AdmissionController
+from lezgian_tts.task_manager import TaskManager
+
+
+class BrokenDatabase:
+    """БД, в которой падает любая запись, кроме постановки в очередь"""
+
+    def execute_query(self, query, params=None):
+        if query.lstrip().startswith("INSERT INTO SpeechSynthesisRequest"):
+            return [(1,)]
+        raise RuntimeError("пул соединений исчерпан")
+
+
+class FakeAudioManager:
+    AUDIO_HISTORY_DIR = Path("audio_history")
+
+    def __init__(self, root):
+        self.root = root
+
+    def storage_path(self, filename):
+        return self.root / filename
+
+    def delete_audio(self, filename):
+        (self.root / filename).unlink(missing_ok=True)
+
+
+class FailingTTS:
+    model_id = "model"
+
+    def synthesize(self, text):
+        return None
+
+
+def test_db_errors_still_finish_task(tmp_path):
+    admission = AdmissionController(max_user_in_flight=1)
+    task_manager = TaskManager(FailingTTS(), FakeAudioManager(tmp_path), BrokenDatabase(),
+                               admission=admission, max_workers=1)
+    try:
+        for _ in range(3):
+            # Слот пользователя освобождается, иначе вторая задача получила бы отказ
+            task_id = str(uuid.uuid4())
+            task_manager.submit_task(task_id, "салам", "lez", user_id=7)
+            result = task_manager.wait_for_task(task_id, 5)
+            assert result is not None and result['status'] == 'error'
+    finally:
+        task_manager.scheduler.shutdown()